@@ -0,0 +1,146 @@
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from app.core.config import settings
+from app.core.state_backend import StateBackend, state_backend
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache in front of `generate`, keyed by the reformulated query's
+    embedding: a new question reuses a stored answer when the cosine
+    similarity between both queries is >= `threshold`, retrieval returned
+    exactly the same chunk IDs AND the prompt's chat history (summary
+    included) has the same fingerprint. Otherwise an answer written for one
+    conversation would be replayed in another. If the chunks differ (new
+    material was ingested), the entry is stale and dropped.
+
+    Embeddings live in one normalized float32 matrix, so a lookup is a single
+    matrix-vector product. The on/off switch is kept in the shared state
+    backend, so the admin toggle applies to every worker.
+    """
+
+    SWITCH_NAMESPACE = "settings"
+    SWITCH_KEY = "answer_cache_enabled"
+
+    def __init__(
+        self,
+        threshold: float = settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        max_entries: int = settings.ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: Optional[float] = settings.ANSWER_CACHE_TTL_SECONDS,
+        backend: StateBackend = state_backend,
+    ):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._answers: List[str] = []
+        self._context_ids: List[frozenset] = []
+        self._history_keys: List[str] = []
+        self._created_at: List[float] = []
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.backend.get(self.SWITCH_NAMESPACE, self.SWITCH_KEY, default=settings.ANSWER_CACHE_ENABLED))
+
+    def set_enabled(self, enabled: bool):
+        self.backend.set(self.SWITCH_NAMESPACE, self.SWITCH_KEY, enabled)
+        if not enabled:
+            self.clear()
+
+    @staticmethod
+    def history_key(history: str) -> str:
+        """Fingerprint of the formatted chat history sent in the prompt."""
+        return hashlib.sha256(history.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, index: int):
+        self._vectors = np.delete(self._vectors, index, axis=0)
+        del self._answers[index]
+        del self._context_ids[index]
+        del self._history_keys[index]
+        del self._created_at[index]
+
+    def lookup(self, embedding: Sequence[float], context_ids: Sequence[str], history_key: str) -> Optional[str]:
+        vector = self._normalize(embedding)
+        with self._lock:
+            if not self._answers or self._vectors.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None
+            similarities = self._vectors @ vector
+            # Only answers generated with the same chat history can be reused
+            same_history = np.array([key == history_key for key in self._history_keys])
+            similarities = np.where(same_history, similarities, -np.inf)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            expired = self.ttl_seconds and time.time() - self._created_at[best] > self.ttl_seconds
+            if expired or self._context_ids[best] != frozenset(context_ids):
+                # Retrieval changed since this answer was generated
+                self._remove(best)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._answers[best]
+
+    def store(self, embedding: Sequence[float], context_ids: Sequence[str], history_key: str, answer: str):
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self._answers and self._vectors.shape[1] != vector.shape[0]:
+                # Embedding model changed: old vectors are not comparable
+                self._clear_locked()
+            if len(self._answers) >= self.max_entries:
+                # Oldest entry goes first
+                self._remove(0)
+            if self._answers:
+                self._vectors = np.vstack([self._vectors, vector])
+            else:
+                self._vectors = vector.reshape(1, -1)
+            self._answers.append(answer)
+            self._context_ids.append(frozenset(context_ids))
+            self._history_keys.append(history_key)
+            self._created_at.append(time.time())
+
+    def _clear_locked(self):
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._answers.clear()
+        self._context_ids.clear()
+        self._history_keys.clear()
+        self._created_at.clear()
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            entries = len(self._answers)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+answer_cache = SemanticAnswerCache()
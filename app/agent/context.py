@@ -0,0 +1,124 @@
+"""
+Context assembly: turns retrieved hits into the {context} block of the
+generation prompt.
+
+- Chunks from the same source (and page) that overlap (the splitter uses
+  chunk_overlap=200) or contain each other are merged, so shared text is
+  sent once.
+- Merged segments are ranked by their best score and added until
+  CONTEXT_MAX_TOKENS is reached; the segment that crosses the budget is
+  truncated if enough room is left, otherwise dropped.
+- Segments are then grouped back by source, best source first.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.mcp_server.token_batching import load_encoding
+
+# Shorter suffix/prefix matches are likely coincidence, not splitter overlap
+MIN_OVERLAP_CHARS = 20
+# Don't bother adding a truncated segment smaller than this
+MIN_TRUNCATED_TOKENS = 64
+BLOCK_SEPARATOR = "\n\n---\n\n"
+
+# DeepSeek has no tiktoken encoding; cl100k_base is a close enough estimate for budgeting
+_encoding = load_encoding("gpt-4")
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is None:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if _encoding is None:
+        return text[: max_tokens * 4]
+    return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merge_pair(a: str, b: str) -> Optional[str]:
+    if b in a:
+        return a
+    if a in b:
+        return b
+    size = _overlap(a, b)
+    if size:
+        return a + b[size:]
+    size = _overlap(b, a)
+    if size:
+        return b + a[size:]
+    return None
+
+
+def _merge_group(segments: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+    """Merges overlapping texts of one source until no pair overlaps."""
+    segments = list(segments)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(segments)):
+            for j in range(i + 1, len(segments)):
+                text = _merge_pair(segments[i][0], segments[j][0])
+                if text is not None:
+                    segments[i] = (text, max(segments[i][1], segments[j][1]))
+                    del segments[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return segments
+
+
+def assemble_context(hits: List[Dict[str, Any]], max_tokens: int = settings.CONTEXT_MAX_TOKENS) -> Tuple[str, Dict[str, int]]:
+    """
+    hits: dicts with 'content', 'score' and 'payload' (as returned by
+    KnowledgeBaseStorage.asearch_hits). Returns (context_text, stats).
+    """
+    groups: Dict[Tuple[Any, Any], List[Tuple[str, float]]] = {}
+    for hit in hits:
+        payload = hit.get("payload") or {}
+        key = (payload.get("source"), payload.get("page"))
+        groups.setdefault(key, []).append((hit["content"], hit.get("score") or 0.0))
+
+    segments = [
+        (key, text, score)
+        for key, group in groups.items()
+        for text, score in _merge_group(group)
+    ]
+    segments.sort(key=lambda segment: segment[2], reverse=True)
+
+    # Greedy fill by score within the token budget
+    chosen = []
+    used = 0
+    for key, text, score in segments:
+        tokens = count_tokens(text)
+        remaining = max_tokens - used
+        if tokens > remaining:
+            if remaining < MIN_TRUNCATED_TOKENS:
+                break
+            text = truncate_tokens(text, remaining)
+            tokens = remaining
+        chosen.append((key, text))
+        used += tokens
+
+    # One block per source, in order of its best segment
+    blocks: Dict[Tuple[Any, Any], List[str]] = {}
+    for key, text in chosen:
+        blocks.setdefault(key, []).append(text)
+    context = BLOCK_SEPARATOR.join("\n\n".join(texts) for texts in blocks.values())
+
+    stats = {
+        "chunks": len(hits),
+        "segments": len(segments),
+        "used_segments": len(chosen),
+        "context_tokens": used,
+    }
+    return context, stats
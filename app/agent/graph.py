@@ -1,7 +1,60 @@
+import re
+import time
+import inspect
 from langgraph.graph import StateGraph, END
 from app.agent.state import AgentState
-from app.agent.nodes import query_reformulation, retrieve, grade_documents, generate, fallback_nodes, system_status_response
-from app.agent.ingestion_nodes import ingest_pdf, ingest_url, ingest_image, ingest_text_note
+from app.agent.nodes import aquery_reformulation, direct_query, aretrieve, grade_documents, assemble_prompt_context, agenerate, fallback_nodes, system_status_response
+from app.core.metrics import metrics
+from app.agent.ingestion_nodes import ingest_pdf, ingest_url, ingest_crawl, ingest_image, ingest_text_note
+
+# A question only needs the LLM rewrite when something in it must be resolved
+# against the history. Common words like "that" or "también" are not enough:
+# "Explain the theory that describes gravity" is self-contained.
+
+# Follow-up openers: "¿Y la segunda?", "What about Ampère?", "But why?"
+FOLLOW_UP_START = re.compile(
+    r"^\W*(?:y|e|and|but|pero|what about|how about|qu[eé] hay de|and what|and how|and why)\b",
+    re.IGNORECASE
+)
+# A pronoun standing for something said before (not a determiner or relative pronoun):
+# followed by punctuation/end or a verb, e.g. "Why is that?", "How does it work?", "¿Eso es cierto?"
+STANDALONE_PRONOUN = re.compile(
+    r"\b(?:it|that|this|these|those|them|eso|esto|esos|estos|esas|estas|aquello|ello)\b"
+    r"(?=\s*(?:[?!.,;:)]|$|(?:is|was|are|were|mean|means|work|works|apply|applies|happen|happens|"
+    r"es|era|fue|son|significa|implica|quiere|sirve|funciona|pasa|ocurre)\b))",
+    re.IGNORECASE
+)
+# Explicit references to the conversation and Spanish object clitics ("explícalo")
+CONVERSATION_REFERENCE = re.compile(
+    r"\b(?:you said|you mentioned|you explained|the previous one|the last one|the above|"
+    r"dijiste|mencionaste|explicaste|comentaste|lo anterior|lo mismo|el otro|la otra|"
+    r"(?:expl[ií]ca|res[uú]me|desarr[oó]lla|demu[eé]stra|det[aá]lla|rep[ií]te|ampl[ií]a|acl[aá]ra)(?:lo|la|los|las))\b",
+    re.IGNORECASE
+)
+# Questions made only of these words name no topic of their own ("¿Por qué?", "Give me an example")
+TOPICLESS_WORDS = {
+    "why", "how", "what", "when", "where", "which", "so", "then", "really", "and", "but", "more", "please",
+    "give", "me", "an", "a", "another", "one", "example", "examples", "detail", "details", "explain", "tell",
+    "continue", "go", "on", "ok", "yes", "no",
+    "por", "qué", "que", "cómo", "como", "cuándo", "cuando", "dónde", "donde", "cuál", "cual", "y", "pero",
+    "entonces", "en", "serio", "más", "mas", "dame", "un", "una", "otro", "otra", "ejemplo", "ejemplos",
+    "detalle", "detalles", "explica", "explícame", "explicame", "dime", "favor", "sigue", "continúa",
+    "continua", "vale", "sí", "si",
+}
+
+def needs_reformulation(state: AgentState) -> bool:
+    """
+    Cheap local check: is there anything in the question that the chat
+    history has to resolve? Without history (first message, voice) or for a
+    self-contained question the LLM rewrite is skipped.
+    """
+    if not state.get("messages"):
+        return False
+    question = state.get("question", "")
+    if FOLLOW_UP_START.search(question) or STANDALONE_PRONOUN.search(question) or CONVERSATION_REFERENCE.search(question):
+        return True
+    words = re.findall(r"\w+", question.lower())
+    return all(word in TOPICLESS_WORDS for word in words)
 
 def route_start(state: AgentState):
     """
@@ -20,37 +73,60 @@ def route_start(state: AgentState):
         return "ingest_pdf"
     elif media_type == "url":
         return "ingest_url"
+    elif media_type == "crawl":
+        return "ingest_crawl"
     elif media_type == "image":
         return "ingest_image"
     elif media_type == "text_note":
         return "ingest_text_note"
         
-    # 3. Default RAG
-    else:
+    # 3. Default RAG: only pay the reformulation round trip when history matters
+    elif needs_reformulation(state):
         return "query_reformulation"
+    else:
+        return "direct_query"
 
 def route_grading(state: AgentState):
     """
     Router after grading documents.
     """
     if state["is_relevant"]:
-        return "generate"
+        return "assemble_context"
     else:
         return "fallback"
 
+def _timed_node(name: str, node):
+    """Records each node's latency as node.<name> for the per-step breakdown."""
+    async def run(state: AgentState):
+        start = time.perf_counter()
+        try:
+            result = node(state)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        finally:
+            metrics.observe(f"node.{name}", time.perf_counter() - start)
+    return run
+
 workflow = StateGraph(AgentState)
 
 # RAG Nodes
-workflow.add_node("query_reformulation", query_reformulation)
-workflow.add_node("retrieve", retrieve)
+# LLM/DB nodes are async: the graph runs inside the webhook event loop, and
+# LangGraph executes sync nodes inline there, so any blocking LLM/DB call would
+# stall every other chat served by this worker.
+workflow.add_node("query_reformulation", _timed_node("query_reformulation", aquery_reformulation))
+workflow.add_node("direct_query", _timed_node("direct_query", direct_query))
+workflow.add_node("retrieve", _timed_node("retrieve", aretrieve))
 workflow.add_node("grade_documents", grade_documents)
-workflow.add_node("generate", generate)
+workflow.add_node("assemble_context", _timed_node("assemble_context", assemble_prompt_context))
+workflow.add_node("generate", _timed_node("generate", agenerate))
 workflow.add_node("fallback", fallback_nodes)
 workflow.add_node("system_status_response", system_status_response)
 
 # Ingestion Nodes
 workflow.add_node("ingest_pdf", ingest_pdf)
 workflow.add_node("ingest_url", ingest_url)
+workflow.add_node("ingest_crawl", ingest_crawl)
 workflow.add_node("ingest_image", ingest_image)
 workflow.add_node("ingest_text_note", ingest_text_note)
 
@@ -59,8 +135,10 @@ workflow.set_conditional_entry_point(
     route_start,
     {
         "query_reformulation": "query_reformulation",
+        "direct_query": "direct_query",
         "ingest_pdf": "ingest_pdf",
         "ingest_url": "ingest_url",
+        "ingest_crawl": "ingest_crawl",
         "ingest_image": "ingest_image",
         "ingest_text_note": "ingest_text_note",
         "system_status_response": "system_status_response"
@@ -69,15 +147,17 @@ workflow.set_conditional_entry_point(
 
 # RAG Flow Edges
 workflow.add_edge("query_reformulation", "retrieve")
+workflow.add_edge("direct_query", "retrieve")
 workflow.add_edge("retrieve", "grade_documents")
 workflow.add_conditional_edges(
     "grade_documents",
     route_grading,
     {
-        "generate": "generate",
+        "assemble_context": "assemble_context",
         "fallback": "fallback"
     }
 )
+workflow.add_edge("assemble_context", "generate")
 workflow.add_edge("generate", END)
 workflow.add_edge("fallback", END)
 workflow.add_edge("system_status_response", END)
@@ -85,6 +165,7 @@ workflow.add_edge("system_status_response", END)
 # Ingestion Flow Edges
 workflow.add_edge("ingest_pdf", END)
 workflow.add_edge("ingest_url", END)
+workflow.add_edge("ingest_crawl", END)
 workflow.add_edge("ingest_image", END)
 workflow.add_edge("ingest_text_note", END)
 
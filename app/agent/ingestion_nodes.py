@@ -1,42 +1,82 @@
 
 import os
+import hashlib
 from typing import Dict, Any
 from app.agent.state import AgentState
 from app.mcp_server.storage import storage
 from app.interface.utils import media_processor
+from app.core.executors import run_io
+from app.interface.crawler import SiteCrawler
 
 
 # Import registry
 from app.core.global_state import task_registry
+from app.core.job_store import job_store
 
-def ingest_pdf(state: AgentState) -> Dict[str, Any]:
+def _format_ingest_summary(summary: Dict[str, int]) -> str:
+    """One-line report of new vs. already-stored chunks."""
+    return f"🧩 Fragmentos nuevos: {summary['new']} | Duplicados omitidos: {summary['skipped']}"
+
+def _file_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+async def ingest_pdf(state: AgentState) -> Dict[str, Any]:
     print("---INGESTING PDF---")
     file_path = state.get("file_path")
     task_id = state.get("task_id")
+    job_id = state.get("job_id")
     
     if not file_path or not os.path.exists(file_path):
         return {"final_answer": "Error: No se encontró el archivo PDF para procesar."}
     
-    if task_id:
-        task_registry[task_id] = f"Extracting text from PDF (could take a moment)..."
-        
-    text = media_processor.extract_text_from_pdf(file_path)
-    if not text.strip():
-        return {"final_answer": "Error: No se pudo extraer texto del PDF (o está vacío)."}
-        
-    storage.add_documents(
-        documents=[text],
-        metadatas=[{"source": os.path.basename(file_path), "type": "pdf"}],
-        task_id=task_id
-    )
-    
-    # Clean up temp file
     try:
-        os.remove(file_path)
-    except:
-        pass
-        
-    return {"final_answer": f"✅ He guardado el documento '{os.path.basename(file_path)}' en tu base de conocimientos."}
+        # Point IDs derive from the source, so it must be stable across re-downloads:
+        # the original file name, or the file's content hash (never the random temp name)
+        source = state.get("source_name")
+        if not source:
+            source = f"pdf-{(await run_io(_file_digest, file_path))[:16]}"
+        # Opening the PDF parses its page tree: keep it off the event loop
+        total_pages = await run_io(media_processor.count_pdf_pages, file_path)
+        if not total_pages:
+            return {"final_answer": "Error: No se pudo extraer texto del PDF (o está vacío)."}
+    
+        if task_id:
+            await run_io(task_registry.set, task_id, f"Extracting text from PDF ({total_pages} pages)...")
+    
+        def page_records():
+            # Pages are parsed in a process pool and streamed straight into the ingestion pipeline
+            for page_number, page_text in media_processor.iter_pdf_pages(file_path, total_pages):
+                if task_id:
+                    task_registry[task_id] = f"Processing page {page_number}/{total_pages}..."
+                if page_text.strip():
+                    yield page_text, {"source": source, "type": "pdf", "page": page_number}
+    
+        resume_from = None
+        on_checkpoint = None
+        if job_id:
+            # Resume after the last chunk stored by a previous (interrupted) run
+            job = await run_io(job_store.get, job_id)
+            resume_from = job_store.checkpoint_from(job)
+            stored_before = job["chunks_stored"] if job else 0
+            on_checkpoint = lambda position, added: job_store.checkpoint(job_id, position, stored_before + added)
+    
+        # The whole pipeline runs off the event loop so other chats keep being served
+        summary = await run_io(storage.add_records, page_records(), task_id, resume_from, on_checkpoint)
+        if resume_from:
+            summary["new"] += stored_before
+        if summary["new"] + summary["skipped"] == 0:
+            return {"final_answer": "Error: No se pudo extraer texto del PDF (o está vacío)."}
+        return {"final_answer": f"✅ He guardado el documento '{source}' en tu base de conocimientos.\n{_format_ingest_summary(summary)}"}
+    finally:
+        # Clean up temp file (also on errors and early returns)
+        try:
+            os.remove(file_path)
+        except:
+            pass
 
 async def ingest_url(state: AgentState) -> Dict[str, Any]:
     print("---INGESTING URL---")
@@ -47,21 +87,54 @@ async def ingest_url(state: AgentState) -> Dict[str, Any]:
         return {"final_answer": "Error: URL no proporcionada."}
         
     if task_id:
-        task_registry[task_id] = f"Scraping content from {url}..."
+        await run_io(task_registry.set, task_id, f"Scraping content from {url}...")
         
-    text = await media_processor.scrape_url(url)
-    if not text.strip():
+    result = await media_processor.scrape_url(url)
+    if result.not_modified:
+        # Unchanged since it was ingested (HTTP 304): skip parsing and embedding
+        return {"final_answer": f"ℹ️ El contenido de {url} no ha cambiado desde la última vez; ya está en tu base de conocimientos."}
+    if not result.text.strip():
         return {"final_answer": f"Error: No se pudo extraer contenido de {url}."}
         
-    storage.add_documents(
-        documents=[text],
+    summary = await run_io(
+        storage.add_documents,
+        documents=[result.text],
         metadatas=[{"source": url, "type": "url"}],
         task_id=task_id
     )
+    media_processor.mark_url_ingested(result)
+    
+    return {"final_answer": f"✅ He procesado y guardado el contenido de: {url}\n{_format_ingest_summary(summary)}"}
+
+async def ingest_crawl(state: AgentState) -> Dict[str, Any]:
+    print("---CRAWLING SITE---")
+    url = state.get("url")
+    task_id = state.get("task_id")
+    
+    if not url:
+        return {"final_answer": "Error: URL no proporcionada."}
     
-    return {"final_answer": f"✅ He procesado y guardado el contenido de: {url}"}
+    if task_id:
+        await run_io(task_registry.set, task_id, f"Starting crawl of {url}...")
+    
+    try:
+        # Pages are fetched concurrently and streamed into the ingestion pipeline
+        stats = await SiteCrawler().crawl(url, task_id=task_id)
+    except Exception as e:
+        return {"final_answer": f"Error al rastrear {url}: {str(e)}"}
+    
+    if stats["pages"] == 0 and stats["unchanged"] == 0:
+        return {"final_answer": f"Error: No se pudo extraer contenido de {url}."}
+    
+    report = (
+        f"✅ Sitio rastreado: {url}\n"
+        f"📄 Páginas guardadas: {stats['pages']} | Sin cambios: {stats['unchanged']} | Fallidas: {stats['failed'] + stats['blocked']}\n"
+        f"{_format_ingest_summary(stats)}\n"
+        f"⏱️ {stats['seconds']} s ({stats['pages_per_second']} páginas/s)"
+    )
+    return {"final_answer": report}
 
-def ingest_image(state: AgentState) -> Dict[str, Any]:
+async def ingest_image(state: AgentState) -> Dict[str, Any]:
     print("---INGESTING IMAGE---")
     file_path = state.get("file_path") # We expect a temp file path for consistency
     if not file_path or not os.path.exists(file_path):
@@ -71,17 +144,19 @@ def ingest_image(state: AgentState) -> Dict[str, Any]:
         with open(file_path, "rb") as img_file:
             image_bytes = img_file.read()
             
-        description = media_processor.describe_image_from_bytes(image_bytes)
+        # base64 encoding + the GPT-4o call are blocking: keep them off the event loop
+        description = await run_io(media_processor.describe_image_from_bytes, image_bytes)
         
         if "Error" in description or "Hubo un error" in description:
              return {"final_answer": description} # Return the error message from utils
         
-        storage.add_documents(
+        summary = await run_io(
+            storage.add_documents,
             documents=[description],
             metadatas=[{"source": "image_upload", "type": "image_description"}]
         )
         
-        return {"final_answer": f"✅ Imagen analizada y guardada.\n\n📝 Descripción generada:\n{description}"}
+        return {"final_answer": f"✅ Imagen analizada y guardada.\n{_format_ingest_summary(summary)}\n\n📝 Descripción generada:\n{description}"}
         
     except Exception as e:
         return {"final_answer": f"Error procesando imagen: {str(e)}"}
@@ -92,14 +167,17 @@ def ingest_image(state: AgentState) -> Dict[str, Any]:
         except:
             pass
 
-def ingest_text_note(state: AgentState) -> Dict[str, Any]:
+async def ingest_text_note(state: AgentState) -> Dict[str, Any]:
     """Handles explicit /save commands for text notes"""
     print("---INGESTING TEXT NOTE---")
     text = state.get("question") # strict raw text
     # Usually the command logic in bot.py removes the "/save " prefix
     
-    storage.add_documents(
+    summary = await run_io(
+        storage.add_documents,
         documents=[text],
         metadatas=[{"source": "user_note", "type": "text"}]
     )
+    if summary["new"] == 0:
+        return {"final_answer": "ℹ️ Esa nota ya estaba guardada en la base de conocimientos."}
     return {"final_answer": "✅ Nota guardada en la base de conocimientos."}
@@ -1,4 +1,7 @@
 
+import re
+import asyncio
+from difflib import SequenceMatcher
 from typing import Dict, Any
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
@@ -6,49 +9,130 @@ from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from app.agent.state import AgentState
 from app.mcp_server.storage import storage
 from app.core.config import settings
+from app.core.llm_cache import llm_cache
+from app.agent.answer_cache import answer_cache
+from app.agent.context import assemble_context, count_tokens, truncate_tokens
 
 # Initialize LLM with DeepSeek
 llm = ChatOpenAI(
     model="deepseek-chat",
     api_key=settings.DEEPSEEK_API_KEY,
     base_url=settings.DEEPSEEK_BASE_URL,
-    temperature=0
+    temperature=0,
+    # Streamed answers report usage too, so the cache can count the tokens it saves
+    stream_usage=True,
+    # Deterministic calls: identical prompts are served from the SQLite cache
+    cache=llm_cache
 )
 
-def query_reformulation(state: AgentState) -> Dict[str, Any]:
-    print("---QUERY REFORMULATION---")
-    question = state["question"]
-    messages = state.get("messages", [])
+def _format_history(messages, skip_question: str = None, summary: str = None,
+                    max_tokens: int = settings.HISTORY_MAX_TOKENS) -> str:
+    """
+    Formats the running summary plus the most recent messages as
+    'Human: ...' / 'AI: ...' lines, within max_tokens. Messages are taken
+    newest first; a long one (e.g. a LaTeX-heavy answer) is truncated.
+    """
+    lines = []
+    budget = max_tokens
+    header = ""
+    if summary:
+        summary = truncate_tokens(summary, min(settings.HISTORY_SUMMARY_MAX_TOKENS, budget))
+        header = f"Summary of the earlier conversation: {summary}\n"
+        budget -= count_tokens(header)
+    for msg in reversed(messages or []):
+        # Skip the current question if it's already in the history (Generator only)
+        if skip_question is not None and msg.content == skip_question and msg.type == "human":
+            continue
+        role = "Human" if msg.type == "human" else "AI"
+        # Role label, newline and the truncation marker
+        room = budget - count_tokens(f"{role}: [...]\n")
+        if room <= 0:
+            break
+        content = msg.content
+        if count_tokens(content) > room:
+            content = truncate_tokens(content, room) + " [...]"
+        line = f"{role}: {content}\n"
+        lines.append(line)
+        budget -= count_tokens(line)
+    
+    return header + "".join(reversed(lines))
+
+REFORMULATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert at optimizing search queries for semantic vector databases. 
+    Transform the user input into a specific, context-rich query.
+    Use the Chat History to resolve pronouns like "it", "that", "the previous one" etc.
     
-    # Format history (last 5 interactions)
+    If the question is standalone, just clean it up.
+    If the question refers to history (e.g. "What did you say about X?"), include X in the new query.
+    """),
+    ("human", "Chat History:\n{history}\n\nUser Question: {question}\n\nOptimized Query:")
+])
+
+def _reformulation_inputs(state: AgentState) -> Dict[str, Any]:
     # messages is List[BaseMessage]
-    history_str = ""
-    if messages:
-        # Take last 6 messages (3 turns) excluding current human input if it's already there
-        recent_msgs = messages[-6:] 
-        for msg in recent_msgs:
-            role = "Human" if msg.type == "human" else "AI"
-            history_str += f"{role}: {msg.content}\n"
-            
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert at optimizing search queries for semantic vector databases. 
-        Transform the user input into a specific, context-rich query.
-        Use the Chat History to resolve pronouns like "it", "that", "the previous one" etc.
-        
-        If the question is standalone, just clean it up.
-        If the question refers to history (e.g. "What did you say about X?"), include X in the new query.
-        """),
-        ("human", "Chat History:\n{history}\n\nUser Question: {question}\n\nOptimized Query:")
-    ])
-    chain = prompt | llm | StrOutputParser()
-    reformulated = chain.invoke({"question": question, "history": history_str})
-    return {"reformulated_query": reformulated}
-
-def retrieve(state: AgentState) -> Dict[str, Any]:
-    print("---RETRIEVAL (MCP TOOL CALL)---")
+    return {
+        "question": state["question"],
+        "history": _format_history(state.get("messages", []), summary=state.get("history_summary"))
+    }
+
+async def aquery_reformulation(state: AgentState) -> Dict[str, Any]:
+    print("---QUERY REFORMULATION (ASYNC)---")
+    chain = REFORMULATION_PROMPT | llm | StrOutputParser()
+    if not settings.SPECULATIVE_RETRIEVAL:
+        reformulated = await chain.ainvoke(_reformulation_inputs(state))
+        return {"reformulated_query": reformulated, "rag_route": "reformulated"}
+    
+    # Speculative retrieval: search the raw question while the LLM rewrites it,
+    # so retrieve can often reuse (or merge) these hits instead of waiting
+    speculative = asyncio.ensure_future(storage.asearch_hits(state["question"]))
+    try:
+        reformulated = await chain.ainvoke(_reformulation_inputs(state))
+    except BaseException:
+        speculative.cancel()
+        raise
+    return {"reformulated_query": reformulated, "rag_route": "reformulated", "speculative_hits": await speculative}
+
+def direct_query(state: AgentState) -> Dict[str, Any]:
+    print("---DIRECT QUERY (NO REFORMULATION)---")
+    # Standalone question: search with it as-is (just whitespace cleanup)
+    return {"reformulated_query": " ".join(state["question"].split()), "rag_route": "direct"}
+
+def _normalized_words(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+def _barely_changed(question: str, reformulated: str) -> bool:
+    """True if the rewrite is (almost) the same text, so searching it again is wasted work."""
+    ratio = SequenceMatcher(None, _normalized_words(question), _normalized_words(reformulated)).ratio()
+    return ratio >= settings.SPECULATIVE_REUSE_SIMILARITY
+
+def _merge_hits(*hit_lists, limit: int = 5):
+    """Union of several searches by chunk ID, keeping each chunk's best score."""
+    best = {}
+    for hits in hit_lists:
+        for hit in hits:
+            if hit["id"] not in best or hit["score"] > best[hit["id"]]["score"]:
+                best[hit["id"]] = hit
+    return sorted(best.values(), key=lambda hit: hit["score"], reverse=True)[:limit]
+
+async def aretrieve(state: AgentState) -> Dict[str, Any]:
+    print("---RETRIEVAL (MCP TOOL CALL, ASYNC)---")
     query = state["reformulated_query"]
-    docs = storage.search(query)
-    return {"context": docs}
+    speculative = state.get("speculative_hits")
+    if speculative is not None and _barely_changed(state["question"], query):
+        print("---RETRIEVAL: REUSING SPECULATIVE HITS---")
+        hits = speculative
+        query = state["question"]
+    else:
+        hits = await storage.asearch_hits(query)
+        if speculative:
+            hits = _merge_hits(hits, speculative)
+    # Chunk IDs let the answer cache notice when retrieval results change
+    return {
+        "context": [hit["content"] for hit in hits],
+        "context_ids": [hit["id"] for hit in hits],
+        "context_hits": hits,
+        "retrieval_query": query
+    }
 
 def grade_documents(state: AgentState) -> Dict[str, Any]:
     print("---GRADING DOCUMENTS---")
@@ -61,53 +145,77 @@ def grade_documents(state: AgentState) -> Dict[str, Any]:
         
     return {"is_relevant": True}
 
-def generate(state: AgentState) -> Dict[str, Any]:
-    print("---GENERATING ANSWER---")
-    question = state["question"]
-    context = state["context"]
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are the 'Telegram Brain Agent', a charismatic and expert Physics Tutor.
-        
-        **CORE INSTRUCTION**:
-        The texts provided in the Context are YOUR OWN INTERNAL KNOWLEDGE/MEMORY. You already know this!
-        Therefore, you must NEVER say "According to the context" or "The document says". 
-        Instead, speak with authority and confidence, as if you are teaching a student from your own mind.
-        
-        **TONE GUIDELINES**:
-        - Be natural, engaging, and direct.
-        - Explain concepts clearly (Feynman technique).
-        - If asked a question, answer it directly. Do not meta-explain where you got the info.
-           
-        **LATEX INSTRUCTION (SMART VISUALS)**:
-        - Use double dollar signs `$$` ONLY for meaningful, complex equations (integrals, sums, definitions) that need visualization.
-        - For simple variables (like x, y, K) or short expressions, use standard text or bold text (e.g., **x**, **K**). Do NOT use `$$` for simple names.
-        - Example logic:
-          - "The integral is `$$ \int x dx $$`" -> Image (Good).
-          - "The variable `$$ x $$`" -> Image (BAD - Spam). Use "**x**" instead.
-           
-        **CONTEXT USAGE**:
-        - Use ONLY the provided context to form your answer, but DO NOT mention you are doing so.
-        - If the answer is not in the context, say: "I don't have that specific information right now."
-        """),
-        ("human", "Chat History:\n{history}\n\nUser Question: {question}")
-    ])
-    chain = prompt | llm | StrOutputParser()
-    context_str = "\n\n".join(context)
+GENERATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are the 'Telegram Brain Agent', a charismatic and expert Physics Tutor.
     
+    **CORE INSTRUCTION**:
+    The texts provided in the Context are YOUR OWN INTERNAL KNOWLEDGE/MEMORY. You already know this!
+    Therefore, you must NEVER say "According to the context" or "The document says". 
+    Instead, speak with authority and confidence, as if you are teaching a student from your own mind.
+    
+    **TONE GUIDELINES**:
+    - Be natural, engaging, and direct.
+    - Explain concepts clearly (Feynman technique).
+    - If asked a question, answer it directly. Do not meta-explain where you got the info.
+       
+    **LATEX INSTRUCTION (SMART VISUALS)**:
+    - Use double dollar signs `$$` ONLY for meaningful, complex equations (integrals, sums, definitions) that need visualization.
+    - For simple variables (like x, y, K) or short expressions, use standard text or bold text (e.g., **x**, **K**). Do NOT use `$$` for simple names.
+    - Example logic:
+      - "The integral is `$$ \int x dx $$`" -> Image (Good).
+      - "The variable `$$ x $$`" -> Image (BAD - Spam). Use "**x**" instead.
+       
+    **CONTEXT USAGE**:
+    - Use ONLY the provided context to form your answer, but DO NOT mention you are doing so.
+    - If the answer is not in the context, say: "I don't have that specific information right now."
+    
+    **CONTEXT**:
+    {context}
+    """),
+    ("human", "Chat History:\n{history}\n\nUser Question: {question}")
+])
+
+def assemble_prompt_context(state: AgentState) -> Dict[str, Any]:
+    print("---ASSEMBLING CONTEXT---")
+    context_str, stats = assemble_context(state["context_hits"])
+    print(f"---CONTEXT: {stats['chunks']} chunks -> {stats['used_segments']}/{stats['segments']} segments, {stats['context_tokens']} tokens---")
+    return {"prompt_context": context_str}
+
+def _generation_inputs(state: AgentState) -> Dict[str, Any]:
+    question = state["question"]
+    context_str = state["prompt_context"]
     # Format history for Generator (same as Reformulator)
-    messages = state.get("messages", [])
-    history_str = ""
-    if messages:
-        # Take last 6 messages
-        recent_msgs = messages[-6:] 
-        for msg in recent_msgs:
-            # Skip the very last one if it's the current question (usually it is)
-            if msg.content == question and msg.type == "human":
-                 continue
-            role = "Human" if msg.type == "human" else "AI"
-            history_str += f"{role}: {msg.content}\n"
-            
-    answer = chain.invoke({"context": context_str, "question": question, "history": history_str})
+    history_str = _format_history(state.get("messages", []), skip_question=question, summary=state.get("history_summary"))
+    return {"context": context_str, "question": question, "history": history_str}
+
+def _log_prompt_tokens(inputs: Dict[str, Any]):
+    messages = GENERATION_PROMPT.format_messages(**inputs)
+    prompt_tokens = sum(count_tokens(message.content) for message in messages)
+    print(f"---PROMPT TOKENS: {prompt_tokens} (context {count_tokens(inputs['context'])})---")
+
+async def agenerate(state: AgentState) -> Dict[str, Any]:
+    print("---GENERATING ANSWER (ASYNC)---")
+    context_ids = state.get("context_ids") or []
+    inputs = _generation_inputs(state)
+    # The answer also depends on the chat history in the prompt (summary included)
+    history_key = answer_cache.history_key(inputs["history"])
+    query_embedding = None
+    if answer_cache.enabled and context_ids:
+        # Same query as retrieval, so the embedding comes from the query cache
+        query_embedding = await storage.aembed_query(state.get("retrieval_query") or state["reformulated_query"])
+        cached = answer_cache.lookup(query_embedding, context_ids, history_key)
+        if cached is not None:
+            print("---ANSWER CACHE HIT---")
+            return {"final_answer": cached}
+    
+    _log_prompt_tokens(inputs)
+    chain = GENERATION_PROMPT | llm | StrOutputParser()
+    # ainvoke (not astream) so the LLM cache is consulted; inside agent_app.astream(stream_mode="messages")
+    # a miss is still streamed token by token, and a hit arrives as a single message
+    answer = await chain.ainvoke(inputs)
+    
+    if query_embedding is not None and answer:
+        answer_cache.store(query_embedding, context_ids, history_key, answer)
     return {"final_answer": answer}
 
 def fallback_nodes(state: AgentState) -> Dict[str, Any]:
@@ -4,13 +4,23 @@ import operator
 
 class AgentState(TypedDict):
     messages: Annotated[List[BaseMessage], operator.add]
+    history_summary: Optional[str] # Running summary of the turns folded out of messages
     question: str
     reformulated_query: str
+    rag_route: Optional[str] # 'direct' (question used as-is) or 'reformulated'
     context: List[str]
+    context_ids: List[str] # Point IDs of the retrieved chunks (aligned with context)
+    speculative_hits: Optional[List[dict]] # Hits for the raw question, searched during reformulation
+    retrieval_query: Optional[str] # The query whose embedding produced context
+    context_hits: Optional[List[dict]] # Retrieved hits (id, content, score, payload)
+    prompt_context: Optional[str] # Merged, token-budgeted context injected into the prompt
     is_relevant: bool
     final_answer: str
     # Ingestion Fields
     file_path: Optional[str]
     url: Optional[str]
-    media_type: Optional[str] # 'pdf', 'url', 'image', 'audio'
+    media_type: Optional[str] # 'pdf', 'url', 'crawl', 'image', 'audio'
     ingestion_status: Optional[str]
+    task_id: Optional[str] # Key in task_registry for progress reports
+    job_id: Optional[str] # Durable ingestion job (checkpoints in the job store)
+    source_name: Optional[str] # Original file name, used as the chunks' source
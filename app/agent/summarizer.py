@@ -0,0 +1,110 @@
+import time
+import asyncio
+import logging
+from typing import Dict, List
+from langchain_core.messages import BaseMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.executors import run_io
+from app.core.global_state import ChatHistoryStore, chat_history
+from app.agent.context import count_tokens, truncate_tokens
+from app.agent.nodes import llm
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You maintain a running summary of a tutoring conversation.
+    Merge the new messages into the existing summary.
+    Keep the topics, documents and sections discussed, definitions or results the user relied on,
+    and anything still open (pronouns in later questions will be resolved against this summary).
+    Drop greetings, formatting and full derivations; refer to formulas by name.
+    Write in the language of the conversation, at most {max_words} words, plain text.
+    """),
+    ("human", "Existing summary:\n{summary}\n\nNew messages:\n{messages}\n\nUpdated summary:")
+])
+
+
+class HistorySummarizer:
+    """
+    Incremental conversation compression, run in the background after the
+    reply is sent. Once the verbatim history no longer fits the prompt
+    budget (HISTORY_MAX_TOKENS), or the next turn would push messages out of
+    the store's cap, every message older than the last
+    HISTORY_RECENT_MESSAGES is folded into the chat's running summary and
+    removed from the stored history. Below that no LLM call is made, so
+    short exchanges cost nothing extra; prompt size stays flat in long
+    sessions.
+    """
+
+    def __init__(self, store: ChatHistoryStore = chat_history,
+                 keep_messages: int = settings.HISTORY_RECENT_MESSAGES,
+                 max_history_tokens: int = settings.HISTORY_MAX_TOKENS,
+                 max_summary_tokens: int = settings.HISTORY_SUMMARY_MAX_TOKENS):
+        self.store = store
+        self.keep_messages = max(0, keep_messages)
+        self.max_history_tokens = max_history_tokens
+        self.max_summary_tokens = max_summary_tokens
+        # One fold at a time per chat within this worker; across workers,
+        # store.fold is a compare-and-set and only the first fold applies
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Keeps background tasks referenced until they finish
+        self._tasks = set()
+        self.folds = 0
+        self.failed = 0
+
+    def schedule(self, chat_id):
+        """Folds this chat's older messages in the background (no-op below the fold threshold)."""
+        task = asyncio.create_task(self.summarize(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _format_messages(messages: List[BaseMessage]) -> str:
+        lines = []
+        for msg in messages:
+            role = "Human" if msg.type == "human" else "AI"
+            lines.append(f"{role}: {msg.content}")
+        return "\n".join(lines)
+
+    def needs_fold(self, history: List[BaseMessage]) -> bool:
+        if len(history) <= self.keep_messages:
+            return False
+        # The next turn appends 2 messages; past the store's cap the oldest would be lost unsummarized
+        if len(history) + 2 > self.store.max_messages:
+            return True
+        return count_tokens(self._format_messages(history)) > self.max_history_tokens
+
+    async def summarize(self, chat_id):
+        lock = self._locks.setdefault(str(chat_id), asyncio.Lock())
+        async with lock:
+            try:
+                history = await run_io(self.store.get, chat_id)
+                if not self.needs_fold(history):
+                    return
+                folded = history[:len(history) - self.keep_messages] if self.keep_messages else history
+                start = time.perf_counter()
+                previous = await run_io(self.store.get_summary, chat_id)
+                chain = SUMMARY_PROMPT | llm | StrOutputParser()
+                summary = await chain.ainvoke({
+                    "summary": previous or "(none)",
+                    "messages": self._format_messages(folded),
+                    # ~0.75 words per token
+                    "max_words": int(self.max_summary_tokens * 0.75),
+                })
+                summary = truncate_tokens(summary.strip(), self.max_summary_tokens)
+                if await run_io(self.store.fold, chat_id, folded, summary):
+                    self.folds += 1
+                    metrics.observe("history.summarize", time.perf_counter() - start)
+                    logger.info(f"Folded {len(folded)} messages of chat {chat_id} into a {count_tokens(summary)}-token summary")
+            except Exception as e:
+                # The messages stay in the history; the next turn tries again
+                self.failed += 1
+                logger.warning(f"History summarization failed for chat {chat_id}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"folds": self.folds, "failed": self.failed, "running": len(self._tasks)}
+
+
+history_summarizer = HistorySummarizer()
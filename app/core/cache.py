@@ -0,0 +1,88 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with TTL and a size limit in bytes.
+
+    - Entries older than `ttl_seconds` are treated as misses and dropped.
+    - When the total estimated size goes over `max_bytes`, the least recently
+      used entries are evicted.
+    - `sizeof` estimates the size of a value in bytes (default: len(value)).
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: Optional[float] = None,
+                 sizeof: Callable[[Any], int] = len):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._sizeof = sizeof
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return  # Would evict everything else, not worth caching
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._data:
+                oldest_key = next(iter(self._data))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._data.pop(key)
+        self.current_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Membership test that doesn't touch hit/miss counters or LRU order."""
+        with self._lock:
+            entry = self._data.get(key)
+        return entry is not None and (entry[2] is None or entry[2] >= time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -7,6 +7,7 @@ class Settings(BaseSettings):
     # Telegram
     TELEGRAM_BOT_TOKEN: str
     TELEGRAM_WEBHOOK_URL: Optional[str] = None
+    TELEGRAM_WEBHOOK_SECRET: Optional[str] = None  # Checked against X-Telegram-Bot-Api-Secret-Token
     
     # DeepSeek API
     DEEPSEEK_API_KEY: str
@@ -19,6 +20,103 @@ class Settings(BaseSettings):
     QDRANT_API_KEY: Optional[str] = None
     QDRANT_COLLECTION_NAME: str = "telegram_brain_knowledge"
     
+    # Query embedding cache (in-process, per worker)
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS: int = 3600
+    QUERY_EMBEDDING_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    
+    # Persistent ingestion embedding cache (SQLite, survives restarts)
+    EMBEDDING_CACHE_PATH: str = ".cache/embeddings.sqlite3"
+    
+    # Streaming ingestion pipeline (chunk -> embed -> upsert)
+    INGEST_QUEUE_MAXSIZE: int = 2  # Batches buffered between stages (bounds peak memory)
+    
+    # Embedding requests: concurrency, initial rate limits (updated from response headers), retries
+    EMBEDDING_MAX_CONCURRENCY: int = 4
+    EMBEDDING_RPM_LIMIT: int = 3000
+    EMBEDDING_TPM_LIMIT: int = 1_000_000
+    EMBEDDING_MAX_RETRIES: int = 5
+    # Request packing (OpenAI caps: 2048 inputs / 300k tokens per request, 8191 tokens per input).
+    # (INGEST_QUEUE_MAXSIZE + EMBEDDING_MAX_CONCURRENCY) batches can be in flight, so the input
+    # cap also bounds memory: 256 chunks of ~1000 chars is ~64k tokens per request
+    EMBEDDING_BATCH_MAX_TOKENS: int = 100_000
+    EMBEDDING_BATCH_MAX_INPUTS: int = 256
+    
+    # Shared executors: threads for blocking I/O, processes for CPU-bound parsing/rendering
+    IO_EXECUTOR_WORKERS: int = 16
+    CPU_EXECUTOR_WORKERS: int = 0  # 0 = one per CPU core
+    PDF_PAGES_PER_TASK: int = 20
+    
+    # Rendered LaTeX cache (memory LRU + PNG files + Telegram file_ids)
+    LATEX_CACHE_DIR: str = ".cache/latex"
+    LATEX_CACHE_MEMORY_MAX_BYTES: int = 8 * 1024 * 1024
+    
+    # Token streaming: answers are progressively edited into one Telegram message
+    STREAM_ANSWERS: bool = True
+    STREAM_EDIT_INTERVAL_SECONDS: float = 1.0  # Telegram throttles frequent edits per chat
+    
+    # URL ingestion HTTP client (pooled, streaming, conditional requests)
+    HTTP_TIMEOUT_SECONDS: float = 10.0
+    HTTP_MAX_CONNECTIONS: int = 20
+    HTTP_MAX_DOWNLOAD_BYTES: int = 5 * 1024 * 1024
+    HTTP_CACHE_PATH: str = ".cache/http_validators.sqlite3"
+    
+    # Site crawl ingestion (/crawl <url> or a sitemap URL)
+    CRAWL_MAX_PAGES: int = 50
+    CRAWL_MAX_DEPTH: int = 2
+    CRAWL_CONCURRENCY: int = 4
+    CRAWL_POLITENESS_DELAY_SECONDS: float = 1.0
+    
+    # Shared state (chat history, task status) across uvicorn workers: "sqlite" or "memory"
+    STATE_BACKEND: str = "sqlite"
+    STATE_DB_PATH: str = ".cache/state.sqlite3"
+    TASK_STATUS_TTL_SECONDS: int = 3600
+    
+    # Webhook: updates are queued and processed by async workers (ordered per chat)
+    UPDATE_WORKERS: int = 8
+    UPDATE_QUEUE_MAXSIZE: int = 1000
+    UPDATE_DEDUP_TTL_SECONDS: int = 24 * 3600
+    UPDATE_SHUTDOWN_GRACE_SECONDS: float = 20.0
+    
+    # Job scheduler: questions run before ingestion jobs, chats take turns
+    SCHEDULER_MAX_INTERACTIVE: int = 8
+    SCHEDULER_MAX_INGESTIONS: int = 2
+    SCHEDULER_MAX_INGESTIONS_PER_CHAT: int = 1
+    
+    # Durable ingestion jobs (resumed from their checkpoint after a restart).
+    # Must be on a persistent volume: on Cloud Run the container filesystem is wiped
+    # on every restart/redeploy (scripts/deploy.ps1 mounts one at /mnt/state)
+    JOB_STORE_PATH: str = ".cache/jobs.sqlite3"
+    JOB_STORE_REQUIRE_PERSISTENT: bool = False  # Refuse to start if JOB_STORE_PATH is ephemeral
+    JOB_HEARTBEAT_SECONDS: float = 30.0
+    JOB_STALE_SECONDS: float = 120.0
+    JOB_MAX_ATTEMPTS: int = 3
+    
+    # Semantic answer cache in front of generate (toggle at runtime via /admin/answer-cache)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: int = 24 * 3600
+    
+    # Speculative retrieval: search the raw question while reformulation runs
+    SPECULATIVE_RETRIEVAL: bool = True
+    SPECULATIVE_REUSE_SIMILARITY: float = 0.9  # Text similarity above which the rewrite isn't searched again
+    
+    # Token budget for the retrieved context injected into the generation prompt
+    CONTEXT_MAX_TOKENS: int = 1500
+    
+    # Persistent LLM result cache (identical temperature=0 calls are answered from SQLite)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = ".cache/llm.sqlite3"
+    LLM_CACHE_MAX_ENTRIES: int = 5000
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    
+    # Chat history in prompts: running summary + most recent messages, within a token cap.
+    # Older messages are only summarized (one extra LLM call) once the verbatim history
+    # exceeds HISTORY_MAX_TOKENS; then all but the last HISTORY_RECENT_MESSAGES are folded
+    HISTORY_RECENT_MESSAGES: int = 2
+    HISTORY_MAX_TOKENS: int = 800
+    HISTORY_SUMMARY_MAX_TOKENS: int = 300
+    
     # MCP
     MCP_SERVER_NAME: str = "telegram-brain-mcp"
     
@@ -0,0 +1,116 @@
+"""
+Shared executor layer for work that must not run on the asyncio event loop.
+
+- io_executor: thread pool for blocking SDK / DB calls (OpenAI, Qdrant, file I/O).
+- cpu_executor: process pool for CPU-bound parsing and rendering (pypdf,
+  BeautifulSoup, matplotlib), so it doesn't hold the GIL of the web worker.
+
+Both record queue depth and wait time (submit -> start) for /admin/metrics.
+"""
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from app.core.config import settings
+from app.utils.worker_call import timed_call
+
+
+class InstrumentedExecutor:
+    """Wraps a concurrent.futures executor and tracks queue depth and wait times."""
+
+    def __init__(self, name: str, factory: Callable[[], Executor], max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._waits = deque(maxlen=500)  # Recent wait times in seconds
+
+    def _get_executor(self) -> Executor:
+        # Created lazily so importing this module never spawns workers
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._factory()
+            return self._executor
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """Submits func(*args, **kwargs); the returned future resolves to its plain result."""
+        executor = self._get_executor()
+        result_future: Future = Future()
+        with self._lock:
+            self._in_flight += 1
+        submitted_at = time.time()
+        inner = executor.submit(timed_call, func, args, kwargs)
+
+        def _done(fut: Future):
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+            try:
+                started_at, result = fut.result()
+            except BaseException as e:
+                result_future.set_exception(e)
+                return
+            self._waits.append(max(0.0, started_at - submitted_at))
+            result_future.set_result(result)
+
+        inner.add_done_callback(_done)
+        return result_future
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Awaitable version of submit, for use from the event loop."""
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": self._in_flight,
+            # Submitted but not yet picked up by a worker
+            "queue_depth": max(0, self._in_flight - self.max_workers),
+            "completed": self._completed,
+            "avg_wait_ms": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+            "p95_wait_ms": round(1000 * waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0,
+        }
+
+
+_io_workers = settings.IO_EXECUTOR_WORKERS
+_cpu_workers = settings.CPU_EXECUTOR_WORKERS or os.cpu_count() or 1
+
+io_executor = InstrumentedExecutor(
+    "io",
+    lambda: ThreadPoolExecutor(max_workers=_io_workers, thread_name_prefix="io"),
+    _io_workers
+)
+# 'spawn' avoids forking a process that already runs threads and an event loop
+cpu_executor = InstrumentedExecutor(
+    "cpu",
+    lambda: ProcessPoolExecutor(max_workers=_cpu_workers, mp_context=multiprocessing.get_context("spawn")),
+    _cpu_workers
+)
+
+
+async def run_io(func: Callable, *args, **kwargs) -> Any:
+    """Runs a blocking I/O-bound call (SDK, DB, file) in the shared thread pool."""
+    return await io_executor.run(func, *args, **kwargs)
+
+
+async def run_cpu(func: Callable, *args, **kwargs) -> Any:
+    """Runs a CPU-bound, picklable top-level function in the shared process pool."""
+    return await cpu_executor.run(func, *args, **kwargs)
+
+
+def executor_stats() -> Dict[str, Any]:
+    return {"io": io_executor.stats(), "cpu": cpu_executor.stats()}
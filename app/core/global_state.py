@@ -1,4 +1,108 @@
+from collections.abc import MutableMapping
+from typing import Iterator, List, Optional, Sequence
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+from app.core.config import settings
+from app.core.state_backend import StateBackend, state_backend
 
-# Singleton dictionary for tracking task status across modules
-# Key: task_id (e.g. chat_id), Value: str (Status message)
-task_registry = {}
+
+class TaskRegistry(MutableMapping):
+    """
+    Dict-like view of task statuses stored in the shared state backend, so a
+    status written by one uvicorn worker is visible to all of them.
+    Key: task_id (e.g. chat_id), Value: str (Status message).
+    Entries expire after TASK_STATUS_TTL_SECONDS so a crashed worker can't
+    leave a chat stuck in "busy" forever; every update refreshes the TTL.
+    Every access is a backend query: from the event loop, go through run_io.
+    """
+
+    NAMESPACE = "task_status"
+
+    def __init__(self, backend: StateBackend):
+        self.backend = backend
+
+    def __getitem__(self, task_id: str) -> str:
+        status = self.backend.get(self.NAMESPACE, str(task_id))
+        if status is None:
+            raise KeyError(task_id)
+        return status
+
+    def __setitem__(self, task_id: str, status: str):
+        self.backend.set(self.NAMESPACE, str(task_id), status, ttl_seconds=settings.TASK_STATUS_TTL_SECONDS)
+
+    def set(self, task_id: str, status: str):
+        """Same as registry[task_id] = status, as a callable for run_io."""
+        self[task_id] = status
+
+    def __delitem__(self, task_id: str):
+        self.backend.delete(self.NAMESPACE, str(task_id))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([key for key, _ in self.backend.items(self.NAMESPACE)])
+
+    def __len__(self) -> int:
+        return len(self.backend.items(self.NAMESPACE))
+
+    def __repr__(self):
+        return f"TaskRegistry({dict(self.backend.items(self.NAMESPACE))!r})"
+
+
+class ChatHistoryStore:
+    """
+    Per-chat conversation history kept in the shared state backend.
+    Messages are stored serialized (langchain messages_to_dict).
+    Older turns are folded into a running summary (see HistorySummarizer),
+    so the stored messages are only the ones not summarized yet.
+    """
+
+    NAMESPACE = "chat_history"
+    SUMMARY_NAMESPACE = "chat_summary"
+
+    def __init__(self, backend: StateBackend, max_messages: int = 10):
+        self.backend = backend
+        self.max_messages = max_messages
+
+    def get(self, chat_id) -> List[BaseMessage]:
+        stored = self.backend.get(self.NAMESPACE, str(chat_id), default=[])
+        return messages_from_dict(stored)
+
+    def append(self, chat_id, *messages: BaseMessage):
+        new = messages_to_dict(list(messages))
+
+        def _append(values):
+            # Keep last max_messages (5 turns by default)
+            return [((values[0] or []) + new)[-self.max_messages:]]
+
+        # Atomic, so turns appended by two workers at once are both kept
+        self.backend.transact([(self.NAMESPACE, str(chat_id))], _append)
+
+    def get_summary(self, chat_id) -> Optional[str]:
+        return self.backend.get(self.SUMMARY_NAMESPACE, str(chat_id))
+
+    def fold(self, chat_id, folded: Sequence[BaseMessage], summary: str) -> bool:
+        """
+        Replaces `folded` (the oldest stored messages) by `summary`.
+        If the history no longer starts with them (it was cleared, trimmed or
+        already folded by another worker), nothing is changed and False is
+        returned. The check, the new summary and the trimmed history are
+        applied in one transaction, so turns appended meanwhile are kept.
+        """
+        folded_dicts = messages_to_dict(list(folded))
+
+        def _fold(values):
+            history = values[1] or []
+            if messages_to_dict(messages_from_dict(history[:len(folded_dicts)])) != folded_dicts:
+                return None
+            return [summary, history[len(folded_dicts):]]
+
+        return self.backend.transact(
+            [(self.SUMMARY_NAMESPACE, str(chat_id)), (self.NAMESPACE, str(chat_id))], _fold
+        )
+
+    def clear(self, chat_id):
+        self.backend.delete(self.NAMESPACE, str(chat_id))
+        self.backend.delete(self.SUMMARY_NAMESPACE, str(chat_id))
+
+
+# Singletons for tracking task status and chat history across modules and workers
+task_registry = TaskRegistry(state_backend)
+chat_history = ChatHistoryStore(state_backend)
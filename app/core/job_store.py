@@ -0,0 +1,216 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Identifies this worker process as the owner of the jobs it runs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+UNFINISHED = ("queued", "running")
+
+# Filesystems whose contents are gone after a restart or redeploy
+EPHEMERAL_FILESYSTEMS = {"overlay", "tmpfs", "ramfs", "aufs"}
+# SQLite's WAL needs shared memory on one host; on these it uses a rollback journal
+NETWORK_FILESYSTEM_PREFIXES = ("nfs", "fuse", "cifs", "smb")
+
+
+def _mount_of(path: str) -> Optional[Tuple[str, str]]:
+    """(mount point, filesystem type) of the mount holding `path`, or None if unknown."""
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best = None
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        mount_point = parts[1].replace("\\040", " ")
+        if path == mount_point or path.startswith(mount_point.rstrip("/") + "/"):
+            if best is None or len(mount_point) > len(best[0]):
+                best = (mount_point, parts[2])
+    return best
+
+
+def is_persistent_path(path: str) -> Optional[bool]:
+    """Whether files at `path` survive a container restart (None if it can't be told)."""
+    mount = _mount_of(os.path.dirname(os.path.abspath(path)))
+    if mount is None:
+        return None
+    mount_point, fstype = mount
+    if fstype in EPHEMERAL_FILESYSTEMS:
+        return False
+    if mount_point == "/" and os.environ.get("K_SERVICE"):
+        # Cloud Run: the container filesystem is in memory, only volume mounts persist
+        return False
+    return True
+
+
+class IngestionJobStore:
+    """
+    Durable table of ingestion jobs (SQLite, WAL), so an instance restart
+    doesn't lose a half-ingested document.
+
+    Each job records what to ingest (source, Telegram file_id / URL), where to
+    report (chat, status message) and the last stored chunk as a
+    (record, chunk) checkpoint for KnowledgeBaseStorage.add_records.
+    Owners refresh heartbeat_at while alive; unfinished jobs whose heartbeat
+    went stale belong to a dead worker and can be claimed by another one.
+
+    The file must live on a volume that survives restarts (JOB_STORE_PATH);
+    on an ephemeral filesystem this logs an error, or refuses to start if
+    JOB_STORE_REQUIRE_PERSISTENT is set.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.persistent = is_persistent_path(path)
+        if self.persistent is False:
+            message = (f"Job store {path} is on an ephemeral filesystem: interrupted ingestions "
+                       f"will NOT be resumed after a restart. Point JOB_STORE_PATH at a persistent volume.")
+            if settings.JOB_STORE_REQUIRE_PERSISTENT:
+                raise RuntimeError(message)
+            logger.error(message)
+        elif self.persistent is None:
+            logger.warning(f"Could not tell whether job store {path} is on persistent storage")
+        mount = _mount_of(directory or ".")
+        network_fs = bool(mount and mount[1].startswith(NETWORK_FILESYSTEM_PREFIXES))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=DELETE" if network_fs else "PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                id TEXT PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                source TEXT NOT NULL,
+                file_id TEXT,
+                message_id INTEGER,
+                status TEXT NOT NULL,
+                checkpoint_record INTEGER NOT NULL DEFAULT 0,
+                checkpoint_chunk INTEGER NOT NULL DEFAULT 0,
+                chunks_stored INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                heartbeat_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                error TEXT
+            )"""
+        )
+        self._conn.commit()
+
+    def _execute(self, sql: str, params=()) -> int:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    def create(self, chat_id: int, kind: str, source: str, file_id: Optional[str] = None,
+               message_id: Optional[int] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            """INSERT INTO ingestion_jobs (id, chat_id, kind, source, file_id, message_id, status,
+                   owner, heartbeat_at, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?, ?)""",
+            (job_id, chat_id, kind, source, file_id, message_id, WORKER_ID, now, now, now)
+        )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM ingestion_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def checkpoint_from(job: Optional[Dict[str, Any]]) -> Optional[Tuple[int, int]]:
+        if not job or (job["checkpoint_record"], job["checkpoint_chunk"]) == (0, 0):
+            return None
+        return job["checkpoint_record"], job["checkpoint_chunk"]
+
+    def checkpoint_of(self, job_id: str) -> Optional[Tuple[int, int]]:
+        return self.checkpoint_from(self.get(job_id))
+
+    def mark_running(self, job_id: str):
+        now = time.time()
+        self._execute(
+            "UPDATE ingestion_jobs SET status = 'running', attempts = attempts + 1, heartbeat_at = ?, updated_at = ? WHERE id = ?",
+            (now, now, job_id)
+        )
+
+    def checkpoint(self, job_id: str, position: Tuple[int, int], chunks_stored: int):
+        """Called after every upsert; also counts as a heartbeat."""
+        now = time.time()
+        self._execute(
+            """UPDATE ingestion_jobs SET checkpoint_record = ?, checkpoint_chunk = ?, chunks_stored = ?,
+                   heartbeat_at = ?, updated_at = ?
+               WHERE id = ?""",
+            (position[0], position[1], chunks_stored, now, now, job_id)
+        )
+
+    def finish(self, job_id: str, error: Optional[str] = None):
+        self._execute(
+            "UPDATE ingestion_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            ("failed" if error else "done", error, time.time(), job_id)
+        )
+
+    def heartbeat(self, owner: str = WORKER_ID):
+        self._execute(
+            f"UPDATE ingestion_jobs SET heartbeat_at = ? WHERE owner = ? AND status IN {UNFINISHED}",
+            (time.time(), owner)
+        )
+
+    def claim_stale(self, stale_seconds: float, owner: str = WORKER_ID) -> List[Dict[str, Any]]:
+        """
+        Takes over unfinished jobs whose owner stopped sending heartbeats.
+        The compare-and-swap on (owner, heartbeat_at) makes sure that when
+        several workers start at once, each job is claimed by exactly one.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM ingestion_jobs WHERE status IN {UNFINISHED} AND heartbeat_at < ? ORDER BY created_at",
+                (now - stale_seconds,)
+            ).fetchall()
+        claimed = []
+        for row in rows:
+            won = self._execute(
+                "UPDATE ingestion_jobs SET owner = ?, heartbeat_at = ? WHERE id = ? AND owner IS ? AND heartbeat_at = ?",
+                (owner, now, row["id"], row["owner"], row["heartbeat_at"])
+            )
+            if won:
+                job = dict(row)
+                job["owner"] = owner
+                claimed.append(job)
+        return claimed
+
+    def purge_finished(self, older_than_seconds: float):
+        self._execute(
+            f"DELETE FROM ingestion_jobs WHERE status NOT IN {UNFINISHED} AND updated_at < ?",
+            (time.time() - older_than_seconds,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM ingestion_jobs GROUP BY status").fetchall()
+        stats: Dict[str, Any] = {status: count for status, count in rows}
+        stats["persistent"] = self.persistent
+        return stats
+
+
+job_store = IngestionJobStore(settings.JOB_STORE_PATH)
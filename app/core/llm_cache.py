@@ -0,0 +1,183 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional, Sequence
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Only what ChatOpenAI results are made of can be revived from the cache file
+_ALLOWED_OBJECTS = [ChatGeneration, Generation, AIMessage]
+
+# llm_string contains the serialized model params, e.g. ('model_name', 'deepseek-chat')
+_MODEL_PATTERN = re.compile(r"""['"]model(?:_name)?['"]\s*[:,]\s*['"]([^'"]+)['"]""")
+
+
+class SqliteLLMCache(BaseCache):
+    """
+    Persistent LLM result cache for ChatOpenAI (pass it as `cache=`).
+
+    Key: (model, sha256 of llm_string + prompt). llm_string holds every
+    invocation parameter (temperature, stop, ...), so only identical calls
+    share an entry. Only worth it for deterministic (temperature=0) calls.
+
+    - Entries older than `ttl_seconds` are misses and get purged.
+    - Above `max_entries`, the least recently used entries are evicted.
+    - Stats count the calls and tokens saved (from the stored usage metadata).
+    """
+
+    def __init__(self, path: str, max_entries: int = settings.LLM_CACHE_MAX_ENTRIES,
+                 ttl_seconds: Optional[float] = settings.LLM_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                generations TEXT NOT NULL,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                PRIMARY KEY (model, prompt_hash)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used_at)")
+        self._conn.commit()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_tokens = 0
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str):
+        match = _MODEL_PATTERN.search(llm_string)
+        model = match.group(1) if match else "unknown"
+        prompt_hash = hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+        return model, prompt_hash
+
+    @staticmethod
+    def _tokens(generations: Sequence[Any]) -> int:
+        tokens = 0
+        for generation in generations:
+            if isinstance(generation, ChatGeneration):
+                usage = getattr(generation.message, "usage_metadata", None) or {}
+                tokens += usage.get("total_tokens", 0)
+        return tokens
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        model, prompt_hash = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generations, tokens, created_at FROM llm_cache WHERE model = ? AND prompt_hash = ?",
+                (model, prompt_hash)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            blob, tokens, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE model = ? AND prompt_hash = ?", (model, prompt_hash))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET last_used_at = ? WHERE model = ? AND prompt_hash = ?",
+                (now, model, prompt_hash)
+            )
+            self._conn.commit()
+        try:
+            generations = loads(blob, allowed_objects=_ALLOWED_OBJECTS)
+        except Exception as e:
+            logger.warning(f"Dropping unreadable LLM cache entry: {e}")
+            self._delete(model, prompt_hash)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.saved_tokens += tokens
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        model, prompt_hash = self._key(prompt, llm_string)
+        now = time.time()
+        blob = dumps(list(return_val))
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO llm_cache (model, prompt_hash, generations, tokens, created_at, last_used_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (model, prompt_hash, blob, self._tokens(return_val), now, now)
+            )
+            self._writes += 1
+            # TTL/size cleanup every 100 writes, so the table may briefly exceed max_entries
+            if self._writes % 100 == 1:
+                self._purge_locked(now)
+            self._conn.commit()
+
+    def _purge_locked(self, now: float):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            # Evict the least recently used entries
+            evicted = self._conn.execute(
+                "DELETE FROM llm_cache WHERE rowid IN (SELECT rowid FROM llm_cache ORDER BY last_used_at LIMIT ?)",
+                (count - self.max_entries,)
+            ).rowcount
+            self.evictions += evicted
+
+    def _delete(self, model: str, prompt_hash: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE model = ? AND prompt_hash = ?", (model, prompt_hash))
+            self._conn.commit()
+
+    def clear(self, **kwargs: Any):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "saved_calls": self.hits,
+            "saved_tokens": self.saved_tokens,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+def create_llm_cache() -> Optional[SqliteLLMCache]:
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    try:
+        return SqliteLLMCache(settings.LLM_CACHE_PATH)
+    except Exception as e:
+        logger.warning(f"LLM cache unavailable ({e}); calls will not be cached")
+        return None
+
+
+llm_cache = create_llm_cache()
@@ -0,0 +1,44 @@
+import threading
+from collections import deque
+from typing import Any, Dict
+
+
+class LatencyMetrics:
+    """
+    Per-process latency recorder: keeps the most recent samples per metric
+    name and reports count/avg/p50/p95/max in milliseconds.
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.max_samples)
+                self._counts[name] = 0
+            self._samples[name].append(seconds)
+            self._counts[name] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+            counts = dict(self._counts)
+        result = {}
+        for name, values in samples.items():
+            if not values:
+                continue
+            result[name] = {
+                "count": counts[name],
+                "avg_ms": round(1000 * sum(values) / len(values), 1),
+                "p50_ms": round(1000 * values[len(values) // 2], 1),
+                "p95_ms": round(1000 * values[int(0.95 * (len(values) - 1))], 1),
+                "max_ms": round(1000 * values[-1], 1),
+            }
+        return result
+
+
+metrics = LatencyMetrics()
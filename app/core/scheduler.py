@@ -0,0 +1,201 @@
+"""
+Central job scheduler: decides when a question or an ingestion job may run.
+
+- Priority classes: interactive jobs (questions) are always dispatched before
+  ingestion jobs, and no ingestion starts while a question is waiting.
+- Each class has a global concurrency cap (SCHEDULER_MAX_INTERACTIVE,
+  SCHEDULER_MAX_INGESTIONS), and ingestion also has a per-chat cap.
+- Fair sharing: within a class, chats take turns (round robin), so a chat
+  that uploads ten PDFs doesn't delay everyone else's first one.
+- Queued jobs get their position reported through an `on_position` callback.
+"""
+import time
+import asyncio
+import inspect
+import logging
+from enum import IntEnum
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class JobClass(IntEnum):
+    # Lower value = higher priority
+    INTERACTIVE = 0
+    INGESTION = 1
+
+
+class _Ticket:
+    def __init__(self, chat_key, job_class: JobClass, on_position: Optional[Callable[[int], Any]]):
+        self.chat_key = chat_key
+        self.job_class = job_class
+        self.on_position = on_position
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.perf_counter()
+        self.position: Optional[int] = None
+
+
+class JobScheduler:
+    def __init__(
+        self,
+        max_interactive: int = settings.SCHEDULER_MAX_INTERACTIVE,
+        max_ingestions: int = settings.SCHEDULER_MAX_INGESTIONS,
+        max_ingestions_per_chat: int = settings.SCHEDULER_MAX_INGESTIONS_PER_CHAT,
+    ):
+        self.limits = {JobClass.INTERACTIVE: max(1, max_interactive), JobClass.INGESTION: max(1, max_ingestions)}
+        self.per_chat_limits = {JobClass.INTERACTIVE: None, JobClass.INGESTION: max(1, max_ingestions_per_chat)}
+        # Per class: chat -> queued tickets. Dict order is the round-robin order.
+        self._queues: Dict[JobClass, "OrderedDict[Any, Deque[_Ticket]]"] = {job_class: OrderedDict() for job_class in JobClass}
+        self._running: Dict[JobClass, int] = {job_class: 0 for job_class in JobClass}
+        self._running_per_chat: Dict[tuple, int] = {}
+        # (class, chat) -> dispatch sequence number of its latest job, while the chat is active
+        self._last_served: Dict[tuple, int] = {}
+        self._served = 0
+        # Keeps spawned jobs (and position callbacks) referenced until they finish
+        self._tasks = set()
+
+    def _queued(self, job_class: JobClass) -> int:
+        return sum(len(tickets) for tickets in self._queues[job_class].values())
+
+    def _chat_has_room(self, job_class: JobClass, chat_key) -> bool:
+        limit = self.per_chat_limits[job_class]
+        return limit is None or self._running_per_chat.get((job_class, chat_key), 0) < limit
+
+    def _chat_order(self, job_class: JobClass) -> list:
+        # Chats with fewer jobs already running go first, then the one served
+        # longest ago (a chat that just had a turn waits for the others)
+        return sorted(self._queues[job_class], key=lambda chat_key: (
+            self._running_per_chat.get((job_class, chat_key), 0),
+            self._last_served.get((job_class, chat_key), 0),
+        ))
+
+    def _forget_if_idle(self, job_class: JobClass, chat_key):
+        key = (job_class, chat_key)
+        if key not in self._running_per_chat and chat_key not in self._queues[job_class]:
+            self._last_served.pop(key, None)
+
+    def _next_ticket(self, job_class: JobClass) -> Optional[_Ticket]:
+        queues = self._queues[job_class]
+        for chat_key in self._chat_order(job_class):
+            if not self._chat_has_room(job_class, chat_key):
+                continue
+            tickets = queues[chat_key]
+            ticket = tickets.popleft()
+            if tickets:
+                # This chat goes to the back of the line
+                queues.move_to_end(chat_key)
+            else:
+                del queues[chat_key]
+            return ticket
+        return None
+
+    def _dispatch(self):
+        for job_class in sorted(JobClass):
+            if job_class != JobClass.INTERACTIVE and self._queued(JobClass.INTERACTIVE):
+                # Strict priority: questions first
+                break
+            while self._running[job_class] < self.limits[job_class]:
+                ticket = self._next_ticket(job_class)
+                if ticket is None:
+                    break
+                self._running[job_class] += 1
+                key = (job_class, ticket.chat_key)
+                self._running_per_chat[key] = self._running_per_chat.get(key, 0) + 1
+                self._served += 1
+                self._last_served[key] = self._served
+                metrics.observe(f"scheduler.{job_class.name.lower()}.wait", time.perf_counter() - ticket.enqueued_at)
+                ticket.granted.set_result(None)
+        self._report_positions()
+
+    def _dispatch_order(self, job_class: JobClass) -> List[_Ticket]:
+        """Queued tickets in the order they would be dispatched (round robin across chats)."""
+        order = []
+        queues = [list(self._queues[job_class][chat_key]) for chat_key in self._chat_order(job_class)]
+        depth = 0
+        while queues:
+            queues = [tickets for tickets in queues if len(tickets) > depth]
+            order.extend(tickets[depth] for tickets in queues)
+            depth += 1
+        return order
+
+    def _report_positions(self):
+        for job_class in JobClass:
+            for position, ticket in enumerate(self._dispatch_order(job_class), start=1):
+                if ticket.position == position or ticket.on_position is None:
+                    continue
+                ticket.position = position
+                try:
+                    result = ticket.on_position(position)
+                    if inspect.isawaitable(result):
+                        self._track(asyncio.ensure_future(result))
+                except Exception as e:
+                    logger.warning(f"Queue position callback failed: {e}")
+
+    def _release(self, ticket: _Ticket):
+        self._running[ticket.job_class] -= 1
+        key = (ticket.job_class, ticket.chat_key)
+        self._running_per_chat[key] -= 1
+        if not self._running_per_chat[key]:
+            del self._running_per_chat[key]
+            self._forget_if_idle(ticket.job_class, ticket.chat_key)
+        self._dispatch()
+
+    def _withdraw(self, ticket: _Ticket):
+        tickets = self._queues[ticket.job_class].get(ticket.chat_key)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[ticket.job_class][ticket.chat_key]
+                self._forget_if_idle(ticket.job_class, ticket.chat_key)
+        self._dispatch()
+
+    def _track(self, task: asyncio.Task):
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @asynccontextmanager
+    async def slot(self, chat_id, job_class: JobClass, on_position: Optional[Callable[[int], Any]] = None):
+        """Waits for a free slot of `job_class` (honoring priority and fairness) and holds it."""
+        ticket = _Ticket(chat_id, job_class, on_position)
+        self._queues[job_class].setdefault(chat_id, deque()).append(ticket)
+        self._dispatch()
+        try:
+            await ticket.granted
+        except asyncio.CancelledError:
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                self._release(ticket)
+            else:
+                self._withdraw(ticket)
+            raise
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def spawn(self, chat_id, job_class: JobClass, job: Callable[[], Awaitable[Any]],
+              on_position: Optional[Callable[[int], Any]] = None) -> asyncio.Task:
+        """Runs `job()` in the background once a slot is available."""
+        async def runner():
+            async with self.slot(chat_id, job_class, on_position=on_position):
+                return await job()
+
+        task = asyncio.create_task(runner())
+        self._track(task)
+        return task
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            job_class.name.lower(): {
+                "running": self._running[job_class],
+                "queued": self._queued(job_class),
+                "limit": self.limits[job_class],
+            }
+            for job_class in JobClass
+        }
+
+
+job_scheduler = JobScheduler()
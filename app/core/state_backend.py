@@ -0,0 +1,240 @@
+"""
+Pluggable backend for state that must be shared by every uvicorn worker
+(chat history, task status...).
+
+- InMemoryStateBackend: per-process dict. Only correct with a single worker.
+- SqliteStateBackend: one SQLite file in WAL mode, shared by all the worker
+  processes on the host, with no external service.
+
+Values are JSON-serializable and grouped by namespace; entries may expire.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend(ABC):
+    @abstractmethod
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        ...
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def add(self, namespace: str, key: str, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        """Sets the key only if it doesn't exist (or expired). Returns True if it was added."""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str):
+        ...
+
+    @abstractmethod
+    def items(self, namespace: str) -> List[Tuple[str, Any]]:
+        ...
+
+    @abstractmethod
+    def transact(self, keys: Sequence[Tuple[str, str]],
+                 update: Callable[[List[Any]], Optional[List[Any]]]) -> bool:
+        """
+        Atomic read-modify-write of several (namespace, key) entries.
+        `update` gets their current values (None if missing) and returns the
+        new ones in the same order (None deletes the entry), or None to leave
+        everything unchanged. Written entries don't expire. Returns True if
+        it wrote. `update` may run more than once; keep it free of side effects.
+        """
+
+
+class InMemoryStateBackend(StateBackend):
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (namespace, key) -> (value, expires_at or None)
+        self._data: Dict[Tuple[str, str], Tuple[Any, Optional[float]]] = {}
+
+    def _live(self, entry, now: float) -> bool:
+        return entry is not None and (entry[1] is None or entry[1] > now)
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if not self._live(entry, time.time()):
+                return default
+            return entry[0]
+
+    def set(self, namespace, key, value, ttl_seconds=None):
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._data[(namespace, key)] = (value, expires_at)
+
+    def add(self, namespace, key, value, ttl_seconds=None):
+        now = time.time()
+        with self._lock:
+            if self._live(self._data.get((namespace, key)), now):
+                return False
+            self._data[(namespace, key)] = (value, now + ttl_seconds if ttl_seconds else None)
+            return True
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def items(self, namespace):
+        now = time.time()
+        with self._lock:
+            return [
+                (key, entry[0]) for (ns, key), entry in self._data.items()
+                if ns == namespace and self._live(entry, now)
+            ]
+
+    def transact(self, keys, update):
+        with self._lock:
+            now = time.time()
+            current = []
+            for key in keys:
+                entry = self._data.get(key)
+                current.append(entry[0] if self._live(entry, now) else None)
+            new_values = update(current)
+            if new_values is None:
+                return False
+            for key, value in zip(keys, new_values):
+                if value is None:
+                    self._data.pop(key, None)
+                else:
+                    self._data[key] = (value, None)
+            return True
+
+
+class SqliteStateBackend(StateBackend):
+    """
+    Every worker process opens its own connection to the same file. WAL lets
+    readers run alongside the single writer, and busy_timeout makes writers
+    from other processes wait instead of failing with "database is locked".
+    """
+
+    # Expired rows are purged every this many writes
+    PURGE_EVERY = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            )"""
+        )
+        self._conn.commit()
+        self._writes = 0
+
+    def _write(self, sql: str, params) -> int:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._conn.execute("DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace, key, value, ttl_seconds=None):
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        self._write(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), expires_at)
+        )
+
+    def add(self, namespace, key, value, ttl_seconds=None):
+        now = time.time()
+        # Single statement, so it is atomic across processes: an expired row is
+        # overwritten, a live one is left alone.
+        inserted = self._write(
+            """INSERT INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+               WHERE state.expires_at IS NOT NULL AND state.expires_at <= ?""",
+            (namespace, key, json.dumps(value), now + ttl_seconds if ttl_seconds else None, now)
+        )
+        return inserted > 0
+
+    def delete(self, namespace, key):
+        self._write("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time())
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def transact(self, keys, update):
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock before reading, so no other
+            # process can change these rows between the read and the write.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                current = []
+                for namespace, key in keys:
+                    row = self._conn.execute(
+                        "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                        (namespace, key, now)
+                    ).fetchone()
+                    current.append(json.loads(row[0]) if row else None)
+                new_values = update(current)
+                if new_values is None:
+                    self._conn.rollback()
+                    return False
+                for (namespace, key), value in zip(keys, new_values):
+                    if value is None:
+                        self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+                    else:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, NULL)",
+                            (namespace, key, json.dumps(value))
+                        )
+                self._writes += 1
+                self._conn.commit()
+                return True
+            except BaseException:
+                self._conn.rollback()
+                raise
+
+
+def create_state_backend() -> StateBackend:
+    if settings.STATE_BACKEND == "sqlite":
+        try:
+            return SqliteStateBackend(settings.STATE_DB_PATH)
+        except Exception as e:
+            logger.warning(f"SQLite state backend unavailable ({e}); falling back to in-memory state")
+    elif settings.STATE_BACKEND != "memory":
+        logger.warning(f"Unknown STATE_BACKEND '{settings.STATE_BACKEND}'; using in-memory state")
+    return InMemoryStateBackend()
+
+
+state_backend = create_state_backend()
@@ -1,13 +1,23 @@
 
 import logging
 import os
+import time
+import asyncio
 import tempfile
 import io
-from telegram import Update
+from typing import Dict, Optional
+from telegram import Update, InputMediaPhoto
+from telegram.constants import ParseMode
+from telegram.error import BadRequest
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters
 from app.core.config import settings
 from app.agent.graph import agent_app
 from app.interface.utils import media_processor
+from app.interface.crawler import is_sitemap_url
+from app.core.executors import run_io
+from app.core.metrics import metrics
+from app.core.scheduler import job_scheduler, JobClass
+from app.core.job_store import job_store
 
 logger = logging.getLogger(__name__)
 
@@ -16,20 +26,25 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         f"Hola {user_first_name}! Soy Telegram Brain Agent.\n"
         "Puedo responder preguntas basándome EXCLUSIVAMENTE en mi base de conocimientos.\n"
-        "Envíame texto, audio o imágenes."
+        "Envíame texto, audio o imágenes.\n"
+        "Usa /crawl <url> para guardar un sitio web completo."
     )
 
 
 
 # Import renderer
-from app.utils.renderer import render_latex_to_image
+from app.utils.renderer import render_latex_batch
+from app.utils.latex_cache import LatexRenderCache
+from app.interface.reply_planner import plan_reply, equation_caption, TextStep, AlbumStep, TELEGRAM_MESSAGE_LIMIT
 import re
 
-async def send_response_with_latex(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+# Repeated equations cost no render time (PNG cache) and no upload (Telegram file_id)
+latex_cache = LatexRenderCache(settings.LATEX_CACHE_DIR, settings.LATEX_CACHE_MEMORY_MAX_BYTES)
+
+def split_response_parts(text: str):
     """
-    Parses text for LaTeX blocks, renders them as images, and sends the message parts in order.
-    Supports $$...$$ for display math. Inline math $...$ is kept as text or could be rendered too.
-    For simplicity, we split by $$...$$.
+    Splits an answer into ordered (kind, content, raw_part) tuples where kind is
+    'text', 'math_simple' (sent as italic text) or 'math_complex' (rendered as image).
     """
     # Regex to split by $$...$$, \[...\], or \(...\)
     # Group 1 captures the content including delimiters
@@ -39,6 +54,7 @@ async def send_response_with_latex(update: Update, context: ContextTypes.DEFAULT
     # 3. \(...\) (Inline - we will render this too for visual clarity)
     parts = re.split(r'(\$\$[\s\S]*?\$\$|\\\[[\s\S]*?\\\]|\\\(.*?\\\))', text)
     
+    result = []
     for part in parts:
         if not part.strip():
             continue
@@ -58,55 +74,230 @@ async def send_response_with_latex(update: Update, context: ContextTypes.DEFAULT
             content = part
 
         if not is_latex:
-            # Text part
-            await update.message.reply_text(part.strip())
+            result.append(("text", part.strip(), part))
+            continue
+        
+        # LaTeX part - Apply "Smart Filter"
+        # If the expression is too simple (just a variable "x" or "K"), rendering it as an image is spammy.
+        # Criteria for Image:
+        # 1. Contains LaTeX commands ('\')
+        # 2. Contains math operators ('=', '^', '_')
+        # 3. Is reasonably long (> 15 chars)
+        
+        # remove spaces for length check
+        compact = content.replace(" ", "")
+        is_complex = (
+            "\\" in content or 
+            "=" in content or 
+            "^" in content or 
+            "_" in content or
+            "{" in content or
+            len(compact) > 15
+        )
+        result.append(("math_complex" if is_complex else "math_simple", content, part))
+    return result
+
+
+async def render_missing_equations(equations) -> Dict[str, Exception]:
+    """
+    Renders the equations that have neither a cached file_id nor cached PNG,
+    in parallel in the process pool, storing results in the cache.
+    Returns the render errors by equation.
+    """
+    pending = []
+    for content in equations:
+        if content not in pending and not latex_cache.has_file_id(content) and not latex_cache.has_png(content):
+            pending.append(content)
+    errors = {}
+    if not pending:
+        return errors
+    results = await render_latex_batch(pending)
+    for content, result in zip(pending, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error rendering LaTeX: {result}")
+            errors[content] = result
         else:
-            # LaTeX part - Apply "Smart Filter"
-            # If the expression is too simple (just a variable "x" or "K"), rendering it as an image is spammy.
-            # Criteria for Image:
-            # 1. Contains LaTeX commands ('\')
-            # 2. Contains math operators ('=', '^', '_')
-            # 3. Is reasonably long (> 15 chars)
-            
-            # remove spaces for length check
-            compact = content.replace(" ", "")
-            is_complex = (
-                "\\" in content or 
-                "=" in content or 
-                "^" in content or 
-                "_" in content or
-                "{" in content or
-                len(compact) > 15
-            )
-            
-            if not is_complex:
-                # It's simple (e.g. "K" or "x"). Just send as text bolded or code to stand out slightly, or just plain.
-                # Let's use Italic for math variables which is standard.
-                await update.message.reply_text(f"_{content}_", parse_mode='Markdown')
+            latex_cache.put_png(content, result)
+    return errors
+
+
+async def send_equation_album(update: Update, step: AlbumStep, render_task: "asyncio.Task"):
+    """
+    Sends a run of equations as one album (or one photo), reusing Telegram
+    file_ids where known. Equations that failed to render are sent as raw text.
+    """
+    errors = await render_task
+    equations = [(content, raw) for content, raw in step.equations if content not in errors]
+    
+    for use_file_ids in (True, False):
+        if not use_file_ids:
+            # A cached file_id was rejected: forget them and upload bytes instead
+            for content, _ in equations:
+                latex_cache.forget_file_id(content)
+            errors.update(await render_missing_equations([content for content, _ in equations]))
+            equations = [(content, raw) for content, raw in equations if content not in errors]
+        
+        items = []  # (content, media, uploaded)
+        for content, _ in equations:
+            file_id = latex_cache.get_file_id(content) if use_file_ids else None
+            if file_id:
+                items.append((content, file_id, False))
+            else:
+                png = latex_cache.get_png(content)
+                if png is not None:
+                    items.append((content, png, True))
+        if not items:
+            break
+        
+        try:
+            if len(items) == 1:
+                content, media, _ = items[0]
+                sent = [await update.message.reply_photo(photo=media, caption=equation_caption(content))]
+            else:
+                sent = await update.message.reply_media_group(media=[
+                    InputMediaPhoto(media=media, caption=equation_caption(content))
+                    for content, media, _ in items
+                ])
+        except Exception as e:
+            if use_file_ids and any(not uploaded for _, _, uploaded in items):
+                logger.warning(f"Cached file_id rejected, re-uploading equations: {e}")
+                continue
+            raise
+        
+        for (content, _, uploaded), message in zip(items, sent):
+            if uploaded and message.photo:
+                # Largest size is what we uploaded; remember it for next time
+                latex_cache.set_file_id(content, message.photo[-1].file_id)
+        break
+    
+    for content, raw in step.equations:
+        if content in errors:
+            # Fallback: Send raw
+            await update.message.reply_text(f"Error renderizando ecuación:\n{raw}")
+
+
+async def send_response_with_latex(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, draft_message=None):
+    """
+    Parses text for LaTeX blocks, renders them as images, and sends the answer with as
+    few API calls as possible: adjacent text is merged (up to 4096 chars) and runs of
+    equations go out as one album. Renders start up front and overlap with the sends.
+    If draft_message (a streamed preview) is given, it becomes the first text message.
+    """
+    steps = plan_reply(split_response_parts(text))
+    
+    if draft_message is not None:
+        if steps and isinstance(steps[0], TextStep):
+            try:
+                await draft_message.edit_text(steps[0].html_text, parse_mode=ParseMode.HTML)
+                steps = steps[1:]
+            except BadRequest as e:
+                # "Message is not modified" means the draft already shows this text
+                if "not modified" in str(e).lower():
+                    steps = steps[1:]
+                else:
+                    logger.warning(f"Could not finalize streamed draft: {e}")
+                    await draft_message.delete()
+        else:
+            # Answer starts with an equation: drop the draft and send in order
+            await draft_message.delete()
+    
+    # Kick off rendering for every album now; earlier messages are sent meanwhile
+    render_tasks = {
+        id(step): asyncio.create_task(render_missing_equations([content for content, _ in step.equations]))
+        for step in steps if isinstance(step, AlbumStep)
+    }
+    
+    try:
+        for step in steps:
+            if isinstance(step, TextStep):
+                await update.message.reply_text(step.html_text, parse_mode=ParseMode.HTML)
             else:
-                # Complex -> Render
                 try:
-                    msg = await update.message.reply_text("📐 Renderizando ecuación...")
-                    image_buffer = render_latex_to_image(content)
-                    await update.message.reply_photo(photo=image_buffer)
-                    await context.bot.delete_message(chat_id=update.effective_chat.id, message_id=msg.message_id)
+                    await send_equation_album(update, step, render_tasks[id(step)])
                 except Exception as e:
-                    logger.error(f"Error rendering LaTeX: {e}")
-                    # Fallback: Send raw
-                    await update.message.reply_text(f"Error renderizando ecuación:\n{part}")
+                    logger.error(f"Error sending equations: {e}")
+                    raw_equations = "\n".join(raw for _, raw in step.equations)
+                    await update.message.reply_text(f"Error renderizando ecuación:\n{raw_equations}")
+    finally:
+        for task in render_tasks.values():
+            task.cancel()
+
+
+def observe_rag_latency(name: str, state: Dict, seconds: float):
+    """Records the metric overall and per route (rag.total.direct vs rag.total.reformulated)."""
+    metrics.observe(name, seconds)
+    if state.get("rag_route"):
+        metrics.observe(f"{name}.{state['rag_route']}", seconds)
+
+
+async def answer_question(update: Update, context: ContextTypes.DEFAULT_TYPE, inputs: Dict) -> str:
+    """
+    Runs the RAG graph and delivers the answer. With STREAM_ANSWERS, tokens from
+    'generate' are streamed into one message that is edited at most every
+    STREAM_EDIT_INTERVAL_SECONDS; LaTeX is rendered once streaming finishes.
+    Returns the final answer. Records time-to-first-token and total latency.
+    """
+    start = time.perf_counter()
+    if not settings.STREAM_ANSWERS:
+        response = await agent_app.ainvoke(inputs)
+        final_answer = response.get("final_answer", "Error al generar respuesta.")
+        observe_rag_latency("rag.total", response, time.perf_counter() - start)
+        await send_response_with_latex(update, context, final_answer)
+        return final_answer
+    
+    draft = None
+    first_token_at = None
+    streamed = ""
+    shown = ""
+    last_edit = 0.0
+    final_state = {}
+    
+    async for mode, payload in agent_app.astream(inputs, stream_mode=["messages", "values"]):
+        if mode == "values":
+            final_state = payload
+            continue
+        
+        chunk, meta = payload
+        if meta.get("langgraph_node") != "generate" or not isinstance(chunk.content, str) or not chunk.content:
+            continue
+        streamed += chunk.content
+        
+        now = time.perf_counter()
+        if draft is None:
+            first_token_at = now
+        elif now - last_edit < settings.STREAM_EDIT_INTERVAL_SECONDS:
+            continue
+        
+        # Preview as plain text with a cursor; the final edit applies formatting
+        preview = streamed[: TELEGRAM_MESSAGE_LIMIT - 2] + " ▌"
+        if preview == shown:
+            continue
+        try:
+            if draft is None:
+                draft = await update.message.reply_text(preview)
+            else:
+                await draft.edit_text(preview)
+            shown = preview
+        except Exception as e:
+            logger.warning(f"Streaming edit failed: {e}")
+        last_edit = time.perf_counter()
+    
+    final_answer = final_state.get("final_answer") or "Error al generar respuesta."
+    if first_token_at is not None:
+        observe_rag_latency("rag.time_to_first_token", final_state, first_token_at - start)
+    observe_rag_latency("rag.total", final_state, time.perf_counter() - start)
+    await send_response_with_latex(update, context, final_answer, draft_message=draft)
+    return final_answer
 
 
-# Import global task registry
-from app.core.global_state import task_registry
+# Import global task registry and chat history (shared by all workers)
+from app.core.global_state import task_registry, chat_history
+from app.agent.summarizer import history_summarizer
 
 
 # Import for messages
 from langchain_core.messages import HumanMessage, AIMessage
 
-# Global dictionary for chat history
-# chat_id -> List[BaseMessage]
-user_chat_history = {}  
-
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_text = update.message.text
     chat_id = update.effective_chat.id
@@ -128,7 +319,11 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Error al guardar la nota.")
         return
 
-    # 2. Check for URL
+    # 2. Check for URL (a sitemap URL starts a site crawl)
+    if user_text.strip().startswith("http") and is_sitemap_url(user_text.strip()):
+        await start_crawl(update, context, user_text.strip())
+        return
+    
     if user_text.strip().startswith("http"):
         await context.bot.send_chat_action(chat_id=chat_id, action="typing")
         try:
@@ -148,14 +343,11 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # 3. Regular RAG Query with Memory
     await context.bot.send_chat_action(chat_id=chat_id, action="typing")
     
-    # Get History
-    if chat_id not in user_chat_history:
-        user_chat_history[chat_id] = []
-        
-    history = user_chat_history[chat_id]
+    # Get History (may have been written by another worker)
+    history = await run_io(chat_history.get, chat_id)
     
     # Check for active background task in Global Registry
-    current_status = task_registry.get(str(chat_id))
+    current_status = await run_io(task_registry.get, str(chat_id))
     final_question = user_text
     
     if current_status:
@@ -167,28 +359,37 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # We pass 'messages' which LangGraph will append to its state. 
         # Note: We manually manage the persistence here for simplicity.
         
-        response = await agent_app.ainvoke({
-            "question": final_question,
-            "messages": history
-        })
-        final_answer = response.get("final_answer", "Error al generar respuesta.")
-        
-        # Update History
-        history.append(HumanMessage(content=user_text))
-        history.append(AIMessage(content=final_answer))
-        
-        # Keep last 10 messages (5 turns)
-        if len(history) > 10:
-            user_chat_history[chat_id] = history[-10:]
+        # Streams the answer and renders LaTeX once it is complete.
+        # Questions have priority over ingestion jobs in the scheduler.
+        history_summary = await run_io(chat_history.get_summary, chat_id)
+        async with job_scheduler.slot(chat_id, JobClass.INTERACTIVE):
+            final_answer = await answer_question(update, context, {
+                "question": final_question,
+                "messages": history,
+                "history_summary": history_summary
+            })
         
-        # Use the new LaTeX aware sender
-        await send_response_with_latex(update, context, final_answer)
+        # Update History (the store keeps the last 10 messages, 5 turns)
+        await run_io(chat_history.append, chat_id, HumanMessage(content=user_text), AIMessage(content=final_answer))
+        # Reply already sent: fold older turns into the running summary off the critical path
+        history_summarizer.schedule(chat_id)
         
     except Exception as e:
         logger.error(f"Error executing agent: {e}", exc_info=True)
         await update.message.reply_text("Hubo un error procesando tu solicitud.")
 
 
+def queue_position_reporter(bot, chat_id: int, message_id: int, label: str):
+    """Shows a queued ingestion job's position in its status message and in the task registry."""
+    async def report(position: int):
+        await run_io(task_registry.set, str(chat_id), f"Queued: {label} (position {position} in the ingestion queue)")
+        try:
+            await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=f"⏳ En cola: {label} (posición {position})...")
+        except BadRequest:
+            pass
+    return report
+
+
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     document = update.message.document
@@ -202,30 +403,47 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # 1. Immediate Feedback (ACK)
     status_msg = await update.message.reply_text(f"⏳ Iniciando procesamiento de: {document.file_name} en segundo plano...")
     
-    # 2. Launch Background Task
+    # 2. Queue Background Task
+    # The job is persisted first, so it survives an instance restart.
+    job_id = await run_io(job_store.create, chat_id, "pdf", document.file_name, file_id=document.file_id, message_id=status_msg.message_id)
     # We pass 'context.bot' which is safe to use.
-    import asyncio
-    asyncio.create_task(
-        process_document_background(
-            chat_id=chat_id, 
-            file_id=document.file_id, 
-            file_name=document.file_name, 
-            bot=context.bot, 
-            message_id_to_edit=status_msg.message_id
-        )
-    )
+    queue_document_job(context.bot, chat_id, document.file_id, document.file_name, status_msg.message_id, job_id)
     # 3. Return immediately to satisfy Webhook logic
     return 
 
 
-async def process_document_background(chat_id: int, file_id: str, file_name: str, bot, message_id_to_edit: int):
+def queue_document_job(bot, chat_id: int, file_id: str, file_name: str, message_id: int, job_id: Optional[str] = None):
+    # The scheduler caps concurrent ingestions and lets chats take turns;
+    # the status message shows the queue position.
+    job_scheduler.spawn(
+        chat_id,
+        JobClass.INGESTION,
+        lambda: process_document_background(
+            chat_id=chat_id, 
+            file_id=file_id, 
+            file_name=file_name, 
+            bot=bot, 
+            message_id_to_edit=message_id,
+            job_id=job_id
+        ),
+        on_position=queue_position_reporter(bot, chat_id, message_id, file_name)
+    )
+
+
+async def process_document_background(chat_id: int, file_id: str, file_name: str, bot, message_id_to_edit: int,
+                                      job_id: Optional[str] = None):
     """
     Background task to process the document without blocking the webhook.
+    With a job_id, progress is checkpointed in the job store: if the instance
+    dies, the job is picked up again (re-downloaded from its file_id) and
+    resumes after the last stored chunk.
     """
     try:
+        if job_id:
+            await run_io(job_store.mark_running, job_id)
         # Set status
         task_id = str(chat_id)
-        task_registry[task_id] = f"Downloading {file_name}..."
+        await run_io(task_registry.set, task_id, f"Downloading {file_name}...")
         
         # 1. Download
         await bot.edit_message_text(chat_id=chat_id, message_id=message_id_to_edit, text=f"⬇️ Descargando {file_name}...")
@@ -235,16 +453,20 @@ async def process_document_background(chat_id: int, file_id: str, file_name: str
             temp_path = temp_pdf.name
             
         # 2. Ingest
-        task_registry[task_id] = f"Extracting text from {file_name}..."
+        await run_io(task_registry.set, task_id, f"Extracting text from {file_name}...")
         await bot.edit_message_text(chat_id=chat_id, message_id=message_id_to_edit, text=f"🧠 Ingiriendo contenido en la base de conocimientos...")
         
         response = await agent_app.ainvoke({
             "question": "Ingest PDF",
             "file_path": temp_path,
             "media_type": "pdf",
+            "source_name": file_name,
+            "job_id": job_id,
             "task_id": task_id # Pass ID down the graph
         })
         final_answer = response.get("final_answer")
+        if job_id:
+            await run_io(job_store.finish, job_id)
         
         # 4. Final Result
         await bot.delete_message(chat_id=chat_id, message_id=message_id_to_edit)
@@ -252,12 +474,13 @@ async def process_document_background(chat_id: int, file_id: str, file_name: str
         
     except Exception as e:
         logger.error(f"Error in background processing: {e}", exc_info=True)
+        if job_id:
+            await run_io(job_store.finish, job_id, error=str(e))
         await bot.edit_message_text(chat_id=chat_id, message_id=message_id_to_edit, text=f"❌ Error al procesar {file_name}: {str(e)}")
     finally:
         # Clear status
         task_id = str(chat_id)
-        if task_id in task_registry:
-            del task_registry[task_id]
+        await run_io(task_registry.pop, task_id, None)
             
         # Clean up temp file
         if 'temp_path' in locals() and os.path.exists(temp_path):
@@ -267,6 +490,96 @@ async def process_document_background(chat_id: int, file_id: str, file_name: str
                 pass
 
 
+async def handle_crawl(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/crawl <url>: ingests a whole site (same domain) instead of a single page."""
+    if not context.args or not context.args[0].startswith("http"):
+        await update.message.reply_text("Uso: /crawl <url del sitio o del sitemap.xml>")
+        return
+    await start_crawl(update, context, context.args[0])
+
+
+async def start_crawl(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str):
+    chat_id = update.effective_chat.id
+    # Crawls take minutes: ACK now and report progress through the task registry
+    status_msg = await update.message.reply_text(f"⏳ Rastreando {url} en segundo plano...")
+    job_id = await run_io(job_store.create, chat_id, "crawl", url, message_id=status_msg.message_id)
+    queue_crawl_job(context.bot, chat_id, url, status_msg.message_id, job_id)
+
+
+def queue_crawl_job(bot, chat_id: int, url: str, message_id: int, job_id: Optional[str] = None):
+    job_scheduler.spawn(
+        chat_id,
+        JobClass.INGESTION,
+        lambda: process_crawl_background(
+            chat_id=chat_id,
+            url=url,
+            bot=bot,
+            message_id_to_edit=message_id,
+            job_id=job_id
+        ),
+        on_position=queue_position_reporter(bot, chat_id, message_id, url)
+    )
+
+
+async def process_crawl_background(chat_id: int, url: str, bot, message_id_to_edit: int, job_id: Optional[str] = None):
+    # Crawl order isn't deterministic, so a resumed crawl starts over; pages
+    # already stored are detected as duplicates and cost no embeddings.
+    task_id = str(chat_id)
+    try:
+        if job_id:
+            await run_io(job_store.mark_running, job_id)
+        await run_io(task_registry.set, task_id, f"Starting crawl of {url}...")
+        response = await agent_app.ainvoke({
+            "question": "Crawl site",
+            "url": url,
+            "media_type": "crawl",
+            "task_id": task_id
+        })
+        final_answer = response.get("final_answer")
+        if job_id:
+            await run_io(job_store.finish, job_id)
+        await bot.delete_message(chat_id=chat_id, message_id=message_id_to_edit)
+        await bot.send_message(chat_id=chat_id, text=final_answer)
+    except Exception as e:
+        logger.error(f"Error crawling {url}: {e}", exc_info=True)
+        if job_id:
+            await run_io(job_store.finish, job_id, error=str(e))
+        await bot.edit_message_text(chat_id=chat_id, message_id=message_id_to_edit, text=f"❌ Error al rastrear {url}: {str(e)}")
+    finally:
+        await run_io(task_registry.pop, task_id, None)
+
+
+async def resume_interrupted_jobs(bot):
+    """Claims ingestion jobs left unfinished by a dead worker and queues them again."""
+    for job in await run_io(job_store.claim_stale, settings.JOB_STALE_SECONDS):
+        chat_id, source = job["chat_id"], job["source"]
+        try:
+            if job["attempts"] >= settings.JOB_MAX_ATTEMPTS:
+                await run_io(job_store.finish, job["id"], error="Too many attempts")
+                await bot.send_message(chat_id=chat_id, text=f"❌ No pude terminar de procesar {source} tras {job['attempts']} intentos.")
+                continue
+            logger.info(f"Resuming {job['kind']} job {job['id']} ({source}) from chunk {job['checkpoint_record']}:{job['checkpoint_chunk']}")
+            status_msg = await bot.send_message(chat_id=chat_id, text=f"🔄 Reanudando el procesamiento de {source} tras un reinicio...")
+            if job["kind"] == "pdf":
+                queue_document_job(bot, chat_id, job["file_id"], source, status_msg.message_id, job["id"])
+            elif job["kind"] == "crawl":
+                queue_crawl_job(bot, chat_id, source, status_msg.message_id, job["id"])
+        except Exception as e:
+            logger.error(f"Could not resume job {job['id']}: {e}", exc_info=True)
+
+
+async def job_maintenance_loop(bot):
+    """Keeps this worker's jobs alive in the job store and adopts orphaned ones (runs for the app's lifetime)."""
+    while True:
+        try:
+            await run_io(job_store.heartbeat)
+            await resume_interrupted_jobs(bot)
+            await run_io(job_store.purge_finished, 7 * 24 * 3600)
+        except Exception as e:
+            logger.error(f"Job maintenance failed: {e}", exc_info=True)
+        await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+
+
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     await context.bot.send_chat_action(chat_id=chat_id, action="typing")
@@ -279,7 +592,7 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await voice_file.download_to_drive(custom_path=temp_audio.name)
             temp_path = temp_audio.name
             
-        transcript = media_processor.transcribe_audio(temp_path)
+        transcript = await run_io(media_processor.transcribe_audio, temp_path)
         
         # Clean up
         try:
@@ -295,11 +608,9 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Query the Agent with the transcript
         await context.bot.send_chat_action(chat_id=chat_id, action="typing")
-        response = await agent_app.ainvoke({"question": transcript})
-        final_answer = response.get("final_answer", "Error al generar respuesta.")
-        
-        # Send formatted response
-        await send_response_with_latex(update, context, final_answer)
+        # Streams and sends the formatted response
+        async with job_scheduler.slot(chat_id, JobClass.INTERACTIVE):
+            await answer_question(update, context, {"question": transcript})
         
     except Exception as e:
         logger.error(f"Error handling voice: {e}")
@@ -333,6 +644,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def create_bot_application() -> ApplicationBuilder:
     application = ApplicationBuilder().token(settings.TELEGRAM_BOT_TOKEN).build()
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("crawl", handle_crawl))
     application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_text))
     application.add_handler(MessageHandler(filters.Document.ALL, handle_document)) 
     application.add_handler(MessageHandler(filters.VOICE, handle_voice))
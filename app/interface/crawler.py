@@ -0,0 +1,256 @@
+import time
+import queue
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+from app.core.config import settings
+from app.core.executors import run_io, run_cpu
+from app.core.global_state import task_registry
+from app.mcp_server.storage import storage
+from app.interface.web_fetcher import web_fetcher, WebFetcher, FetchResult, TEXT_CONTENT_TYPES
+from app.utils.html_text import html_to_text_and_links, parse_sitemap
+
+logger = logging.getLogger(__name__)
+
+SITEMAP_CONTENT_TYPES = ("application/xml", "text/xml", "text/plain")
+# Links that are clearly not HTML pages: don't waste a request on them
+SKIPPED_EXTENSIONS = (
+    ".pdf", ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".css", ".js",
+    ".zip", ".gz", ".tar", ".mp3", ".mp4", ".avi", ".mov", ".doc", ".docx", ".xls",
+    ".xlsx", ".ppt", ".pptx", ".xml", ".json",
+)
+MAX_NESTED_SITEMAPS = 10
+
+_END_OF_STREAM = object()
+
+
+def is_sitemap_url(url: str) -> bool:
+    path = urlparse(url).path.lower()
+    return path.endswith(".xml") and "sitemap" in path
+
+
+def _site_key(url: str) -> str:
+    # example.com and www.example.com are the same site
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class _RecordStream:
+    """
+    Bounded bridge between the async crawler (producer) and the threaded
+    ingestion pipeline in KnowledgeBaseStorage.add_records (consumer).
+    A full queue makes the crawler wait, so fetching never runs far ahead
+    of embedding.
+    """
+
+    def __init__(self, maxsize: int):
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    async def put(self, record: Tuple[str, Dict[str, Any]]):
+        while True:
+            try:
+                self._queue.put_nowait(record)
+                return
+            except queue.Full:
+                await asyncio.sleep(0.05)
+
+    async def close(self):
+        await self.put(_END_OF_STREAM)
+
+    def __iter__(self):
+        while True:
+            record = self._queue.get()
+            if record is _END_OF_STREAM:
+                return
+            yield record
+
+
+class SiteCrawler:
+    """
+    Same-site BFS crawler feeding the streaming ingestion pipeline.
+
+    - At most `concurrency` pages are fetched at once, and requests to the same
+      host are spaced by `delay` seconds (or the robots.txt Crawl-delay if larger).
+    - Starting from a sitemap URL, its pages are ingested without following links.
+    - Each page is parsed in the CPU pool and its text is streamed straight into
+      add_records, so chunks are embedded while the crawl is still running.
+    """
+
+    def __init__(
+        self,
+        fetcher: WebFetcher = web_fetcher,
+        max_pages: int = settings.CRAWL_MAX_PAGES,
+        max_depth: int = settings.CRAWL_MAX_DEPTH,
+        concurrency: int = settings.CRAWL_CONCURRENCY,
+        delay: float = settings.CRAWL_POLITENESS_DELAY_SECONDS,
+    ):
+        self.fetcher = fetcher
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = max(1, concurrency)
+        self.delay = delay
+        self._robots: Dict[str, "asyncio.Future"] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._next_request_at: Dict[str, float] = {}
+
+    async def _load_robots(self, origin: str) -> Optional[RobotFileParser]:
+        try:
+            result = await self.fetcher.fetch(f"{origin}/robots.txt", allowed_types=("text/plain",), conditional=False)
+        except Exception:
+            # No (readable) robots.txt: everything is allowed
+            return None
+        parser = RobotFileParser()
+        parser.parse(result.body.splitlines())
+        return parser
+
+    async def _robots_for(self, url: str) -> Optional[RobotFileParser]:
+        parsed = urlparse(url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        # One shared task per origin, so concurrent workers don't all fetch robots.txt
+        if origin not in self._robots:
+            self._robots[origin] = asyncio.ensure_future(self._load_robots(origin))
+        return await self._robots[origin]
+
+    async def _allowed(self, url: str) -> bool:
+        robots = await self._robots_for(url)
+        return robots is None or robots.can_fetch("*", url)
+
+    async def _wait_for_host(self, url: str):
+        """Politeness: spaces the start of consecutive requests to one host."""
+        host = urlparse(url).netloc
+        lock = self._host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            delay = self.delay
+            robots = await self._robots_for(url)
+            if robots is not None and robots.crawl_delay("*"):
+                delay = max(delay, float(robots.crawl_delay("*")))
+            wait = self._next_request_at.get(host, 0.0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_request_at[host] = time.monotonic() + delay
+
+    async def _fetch(self, url: str, allowed_types, conditional: bool) -> FetchResult:
+        await self._wait_for_host(url)
+        return await self.fetcher.fetch(url, allowed_types=allowed_types, conditional=conditional)
+
+    async def _sitemap_urls(self, sitemap_url: str) -> List[str]:
+        pages: List[str] = []
+        pending = [sitemap_url]
+        visited = set()
+        while pending and len(visited) < MAX_NESTED_SITEMAPS and len(pages) < self.max_pages:
+            current = pending.pop(0)
+            if current in visited:
+                continue
+            visited.add(current)
+            try:
+                result = await self._fetch(current, SITEMAP_CONTENT_TYPES, conditional=False)
+                page_urls, nested = await run_cpu(parse_sitemap, result.body)
+            except Exception as e:
+                logger.warning(f"Could not read sitemap {current}: {e}")
+                continue
+            pages.extend(page_urls)
+            pending.extend(nested)
+        return pages[: self.max_pages]
+
+    async def crawl(self, start_url: str, task_id: Optional[str] = None) -> Dict[str, Any]:
+        site = _site_key(start_url)
+        started = time.perf_counter()
+        stats = {"fetched": 0, "unchanged": 0, "failed": 0, "blocked": 0, "bytes": 0}
+        ingested: List[FetchResult] = []
+        frontier: asyncio.Queue = asyncio.Queue()
+        seen = set()
+
+        async def report():
+            if not task_id:
+                return
+            elapsed = max(time.perf_counter() - started, 1e-6)
+            await run_io(
+                task_registry.set, task_id,
+                f"Crawling {site}: {stats['fetched']} pages fetched "
+                f"({stats['fetched'] / elapsed:.1f} pages/s, {stats['bytes'] / 1024 / elapsed:.0f} KB/s), "
+                f"{frontier.qsize()} queued..."
+            )
+
+        def enqueue(url: str, depth: int):
+            if len(seen) >= self.max_pages or url in seen:
+                return
+            if _site_key(url) != site or urlparse(url).path.lower().endswith(SKIPPED_EXTENSIONS):
+                return
+            seen.add(url)
+            frontier.put_nowait((url, depth))
+
+        # A sitemap lists the pages itself: no link following, and unchanged
+        # pages can be skipped with a conditional request. A BFS crawl needs
+        # every body to discover links, so it always downloads.
+        from_sitemap = is_sitemap_url(start_url)
+        if from_sitemap:
+            for url in await self._sitemap_urls(start_url):
+                enqueue(url, self.max_depth)
+        else:
+            enqueue(start_url, 0)
+
+        stream = _RecordStream(maxsize=settings.INGEST_QUEUE_MAXSIZE)
+        # add_records runs the threaded chunk/embed/upsert pipeline off the event loop
+        pipeline = asyncio.ensure_future(run_io(storage.add_records, iter(stream)))
+
+        async def worker():
+            while True:
+                url, depth = await frontier.get()
+                try:
+                    if not await self._allowed(url):
+                        stats["blocked"] += 1
+                        continue
+                    result = await self._fetch(url, TEXT_CONTENT_TYPES, conditional=from_sitemap)
+                    if result.not_modified:
+                        stats["unchanged"] += 1
+                        continue
+                    stats["fetched"] += 1
+                    stats["bytes"] += len(result.body)
+                    if result.content_type == "text/plain":
+                        text, links = result.body, []
+                    else:
+                        text, links = await run_cpu(html_to_text_and_links, result.body, url)
+                    result.body = ""
+                    if depth < self.max_depth:
+                        for link in links:
+                            enqueue(link, depth + 1)
+                    if text.strip():
+                        await stream.put((text, {"source": url, "type": "url", "crawl": start_url}))
+                        ingested.append(result)
+                except Exception as e:
+                    stats["failed"] += 1
+                    logger.warning(f"Crawl fetch failed for {url}: {e}")
+                finally:
+                    frontier.task_done()
+                    await report()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            # Stop early if the ingestion pipeline dies, instead of crawling for nothing
+            join = asyncio.ensure_future(frontier.join())
+            await asyncio.wait([join, pipeline], return_when=asyncio.FIRST_COMPLETED)
+            join.cancel()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if not pipeline.done():
+                await stream.close()
+
+        summary = await pipeline
+        # Validators are saved only now that the content is in the knowledge base
+        for result in ingested:
+            self.fetcher.remember(result)
+
+        elapsed = time.perf_counter() - started
+        stats.update({
+            "pages": len(ingested),
+            "new": summary["new"],
+            "skipped": summary["skipped"],
+            "seconds": round(elapsed, 1),
+            "pages_per_second": round(stats["fetched"] / elapsed, 2) if elapsed else 0.0,
+        })
+        logger.info(f"Crawl of {start_url} finished: {stats}")
+        return stats
@@ -0,0 +1,114 @@
+"""
+Reply planner: turns a split answer into as few Telegram API calls as possible.
+
+- Adjacent text and simple-math parts are merged into HTML messages of up to
+  Telegram's 4096-character limit.
+- Runs of complex equations become albums (sendMediaGroup, max 10 photos),
+  each photo captioned with its LaTeX source.
+"""
+import html
+from typing import List, Tuple, Union
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+TELEGRAM_CAPTION_LIMIT = 1024
+TELEGRAM_ALBUM_LIMIT = 10
+
+
+class TextStep:
+    def __init__(self, html_text: str):
+        self.html_text = html_text
+
+    def __repr__(self):
+        return f"TextStep({self.html_text!r})"
+
+
+class AlbumStep:
+    def __init__(self, equations: List[Tuple[str, str]]):
+        # (content, raw_part) per equation, in answer order
+        self.equations = equations
+
+    def __repr__(self):
+        return f"AlbumStep({[content for content, _ in self.equations]!r})"
+
+
+Step = Union[TextStep, AlbumStep]
+
+
+def equation_caption(content: str) -> str:
+    if len(content) > TELEGRAM_CAPTION_LIMIT:
+        return content[: TELEGRAM_CAPTION_LIMIT - 1] + "…"
+    return content
+
+
+def _split_long_piece(piece: str, limit: int) -> List[str]:
+    """Splits escaped text longer than `limit` at paragraph, line or word boundaries."""
+    pieces = []
+    while len(piece) > limit:
+        cut = -1
+        for separator in ("\n\n", "\n", " "):
+            cut = piece.rfind(separator, 0, limit)
+            if cut > 0:
+                break
+        if cut <= 0:
+            cut = limit
+            # Never cut inside an HTML entity like &amp;
+            amp = piece.rfind("&", max(0, cut - 8), cut)
+            if amp != -1 and ";" not in piece[amp:cut]:
+                cut = amp
+        pieces.append(piece[:cut])
+        piece = piece[cut:].lstrip()
+    if piece:
+        pieces.append(piece)
+    return pieces
+
+
+def _pack_text(pieces: List[str], limit: int) -> List[str]:
+    """Greedily packs HTML pieces into messages of at most `limit` characters."""
+    messages = []
+    current = ""
+    for piece in pieces:
+        for sub_piece in _split_long_piece(piece, limit):
+            if len(current) + len(sub_piece) > limit:
+                if current.strip():
+                    messages.append(current.strip())
+                current = ""
+            current += sub_piece
+    if current.strip():
+        messages.append(current.strip())
+    return messages
+
+
+def plan_reply(parts: List[Tuple[str, str, str]], limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[Step]:
+    """
+    parts: (kind, content, raw_part) tuples from split_response_parts, where
+    kind is 'text', 'math_simple' or 'math_complex'.
+    """
+    steps: List[Step] = []
+    text_pieces: List[str] = []
+    equations: List[Tuple[str, str]] = []
+
+    def flush_text():
+        if text_pieces:
+            steps.extend(TextStep(message) for message in _pack_text(text_pieces, limit))
+            text_pieces.clear()
+
+    def flush_equations():
+        for i in range(0, len(equations), TELEGRAM_ALBUM_LIMIT):
+            steps.append(AlbumStep(equations[i : i + TELEGRAM_ALBUM_LIMIT]))
+        equations.clear()
+
+    for kind, content, raw in parts:
+        if kind == "math_complex":
+            flush_text()
+            equations.append((content, raw))
+        else:
+            flush_equations()
+            if kind == "math_simple":
+                # Italic for math variables which is standard
+                text_pieces.append(f"<i>{html.escape(content)}</i>")
+            else:
+                # Keep the original spacing so merged fragments read naturally
+                text_pieces.append(html.escape(raw))
+    flush_text()
+    flush_equations()
+    return steps
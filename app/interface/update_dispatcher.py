@@ -0,0 +1,159 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from telegram import Update
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.executors import run_io
+from app.core.state_backend import StateBackend, state_backend
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDispatcher:
+    """
+    Decouples the webhook from update processing.
+
+    The webhook only validates and enqueues; a pool of async workers runs the
+    handlers. Updates of one chat are processed strictly in arrival order (a
+    chat is never handled by two workers at once), while different chats run
+    in parallel. Chats take turns: after each update a busy chat goes to the
+    back of the line, so one chat with a backlog can't starve the rest.
+
+    Telegram re-delivers updates it considers failed or slow; update_ids are
+    recorded in the shared state backend, so a retry is dropped even when it
+    reaches a different uvicorn worker.
+    """
+
+    DEDUP_NAMESPACE = "telegram_update"
+
+    def __init__(
+        self,
+        application,
+        workers: int = settings.UPDATE_WORKERS,
+        max_pending: int = settings.UPDATE_QUEUE_MAXSIZE,
+        backend: StateBackend = state_backend,
+    ):
+        self.application = application
+        self.num_workers = max(1, workers)
+        self.max_pending = max_pending
+        self.backend = backend
+        # chat key -> updates waiting, with their enqueue time
+        self._pending: Dict[Any, Deque[Tuple[Update, float]]] = {}
+        # Chats with pending updates that no worker is handling right now
+        self._ready: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._pending_count = 0
+        # Submits waiting on the dedup check
+        self._reserved = 0
+        self._in_flight = 0
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.failed = 0
+
+    @staticmethod
+    def _chat_key(update: Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        # Updates without a chat have nothing to be ordered with
+        return f"update:{update.update_id}"
+
+    def start(self):
+        # PTB catches handler exceptions itself and hands them to error handlers
+        self.application.add_error_handler(self._on_error)
+        self._ready = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"update-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        logger.info(f"Update dispatcher started with {self.num_workers} workers")
+
+    async def submit(self, update: Update) -> bool:
+        """
+        Enqueues an update. Returns False if it is a duplicate delivery.
+        Raises OverflowError when the queue is full; the update is not marked
+        as seen, so Telegram's retry will be accepted later.
+        """
+        if self._pending_count + self._reserved >= self.max_pending:
+            self.rejected += 1
+            raise OverflowError("Update queue is full")
+
+        # The dedup mark is a shared-backend write: keep it off the event loop.
+        # The slot is reserved meanwhile so concurrent submits can't overfill the queue.
+        self._reserved += 1
+        try:
+            added = await run_io(self.backend.add, self.DEDUP_NAMESPACE, str(update.update_id), True,
+                                 ttl_seconds=settings.UPDATE_DEDUP_TTL_SECONDS)
+        finally:
+            self._reserved -= 1
+        if not added:
+            self.duplicates += 1
+            logger.info(f"Dropping duplicate update {update.update_id}")
+            return False
+
+        key = self._chat_key(update)
+        queue = self._pending.get(key)
+        if queue is None:
+            # Chat was idle: make it available to the workers
+            queue = self._pending[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append((update, time.perf_counter()))
+        self._pending_count += 1
+        self.accepted += 1
+        return True
+
+    async def _on_error(self, update: object, context):
+        self.failed += 1
+        update_id = getattr(update, "update_id", None)
+        logger.error(f"Error processing update {update_id}: {context.error}", exc_info=context.error)
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._pending[key]
+            update, enqueued_at = queue.popleft()
+            self._pending_count -= 1
+            self._in_flight += 1
+            metrics.observe("webhook.queue_wait", time.perf_counter() - enqueued_at)
+            try:
+                await self.application.process_update(update)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Handler errors go to _on_error; this is PTB itself failing
+                self.failed += 1
+                logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self._in_flight -= 1
+                if queue:
+                    # More updates from this chat: back of the line
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+
+    async def stop(self, timeout: float = settings.UPDATE_SHUTDOWN_GRACE_SECONDS):
+        """Waits up to `timeout` for queued updates to finish, then cancels the workers."""
+        deadline = time.monotonic() + timeout
+        while (self._pending_count or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._pending_count or self._in_flight:
+            logger.warning(f"Shutting down with {self._pending_count} queued and {self._in_flight} running updates")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._workers),
+            "queued": self._pending_count,
+            "in_flight": self._in_flight,
+            "chats_waiting": len(self._pending),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
@@ -1,11 +1,14 @@
 
 import logging
 import io
-import httpx
-from bs4 import BeautifulSoup
-from pypdf import PdfReader
+from collections import deque
+from typing import Iterator, Optional, Tuple
 from openai import OpenAI
 from app.core.config import settings
+from app.core.executors import cpu_executor, run_cpu
+from app.utils.pdf_extractor import count_pages, extract_page_range
+from app.utils.html_text import html_to_text
+from app.interface.web_fetcher import web_fetcher, FetchResult
 
 logger = logging.getLogger(__name__)
 
@@ -76,46 +79,72 @@ class MediaProcessor:
             logger.error(f"Error describing image with GPT-4o: {e}")
             return "Hubo un error al analizar la imagen."
 
+    def count_pdf_pages(self, file_path: str) -> int:
+        try:
+            return count_pages(file_path)
+        except Exception as e:
+            logger.error(f"Error reading PDF: {e}")
+            return 0
+
+    def iter_pdf_pages(self, file_path: str, total_pages: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """
+        Yields (page_number, text) in page order. Page ranges of
+        PDF_PAGES_PER_TASK pages are parsed in parallel in the shared CPU
+        process pool, with a bounded number of ranges in flight so memory
+        stays flat. Pass `total_pages` if the caller already counted them,
+        so the PDF isn't opened again just for that.
+        """
+        if total_pages is None:
+            total_pages = self.count_pdf_pages(file_path)
+        if not total_pages:
+            return
+        
+        step = max(1, settings.PDF_PAGES_PER_TASK)
+        max_in_flight = cpu_executor.max_workers * 2
+        in_flight = deque()
+        for start in range(0, total_pages, step):
+            in_flight.append(cpu_executor.submit(extract_page_range, file_path, start, start + step))
+            if len(in_flight) >= max_in_flight:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
     def extract_text_from_pdf(self, file_path: str) -> str:
         """
         Extracts text from a PDF file using pypdf.
         """
         try:
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            return "".join(text + "\n" for _, text in self.iter_pdf_pages(file_path))
         except Exception as e:
             logger.error(f"Error extracting PDF text: {e}")
             return ""
 
-    async def scrape_url(self, url: str) -> str:
+    async def scrape_url(self, url: str) -> FetchResult:
         """
-        Scrapes text content from a URL using httpx and BeautifulSoup.
+        Scrapes text content from a URL using the shared pooled client and BeautifulSoup.
+        Returns a FetchResult whose .text holds the extracted text; if the page is
+        unchanged since it was last ingested (HTTP 304), .not_modified is set and
+        nothing is downloaded or parsed.
         """
         try:
-            async with httpx.AsyncClient(follow_redirects=True, timeout=10.0) as client:
-                response = await client.get(url)
-                response.raise_for_status()
-                
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Remove scripts and styles
-            for script in soup(["script", "style"]):
-                script.extract()
-                
-            text = soup.get_text()
-            
-            # Clean text (remove extra properties)
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
+            result = await web_fetcher.fetch(url)
+            if result.not_modified:
+                return result
             
-            return text
+            if result.content_type == "text/plain":
+                result.text = result.body
+            else:
+                # Parsing runs in the CPU process pool, off the event loop
+                result.text = await run_cpu(html_to_text, result.body)
+            result.body = ""
+            return result
         except Exception as e:
             logger.error(f"Error scraping URL {url}: {e}")
-            return ""
+            return FetchResult(url=url, status_code=0)
+
+    def mark_url_ingested(self, result: FetchResult):
+        """Remembers ETag/Last-Modified so re-sending the same URL returns 304."""
+        web_fetcher.remember(result)
 
 import os
 media_processor = MediaProcessor()
@@ -0,0 +1,182 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+import httpx
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Content types we know how to turn into text
+TEXT_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+
+class UnsupportedContentError(Exception):
+    """Raised when a URL points to content we refuse to download (type or size)."""
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status_code: int
+    body: str = ""
+    text: str = ""  # Plain text extracted from body (filled in by the caller)
+    content_type: str = ""
+    not_modified: bool = False
+    truncated: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class HttpValidatorCache:
+    """
+    On-disk store of ETag / Last-Modified per URL (SQLite), used to send
+    conditional requests. Validators are only saved once the content has been
+    ingested, so a 304 always means "already in the knowledge base".
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS validators (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, url: str) -> Dict[str, str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified FROM validators WHERE url = ?", (url,)
+            ).fetchone()
+        headers = {}
+        if row:
+            etag, last_modified = row
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        if not etag and not last_modified:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO validators (url, etag, last_modified, updated_at) VALUES (?, ?, ?, ?)",
+                (url, etag, last_modified, time.time())
+            )
+            self._conn.commit()
+
+
+class WebFetcher:
+    """
+    Long-lived, pooled HTTP client (keep-alive + HTTP/2 when available) with
+    streaming downloads capped at HTTP_MAX_DOWNLOAD_BYTES, content-type gating
+    and conditional requests (ETag / Last-Modified).
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        try:
+            self.validators = HttpValidatorCache(settings.HTTP_CACHE_PATH)
+        except Exception as e:
+            logger.warning(f"HTTP validator cache disabled: {e}")
+            self.validators = None
+        self.requests = 0
+        self.not_modified = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            try:
+                import h2  # noqa: F401
+                http2 = True
+            except ImportError:
+                http2 = False
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                follow_redirects=True,
+                timeout=settings.HTTP_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=60
+                ),
+                headers={"User-Agent": "TelegramBrainAgent/1.0 (+ingestion)"}
+            )
+        return self._client
+
+    async def fetch(self, url: str, allowed_types=TEXT_CONTENT_TYPES, conditional: bool = True) -> FetchResult:
+        headers = self.validators.get(url) if (conditional and self.validators) else {}
+        client = self._get_client()
+        self.requests += 1
+
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                self.not_modified += 1
+                return FetchResult(url=url, status_code=304, not_modified=True)
+            response.raise_for_status()
+
+            content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+            if allowed_types and content_type not in allowed_types:
+                raise UnsupportedContentError(f"Unsupported content type: {content_type or 'unknown'}")
+
+            max_bytes = settings.HTTP_MAX_DOWNLOAD_BYTES
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise UnsupportedContentError(f"Content too large: {declared} bytes (limit {max_bytes})")
+
+            body = bytearray()
+            truncated = False
+            async for data in response.aiter_bytes():
+                body.extend(data)
+                if len(body) > max_bytes:
+                    # Keep what fits and stop downloading
+                    del body[max_bytes:]
+                    truncated = True
+                    logger.warning(f"Download of {url} truncated at {max_bytes} bytes")
+                    break
+
+            encoding = response.charset_encoding or "utf-8"
+            try:
+                text = body.decode(encoding, errors="replace")
+            except LookupError:
+                text = body.decode("utf-8", errors="replace")
+
+            return FetchResult(
+                url=url,
+                status_code=response.status_code,
+                body=text,
+                content_type=content_type,
+                truncated=truncated,
+                etag=response.headers.get("etag"),
+                last_modified=response.headers.get("last-modified")
+            )
+
+    def remember(self, result: FetchResult):
+        """Stores the validators of a fetched URL once its content was ingested."""
+        if self.validators and not result.not_modified and not result.truncated:
+            self.validators.put(result.url, result.etag, result.last_modified)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        return {"requests": self.requests, "not_modified": self.not_modified}
+
+
+web_fetcher = WebFetcher()
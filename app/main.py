@@ -1,10 +1,14 @@
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from telegram import Update
 from app.core.config import settings
-from app.interface.bot import create_bot_application
+from app.interface.bot import create_bot_application, job_maintenance_loop
+from app.core.executors import io_executor, cpu_executor, run_io
+from app.interface.web_fetcher import web_fetcher
+from app.interface.update_dispatcher import UpdateDispatcher
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -13,6 +17,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 ptb_application = create_bot_application()
+update_dispatcher = UpdateDispatcher(ptb_application)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -24,13 +29,16 @@ async def lifespan(app: FastAPI):
     
     await ptb_application.initialize()
     await ptb_application.start()
+    update_dispatcher.start()
+    # Heartbeats for our ingestion jobs + resumes jobs interrupted by a restart
+    job_maintenance = asyncio.create_task(job_maintenance_loop(ptb_application.bot))
     
     # Dynamic Webhook Registration for Cloud Run
     try:
         if settings.TELEGRAM_WEBHOOK_URL:
             webhook_url = f"{settings.TELEGRAM_WEBHOOK_URL}/webhook"
             logger.info(f"Setting webhook to: {webhook_url}")
-            await ptb_application.bot.set_webhook(url=webhook_url)
+            await ptb_application.bot.set_webhook(url=webhook_url, secret_token=settings.TELEGRAM_WEBHOOK_SECRET)
         else:
             logger.warning("TELEGRAM_WEBHOOK_URL not set. Webhook will not be registered automatically.")
     except Exception as e:
@@ -39,21 +47,40 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("Shutting down Telegram Brain Agent...")
+    await update_dispatcher.stop()
+    job_maintenance.cancel()
     await ptb_application.stop()
     await ptb_application.shutdown()
+    await web_fetcher.aclose()
+    io_executor.shutdown()
+    cpu_executor.shutdown()
 
 app = FastAPI(title="Telegram Brain Agent", lifespan=lifespan)
 
 @app.post("/webhook")
 async def telegram_webhook(request: Request):
+    """
+    Validates and enqueues the update, then answers immediately: the handlers
+    run in the dispatcher's workers, so Telegram never waits for a RAG run
+    (and never retries because of it).
+    """
+    if settings.TELEGRAM_WEBHOOK_SECRET and \
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token") != settings.TELEGRAM_WEBHOOK_SECRET:
+        return Response(status_code=403)
     try:
         data = await request.json()
         update = Update.de_json(data, ptb_application.bot)
-        await ptb_application.process_update(update)
-        return {"status": "ok"}
     except Exception as e:
-        logger.error(f"Error in webhook: {e}")
+        # Malformed payloads will never succeed: don't make Telegram retry them
+        logger.error(f"Invalid webhook payload: {e}")
         return {"status": "error"}
+    try:
+        accepted = await update_dispatcher.submit(update)
+    except OverflowError:
+        # Not marked as seen: Telegram will deliver it again later
+        logger.warning(f"Update queue full, asking Telegram to retry update {update.update_id}")
+        return Response(status_code=503)
+    return {"status": "ok" if accepted else "duplicate"}
 
 @app.get("/")
 def health_check():
@@ -76,11 +103,13 @@ async def populate_knowledge_base():
     ]
     
     try:
-        storage.add_documents(
+        # Chunking, embedding and upserts block: run them off the event loop
+        summary = await run_io(
+            storage.add_documents,
             documents=sample_documents,
             metadatas=[{"source": "system_docs", "type": "info"} for _ in sample_documents]
         )
-        return {"status": "success", "message": f"Added {len(sample_documents)} documents to knowledge base"}
+        return {"status": "success", "message": f"Added {len(sample_documents)} documents to knowledge base", "chunks": summary}
     except Exception as e:
         logger.error(f"Error populating KB: {e}", exc_info=True)
         return {"status": "error", "message": str(e)}
@@ -91,12 +120,47 @@ async def test_search(query: str = "¿Qué es el Telegram Brain Agent?"):
     """Test endpoint to verify knowledge base search is working."""
     from app.mcp_server.storage import storage
     try:
-        results = storage.search(query, limit=3)
+        results = await storage.asearch(query, limit=3)
         return {"status": "success", "query": query, "results_count": len(results), "results": results}
     except Exception as e:
         logger.error(f"Error testing search: {e}", exc_info=True)
         return {"status": "error", "message": str(e)}
 
+@app.get("/admin/metrics")
+async def metrics():
+    """Runtime metrics for this worker (caches, counters)."""
+    from app.mcp_server.storage import storage
+    from app.core.executors import executor_stats
+    from app.interface.bot import latex_cache
+    from app.core.metrics import metrics
+    from app.core.scheduler import job_scheduler
+    from app.core.job_store import job_store
+    from app.agent.answer_cache import answer_cache
+    from app.core.llm_cache import llm_cache
+    from app.agent.summarizer import history_summarizer
+    return {
+        "query_embedding_cache": storage.query_embedding_cache.stats(),
+        "embedding_cache": storage.embedding_cache.stats() if storage.embedding_cache else None,
+        "embedding_executor": storage.embedding_executor.stats(),
+        "executors": executor_stats(),
+        "latex_cache": latex_cache.stats(),
+        "latency": metrics.snapshot(),
+        "web_fetcher": web_fetcher.stats(),
+        "update_dispatcher": update_dispatcher.stats(),
+        "scheduler": job_scheduler.stats(),
+        "ingestion_jobs": job_store.stats(),
+        "answer_cache": answer_cache.stats(),
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "history_summarizer": history_summarizer.stats(),
+    }
+
+@app.post("/admin/answer-cache")
+async def toggle_answer_cache(enabled: bool):
+    """Turns the semantic answer cache on/off for every worker (turning it off also empties it)."""
+    from app.agent.answer_cache import answer_cache
+    answer_cache.set_enabled(enabled)
+    return {"status": "ok", "answer_cache": answer_cache.stats()}
+
 @app.get("/admin/debug-agent")
 async def debug_agent(question: str = "Cual es el tamaño de electrón ?"):
     """
@@ -127,13 +191,13 @@ async def debug_agent(question: str = "Cual es el tamaño de electrón ?"):
         
         # 1. Reformulation
         log("Reformulation", "Starting reformulation...")
-        res_ref = nodes.query_reformulation(state)
+        res_ref = await nodes.aquery_reformulation(state)
         state["reformulated_query"] = res_ref["reformulated_query"]
         log("Reformulation", "Done", state["reformulated_query"])
         
         # 2. Retrieval
         log("Retrieval", f"Retrieving for: {state['reformulated_query']}")
-        res_ret = nodes.retrieve(state)
+        res_ret = await nodes.aretrieve(state)
         state["context"] = res_ret["context"]
         log("Retrieval", f"Found {len(state['context'])} docs", state["context"])
         
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache backed by SQLite.
+
+    Key: (embedding model, sha256 of the cleaned chunk text).
+    Value: the embedding as a float32 BLOB.
+    Survives restarts, so re-ingesting the same content costs no API calls.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Returns cached embeddings aligned with `texts` (None for misses)."""
+        hashes = [self.hash_text(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        unique_hashes = list(set(hashes))
+        with self._lock:
+            # SQLite limits the number of host parameters per statement
+            for i in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+
+        results = [found.get(text_hash) for text_hash in hashes]
+        hit_count = sum(1 for r in results if r is not None)
+        self.hits += hit_count
+        self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        rows = [
+            (model, self.hash_text(text), array("f", embedding).tobytes())
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,209 @@
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Optional, TypeVar
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Errors worth retrying: throttling, timeouts, connection drops and 5xx
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parses OpenAI reset headers like '1s', '6m0s', '120ms' into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    number = ""
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch.isdigit() or ch == ".":
+            number += ch
+        elif value.startswith("ms", i):
+            total += float(number or 0) / 1000
+            number = ""
+            i += 1
+        elif ch in "hms":
+            total += float(number or 0) * {"h": 3600, "m": 60, "s": 1}[ch]
+            number = ""
+        i += 1
+    return total
+
+
+class _Bucket:
+    """Token bucket refilled continuously at `limit` units per minute."""
+
+    def __init__(self, limit_per_minute: float):
+        self.capacity = float(limit_per_minute)
+        self.level = float(limit_per_minute)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        rate = self.capacity / 60.0
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.level >= amount:
+            return 0.0
+        rate = self.capacity / 60.0
+        return (amount - self.level) / rate if rate > 0 else 1.0
+
+
+class RateLimiter:
+    """
+    Requests-per-minute + tokens-per-minute limiter.
+
+    Starts from configured limits and follows the provider's
+    x-ratelimit-* response headers, so it adapts to the real account quota.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self._requests = _Bucket(requests_per_minute)
+        self._tokens = _Bucket(tokens_per_minute)
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def acquire(self, tokens: int):
+        """Blocks until one request carrying `tokens` tokens can be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._requests.refill(now)
+                self._tokens.refill(now)
+                # A single request larger than the bucket can never fit; let it through when full
+                tokens_needed = min(tokens, self._tokens.capacity)
+                wait = max(
+                    self._paused_until - now,
+                    self._requests.wait_time(1),
+                    self._tokens.wait_time(tokens_needed),
+                )
+                if wait <= 0:
+                    self._requests.level -= 1
+                    self._tokens.level -= tokens_needed
+                    return
+            time.sleep(min(wait, 5.0))
+
+    def update_from_headers(self, headers):
+        """Adjusts the buckets to the provider's reported limits/remaining quota."""
+        if not headers:
+            return
+        with self._lock:
+            for bucket, kind in ((self._requests, "requests"), (self._tokens, "tokens")):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                try:
+                    if limit is not None:
+                        bucket.capacity = float(limit)
+                    if remaining is not None:
+                        bucket.level = min(bucket.level, float(remaining))
+                except ValueError:
+                    continue
+
+    def pause(self, seconds: float):
+        """Stops all requests for `seconds` (e.g. after a 429 with Retry-After)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class EmbeddingExecutor:
+    """
+    Runs embedding requests concurrently (up to `max_concurrency` in flight),
+    paced by a RateLimiter and retried with exponential backoff + jitter.
+    """
+
+    def __init__(self, client: openai.OpenAI, model: str, max_concurrency: int,
+                 limiter: RateLimiter, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0):
+        # Retries are handled here (so they respect the limiter), not in the SDK
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed")
+        self.requests = 0
+        self.retries = 0
+        self.tokens = 0
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def estimate_tokens(texts: List[str]) -> int:
+        # Rough estimate (~4 chars per token) used for TPM pacing
+        return sum(len(text) // 4 + 1 for text in texts)
+
+    def embed(self, texts: List[str], token_count: Optional[int] = None) -> List[List[float]]:
+        """Embeds one batch, retrying transient failures. Raises once retries are exhausted."""
+        tokens = token_count if token_count is not None else self.estimate_tokens(texts)
+        attempt = 0
+        while True:
+            self.limiter.acquire(tokens)
+            try:
+                raw = self.client.embeddings.with_raw_response.create(input=texts, model=self.model)
+                self.limiter.update_from_headers(raw.headers)
+                response = raw.parse()
+                with self._stats_lock:
+                    self.requests += 1
+                    self.tokens += tokens
+                logger.info(f"Embedding request: {len(texts)} inputs, {tokens} tokens")
+                # Response.data is a list of Embedding objects, ordered by input index
+                return [data.embedding for data in response.data]
+            except RETRYABLE_ERRORS as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.error(f"Embedding batch failed after {self.max_retries} retries: {e}")
+                    raise
+                headers = getattr(getattr(e, "response", None), "headers", None)
+                self.limiter.update_from_headers(headers)
+                delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+                delay = random.uniform(0, delay)  # Full jitter
+                retry_after = _parse_reset(headers.get("retry-after")) if headers else None
+                if retry_after:
+                    delay = max(delay, retry_after)
+                    self.limiter.pause(retry_after)
+                with self._stats_lock:
+                    self.retries += 1
+                logger.warning(f"Embedding request failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def map_ordered(self, fn: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        """
+        Applies fn to items with up to max_concurrency calls in flight, yielding
+        results in input order. Items are pulled lazily from the iterable.
+        """
+        in_flight = deque()
+        for item in items:
+            in_flight.append(self._pool.submit(fn, item))
+            if len(in_flight) >= self.max_concurrency:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "tokens": self.tokens,
+            "avg_tokens_per_request": round(self.tokens / self.requests, 1) if self.requests else 0.0,
+            "max_concurrency": self.max_concurrency,
+        }
@@ -9,7 +9,7 @@ logger = logging.getLogger(__name__)
 mcp = FastMCP("telegram-brain-mcp")
 
 @mcp.tool()
-def search_knowledge_base(query: str) -> str:
+async def search_knowledge_base(query: str) -> str:
     """
     Search the knowledge base for relevant information using semantic search.
     Args:
@@ -18,7 +18,7 @@ def search_knowledge_base(query: str) -> str:
         A formatted string containing relevant document chunks from the database.
     """
     logger.info(f"Received search query: {query}")
-    results = storage.search(query)
+    results = await storage.asearch(query)
     
     if not results:
         return "No relevant information found in the knowledge base."
@@ -1,13 +1,43 @@
 
 import logging
-from typing import List, Dict, Any, Optional
-from qdrant_client import QdrantClient
+import uuid
+import queue
+import itertools
+import threading
+from array import array
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Callable
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from app.core.config import settings
+from app.core.cache import LRUCache
+from app.mcp_server.embedding_cache import EmbeddingCache
+from app.mcp_server.embedding_executor import EmbeddingExecutor, RateLimiter
+from app.mcp_server.token_batching import TokenBatchPacker
 
 logger = logging.getLogger(__name__)
 
+# Namespace for content-addressed point IDs (UUIDv5 over source + chunk hash)
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "telegram-brain-agent/chunks")
+
+# Chunking parameters (characters)
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Documents are split in windows of this many characters so a huge text never
+# has all of its chunks materialized at once
+SPLIT_WINDOW_CHARS = 50_000
+
+# Points per Qdrant upsert request (keeps HTTP bodies well under the server limit)
+UPSERT_BATCH = 256
+
+# Marks the end of a stage's output in the ingestion pipeline
+_END_OF_STREAM = object()
+
+
+class _PipelineAborted(Exception):
+    """Raised inside a pipeline stage when another stage has failed."""
+
 class KnowledgeBaseStorage:
     def __init__(self):
         # Initialize Qdrant Client based on config (Cloud vs Local)
@@ -17,6 +47,11 @@ class KnowledgeBaseStorage:
                 url=settings.QDRANT_URL,
                 api_key=settings.QDRANT_API_KEY
             )
+            # Async twin used by the agent nodes so searches don't block the event loop
+            self.async_client = AsyncQdrantClient(
+                url=settings.QDRANT_URL,
+                api_key=settings.QDRANT_API_KEY
+            )
         else:
             host = settings.QDRANT_HOST or "localhost"
             logger.info(f"Connecting to Qdrant Local at {host}:{settings.QDRANT_PORT}")
@@ -24,6 +59,10 @@ class KnowledgeBaseStorage:
                 host=host,
                 port=settings.QDRANT_PORT
             )
+            self.async_client = AsyncQdrantClient(
+                host=host,
+                port=settings.QDRANT_PORT
+            )
             
         # OpenAI API (For Embeddings)
         import os
@@ -35,8 +74,37 @@ class KnowledgeBaseStorage:
         self.openai_client = OpenAI(
             api_key=openai_key
         )
+        self.async_openai_client = AsyncOpenAI(
+            api_key=openai_key
+        )
         self.collection_name = settings.QDRANT_COLLECTION_NAME
         self.embedding_model = "text-embedding-3-small"
+        # Query embeddings are stored as float32 arrays so the byte budget is exact
+        self.query_embedding_cache = LRUCache(
+            max_bytes=settings.QUERY_EMBEDDING_CACHE_MAX_BYTES,
+            ttl_seconds=settings.QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+            sizeof=lambda vector: vector.itemsize * len(vector)
+        )
+        # Ingestion embedding requests run concurrently, rate limited and retried
+        self.embedding_executor = EmbeddingExecutor(
+            client=self.openai_client,
+            model=self.embedding_model,
+            max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY,
+            limiter=RateLimiter(settings.EMBEDDING_RPM_LIMIT, settings.EMBEDDING_TPM_LIMIT),
+            max_retries=settings.EMBEDDING_MAX_RETRIES
+        )
+        # Embedding requests are packed up to a token budget instead of a fixed count
+        self.batch_packer = TokenBatchPacker(
+            model=self.embedding_model,
+            max_tokens_per_request=settings.EMBEDDING_BATCH_MAX_TOKENS,
+            max_inputs_per_request=settings.EMBEDDING_BATCH_MAX_INPUTS
+        )
+        # Ingestion embeddings are cached on disk by content hash
+        try:
+            self.embedding_cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH)
+        except Exception as e:
+            logger.warning(f"Persistent embedding cache disabled: {e}")
+            self.embedding_cache = None
         self._ensure_collection()
 
     def _ensure_collection(self):
@@ -56,13 +124,48 @@ class KnowledgeBaseStorage:
             logger.error(f"Failed to ensure collection: {e}")
             # In production, we might want to verify connectivity here.
 
+    def _query_cache_key(self, text: str):
+        """Cache key: embedding model + whitespace/case-normalized query text."""
+        return (self.embedding_model, " ".join(text.split()).lower())
+
     def _get_embedding(self, text: str) -> List[float]:
-        """Generates embedding for the given text using OpenAI."""
+        """Generates embedding for the given text using OpenAI (cached per query)."""
+        key = self._query_cache_key(text)
+        cached = self.query_embedding_cache.get(key)
+        if cached is not None:
+            return cached.tolist()
+        
         text = text.replace("\n", " ")
-        return self.openai_client.embeddings.create(
+        embedding = self.openai_client.embeddings.create(
             input=[text], 
             model=self.embedding_model
         ).data[0].embedding
+        self.query_embedding_cache.set(key, array("f", embedding))
+        return embedding
+
+    async def _aget_embedding(self, text: str) -> List[float]:
+        """Async version of _get_embedding (non-blocking for the webhook event loop)."""
+        key = self._query_cache_key(text)
+        cached = self.query_embedding_cache.get(key)
+        if cached is not None:
+            return cached.tolist()
+
+        text = text.replace("\n", " ")
+        response = await self.async_openai_client.embeddings.create(
+            input=[text],
+            model=self.embedding_model
+        )
+        embedding = response.data[0].embedding
+        self.query_embedding_cache.set(key, array("f", embedding))
+        return embedding
+
+    @staticmethod
+    def _hits_to_documents(hits) -> List[str]:
+        documents = []
+        for hit in hits:
+            if hit.payload and "content" in hit.payload:
+                documents.append(hit.payload["content"])
+        return documents
 
     def search(self, query: str, limit: int = 5) -> List[str]:
         """
@@ -78,129 +181,342 @@ class KnowledgeBaseStorage:
                 limit=limit
             ).points
             
-            documents = []
-            for hit in results:
-                if hit.payload and "content" in hit.payload:
-                    documents.append(hit.payload["content"])
-            
-            return documents
+            return self._hits_to_documents(results)
         except Exception as e:
             logger.error(f"Error during search: {e}")
             return []
 
+    async def asearch(self, query: str, limit: int = 5) -> List[str]:
+        """
+        Async version of search. Uses the async OpenAI and Qdrant clients so
+        concurrent chats served by the same worker are not serialized.
+        """
+        hits = await self.asearch_hits(query, limit=limit)
+        return [hit["content"] for hit in hits]
+
+    async def asearch_hits(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Like asearch, but returns one dict per hit with the point id, content,
+        similarity score and full payload.
+        """
+        try:
+            vector = await self._aget_embedding(query)
+
+            response = await self.async_client.query_points(
+                collection_name=self.collection_name,
+                query=vector,
+                limit=limit
+            )
+
+            return [
+                {"id": str(hit.id), "content": hit.payload["content"], "score": hit.score, "payload": hit.payload}
+                for hit in response.points
+                if hit.payload and "content" in hit.payload
+            ]
+        except Exception as e:
+            logger.error(f"Error during async search: {e}")
+            return []
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """Query embedding (served from the query embedding cache after a search)."""
+        return await self._aget_embedding(query)
+
     
-    def _get_batch_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Generates embeddings for a batch of texts using OpenAI."""
+    def _get_batch_embeddings(self, texts: List[str], token_counts: Optional[List[int]] = None) -> List[List[float]]:
+        """
+        Generates embeddings for a batch of texts using OpenAI.
+        Embeddings already in the persistent cache are reused; only misses hit the API.
+        token_counts (aligned with texts) are used to pace the request against the TPM limit.
+        """
         # Clean texts
         cleaned_texts = [text.replace("\n", " ") for text in texts]
         
+        if self.embedding_cache:
+            embeddings = self.embedding_cache.get_many(self.embedding_model, cleaned_texts)
+        else:
+            embeddings = [None] * len(cleaned_texts)
+        
+        miss_indices = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not miss_indices:
+            return embeddings
+        
+        miss_texts = [cleaned_texts[i] for i in miss_indices]
         try:
-            response = self.openai_client.embeddings.create(
-                input=cleaned_texts, 
-                model=self.embedding_model
-            )
-            # Response.data is a list of Embedding objects, ordered by input index
-            return [data.embedding for data in response.data]
+            miss_tokens = sum(token_counts[i] for i in miss_indices) if token_counts else None
+            miss_embeddings = self.embedding_executor.embed(miss_texts, token_count=miss_tokens)
         except Exception as e:
             logger.error(f"Error generating batch embeddings: {e}")
             raise e
+        
+        for i, embedding in zip(miss_indices, miss_embeddings):
+            embeddings[i] = embedding
+        
+        if self.embedding_cache:
+            try:
+                self.embedding_cache.put_many(self.embedding_model, miss_texts, miss_embeddings)
+            except Exception as e:
+                logger.warning(f"Failed to write embedding cache: {e}")
+        
+        logger.info(f"Embedding batch: {len(texts) - len(miss_texts)} cached, {len(miss_texts)} from API")
+        return embeddings
 
     
-    def add_documents(self, documents: List[str], metadatas: List[Dict[str, Any]] = None, task_id: Optional[str] = None):
+    @staticmethod
+    def make_point_id(source: str, chunk: str) -> str:
+        """Deterministic point ID: the same chunk from the same source always maps to the same point."""
+        chunk_hash = EmbeddingCache.hash_text(chunk)
+        return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}:{chunk_hash}"))
+
+    def _existing_point_ids(self, point_ids: List[str]) -> set:
+        """Returns the subset of point_ids already stored in the collection."""
+        try:
+            records = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=point_ids,
+                with_payload=False,
+                with_vectors=False
+            )
+            return {str(record.id) for record in records}
+        except Exception as e:
+            # If the check fails we just re-upsert (IDs are deterministic, so no duplicates)
+            logger.warning(f"Existence check failed, upserting batch anyway: {e}")
+            return set()
+
+    def add_documents(self, documents: List[str], metadatas: List[Dict[str, Any]] = None, task_id: Optional[str] = None) -> Dict[str, int]:
         """
         Adds text documents to the knowledge base with Chunking and Batch Processing.
+        Chunks already stored (same source + same content) are skipped.
         Tracks progress if task_id is provided.
+        Returns a summary: {"new": <chunks added>, "skipped": <duplicate chunks>}.
+        """
+        if metadatas is None:
+            metadatas = itertools.repeat({})
+        return self.add_records(zip(documents, metadatas), task_id=task_id)
+
+    @staticmethod
+    def _iter_windows(text: str, overlap: int = 0) -> Iterator[str]:
+        """
+        Yields the text in ~SPLIT_WINDOW_CHARS pieces, cut at paragraph/line
+        boundaries. Each window repeats the last `overlap` characters of the
+        previous one (from a word start), so chunks keep their overlap across
+        window boundaries too.
+        """
+        start = 0
+        length = len(text)
+        while start < length:
+            end = min(start + SPLIT_WINDOW_CHARS, length)
+            if end < length:
+                cut = text.rfind("\n\n", start, end)
+                if cut <= start:
+                    cut = text.rfind("\n", start, end)
+                if cut > start:
+                    end = cut
+            yield text[start:end]
+            if end >= length:
+                return
+            next_start = end - overlap
+            if overlap and next_start > start:
+                # Don't start the next window mid-word
+                space = text.find(" ", next_start, end)
+                start = space + 1 if space != -1 else next_start
+            else:
+                start = end
+
+    def _iter_chunks(self, records: Iterable[Tuple[str, Dict[str, Any]]], stats: Dict[str, int],
+                     resume_from: Optional[Tuple[int, int]] = None) -> Iterator[Tuple[str, str, Dict[str, Any], int, Tuple[int, int]]]:
+        """
+        Stage 1: lazily splits (text, metadata) records into
+        (point_id, embed_text, payload, token_count, position) items. Repeated
+        chunks inside this run are dropped and counted in stats["repeated"].
+        position is (record index, chunks of that record done once this one is
+        stored): a checkpoint from which a later run can resume. Everything
+        before `resume_from` is skipped without embedding.
         """
         from langchain_text_splitters import RecursiveCharacterTextSplitter
-        import uuid
-        import time
+        
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            separators=["\n\n", "\n", ".", " ", ""]
+        )
+        resume_record, resume_chunk = resume_from or (0, 0)
+        
+        seen_ids = set()
+        for record_index, (doc, meta) in enumerate(records):
+            if record_index < resume_record:
+                continue
+            preview = doc[:200] + "..."
+            chunk_index = 0
+            for window in self._iter_windows(doc, overlap=CHUNK_OVERLAP):
+                for chunk in text_splitter.split_text(window):
+                    chunk_index += 1
+                    if record_index == resume_record and chunk_index <= resume_chunk:
+                        continue
+                    point_id = self.make_point_id(meta.get("source", ""), chunk)
+                    if point_id in seen_ids:
+                        # Same chunk repeated inside this ingestion
+                        stats["repeated"] += 1
+                        continue
+                    seen_ids.add(point_id)
+                    # Store metadata + helpful preview
+                    payload = meta.copy()
+                    payload["content"] = chunk
+                    payload["full_source_preview"] = preview
+                    # Oversized inputs are truncated for embedding only; payload keeps the full chunk
+                    embed_text, tokens = self.batch_packer.fit(chunk.replace("\n", " "))
+                    yield point_id, embed_text, payload, tokens, (record_index, chunk_index)
+
+    def _embed_batch(self, packed) -> Tuple[List[models.PointStruct], int, Tuple[int, int]]:
+        """
+        Stage 2: drops chunks already in the collection, embeds the rest and
+        returns them as Qdrant points, plus the number of chunks skipped and
+        the position of the batch's last chunk.
+        Runs on the embedding executor's worker threads.
+        """
+        batch, _ = packed
+        position = batch[-1][4]
+        existing = self._existing_point_ids([item[0] for item in batch])
+        if existing:
+            batch = [item for item in batch if item[0] not in existing]
+        if not batch:
+            return [], len(existing), position
+        
+        embeddings = self._get_batch_embeddings(
+            [item[1] for item in batch],
+            token_counts=[item[3] for item in batch]
+        )
+        points = [
+            models.PointStruct(id=point_id, vector=embedding, payload=payload)
+            for (point_id, _, payload, _, _), embedding in zip(batch, embeddings)
+        ]
+        return points, len(existing), position
+
+    @staticmethod
+    def _put(q: queue.Queue, item, abort: threading.Event):
+        # Bounded put that gives up if the pipeline was aborted downstream
+        while True:
+            if abort.is_set():
+                raise _PipelineAborted()
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    @staticmethod
+    def _get(q: queue.Queue, abort: threading.Event):
+        while True:
+            if abort.is_set():
+                raise _PipelineAborted()
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+
+    def add_records(self, records: Iterable[Tuple[str, Dict[str, Any]]], task_id: Optional[str] = None,
+                    resume_from: Optional[Tuple[int, int]] = None,
+                    on_checkpoint: Optional[Callable[[Tuple[int, int], int], None]] = None) -> Dict[str, int]:
+        """
+        Streaming ingestion: chunking, embedding and upsert run as stages joined
+        by bounded queues, and each embedded batch is upserted as soon as it is
+        ready. `records` may be a lazy iterable of (text, metadata) pairs (e.g.
+        one per PDF page), so peak memory stays flat regardless of document size
+        and content becomes searchable while the rest is still being processed.
+        
+        After each upsert, on_checkpoint((record, chunk), chunks_added) reports
+        the last stored position; passing it back as `resume_from` with the same
+        records continues an interrupted run without re-embedding anything.
+        """
         # Import registry 
         from app.core.global_state import task_registry
         
-        if metadatas is None:
-            metadatas = [{} for _ in documents]
+        chunk_queue = queue.Queue(maxsize=settings.INGEST_QUEUE_MAXSIZE)
+        point_queue = queue.Queue(maxsize=settings.INGEST_QUEUE_MAXSIZE)
+        abort = threading.Event()
+        errors = []
+        # Each counter is written by a single stage thread
+        stats = {"repeated": 0, "existing": 0}
         
-        # LOG
         if task_id:
              task_registry[task_id] = "Splitting text into chunks..."
-            
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ".", " ", ""]
-        )
-            
-        all_chunks = []
-        all_metadatas = []
-        
-        # 1. Split all documents first
-        for doc, meta in zip(documents, metadatas):
-            chunks = text_splitter.split_text(doc)
-            for chunk in chunks:
-                all_chunks.append(chunk)
-                # Store metadata + helpful preview
-                payload = meta.copy()
-                payload["content"] = chunk
-                payload["full_source_preview"] = doc[:200] + "..." 
-                all_metadatas.append(payload)
-                
-        # 2. Process in batches (OpenAI limit is usually 2048 dims or batch size limits, safe bet is ~100-500)
-        BATCH_SIZE = 100
-        total_chunks = len(all_chunks)
         
-        if task_id:
-            task_registry[task_id] = f"Generating embeddings for {total_chunks} chunks..."
-            
-        logger.info(f"Processing {total_chunks} total chunks in batches of {BATCH_SIZE}...")
+        def chunk_stage():
+            try:
+                chunks = self._iter_chunks(records, stats, resume_from)
+                # Each batch fills one embedding request up to the token/input budget
+                for packed in self.batch_packer.pack(chunks, tokens_of=lambda item: item[3]):
+                    self._put(chunk_queue, packed, abort)
+                self._put(chunk_queue, _END_OF_STREAM, abort)
+            except _PipelineAborted:
+                pass
+            except Exception as e:
+                errors.append(e)
+                abort.set()
         
-        points_to_upsert = []
+        def chunk_batches():
+            while True:
+                batch = self._get(chunk_queue, abort)
+                if batch is _END_OF_STREAM:
+                    return
+                yield batch
         
-        for i in range(0, total_chunks, BATCH_SIZE):
-            # UPDATE STATUS
-            if task_id:
-                 current_batch = i // BATCH_SIZE + 1
-                 total_batches = (total_chunks // BATCH_SIZE) + 1
-                 task_registry[task_id] = f"Embedding Batch {current_batch}/{total_batches} ({i}/{total_chunks} chunks)..."
-            
-            batch_texts = all_chunks[i : i + BATCH_SIZE]
-            batch_metas = all_metadatas[i : i + BATCH_SIZE]
-            
+        def embed_stage():
             try:
-                # Generate embeddings for the whole batch
-                embeddings = self._get_batch_embeddings(batch_texts)
-                
-                # Create points
-                for text, embedding, meta in zip(batch_texts, embeddings, batch_metas):
-                    point_id = str(uuid.uuid4())
-                    points_to_upsert.append(models.PointStruct(
-                        id=point_id,
-                        vector=embedding,
-                        payload=meta
-                    ))
-                
-                logger.info(f"Processed batch {i // BATCH_SIZE + 1}/{(total_chunks // BATCH_SIZE) + 1}")
-                
+                # Several batches are embedded concurrently; results come back in order.
+                # A batch that still fails after retries aborts the whole ingestion
+                # instead of silently dropping its chunks.
+                for points, skipped, position in self.embedding_executor.map_ordered(self._embed_batch, chunk_batches()):
+                    stats["existing"] += skipped
+                    # Batches with nothing new still move the checkpoint forward
+                    self._put(point_queue, (points, position), abort)
+                self._put(point_queue, _END_OF_STREAM, abort)
+            except _PipelineAborted:
+                pass
             except Exception as e:
-                logger.error(f"Failed to process batch starting at index {i}: {e}")
-                # Continue process? Or fail hard? For now fail hard to avoid partial state confusion
-                # But typically we might want to retry.
-                
-        # 3. Upsert to Qdrant (Qdrant handles large batches well, but we can also chunk this upsert if needed)
-        # We can upsert all at once if memory allows, or incrementally. 
-        # For simplicity/safety, let's upsert what we have.
-        if points_to_upsert:
-            if task_id:
-                task_registry[task_id] = f"Upserting {len(points_to_upsert)} vectors to DB..."
-                
-            # We can upsert in chunks of 500 to be safe with HTTP request size
-            UPSERT_BATCH = 100
-            for i in range(0, len(points_to_upsert), UPSERT_BATCH):
-               batch_points = points_to_upsert[i : i + UPSERT_BATCH]
-               self.client.upsert(
-                   collection_name=self.collection_name,
-                   points=batch_points
-               )
-            
-            logger.info(f"Successfully added {len(points_to_upsert)} chunks to Qdrant.")
+                logger.error(f"Embedding stage failed: {e}")
+                errors.append(e)
+                abort.set()
+        
+        workers = [
+            threading.Thread(target=chunk_stage, name="ingest-chunk", daemon=True),
+            threading.Thread(target=embed_stage, name="ingest-embed", daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+        
+        # Stage 3 (this thread): upsert each batch as soon as it is embedded
+        added = 0
+        try:
+            while True:
+                item = self._get(point_queue, abort)
+                if item is _END_OF_STREAM:
+                    break
+                points, position = item
+                for i in range(0, len(points), UPSERT_BATCH):
+                    self.client.upsert(
+                        collection_name=self.collection_name,
+                        points=points[i : i + UPSERT_BATCH]
+                    )
+                added += len(points)
+                if on_checkpoint:
+                    on_checkpoint(position, added)
+                if task_id:
+                    task_registry[task_id] = f"Embedded and stored {added} chunks ({stats['repeated'] + stats['existing']} duplicates skipped)..."
+        except _PipelineAborted:
+            pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # Unblock the other stages if we stopped early
+            abort.set()
+            for worker in workers:
+                worker.join()
+        
+        if errors:
+            raise errors[0]
+        
+        skipped = stats["repeated"] + stats["existing"]
+        logger.info(f"Ingestion summary: {added} new chunks, {skipped} duplicates skipped.")
+        return {"new": added, "skipped": skipped}
 
 storage = KnowledgeBaseStorage()
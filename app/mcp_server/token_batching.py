@@ -0,0 +1,77 @@
+import logging
+from typing import Callable, Iterable, Iterator, List, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def load_encoding(model: str):
+    """tiktoken encoding for `model` (cl100k_base if unknown), or None if tiktoken can't load."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # e.g. no network to fetch the BPE file; callers fall back to a char-based estimate
+        logger.warning(f"tiktoken unavailable, estimating tokens from length: {e}")
+        return None
+
+
+class TokenBatchPacker:
+    """
+    Packs embedding inputs into requests that are as full as possible
+    without exceeding a token budget or input count per request.
+
+    Inputs longer than `max_tokens_per_input` (the model's context limit)
+    are truncated so a single chunk can never make a request fail.
+    """
+
+    def __init__(self, model: str, max_tokens_per_request: int, max_inputs_per_request: int,
+                 max_tokens_per_input: int = 8191):
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_inputs_per_request = max_inputs_per_request
+        self.max_tokens_per_input = min(max_tokens_per_input, max_tokens_per_request)
+        self.encoding = load_encoding(model)
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def fit(self, text: str) -> Tuple[str, int]:
+        """Returns (text, token_count), truncating text to max_tokens_per_input if needed."""
+        if self.encoding is None:
+            tokens = self.count(text)
+            if tokens > self.max_tokens_per_input:
+                text = text[: self.max_tokens_per_input * 4]
+                tokens = self.max_tokens_per_input
+            return text, tokens
+
+        token_ids = self.encoding.encode(text, disallowed_special=())
+        if len(token_ids) > self.max_tokens_per_input:
+            logger.warning(f"Truncating embedding input from {len(token_ids)} to {self.max_tokens_per_input} tokens")
+            token_ids = token_ids[: self.max_tokens_per_input]
+            text = self.encoding.decode(token_ids)
+        return text, len(token_ids)
+
+    def pack(self, items: Iterable[T], tokens_of: Callable[[T], int]) -> Iterator[Tuple[List[T], int]]:
+        """
+        Groups items lazily into (batch, batch_token_count) respecting both
+        limits. `tokens_of` returns the (already fitted) token count of an item.
+        """
+        batch: List[T] = []
+        batch_tokens = 0
+        for item in items:
+            tokens = tokens_of(item)
+            if batch and (batch_tokens + tokens > self.max_tokens_per_request
+                          or len(batch) >= self.max_inputs_per_request):
+                yield batch, batch_tokens
+                batch = []
+                batch_tokens = 0
+            batch.append(item)
+            batch_tokens += tokens
+        if batch:
+            yield batch, batch_tokens
@@ -0,0 +1,61 @@
+"""
+HTML -> plain text (and links / sitemap URLs), run in the CPU process pool
+(BeautifulSoup parsing is CPU-bound).
+"""
+from typing import List, Tuple
+from urllib.parse import urljoin, urldefrag
+from bs4 import BeautifulSoup
+
+
+def _soup_to_text(soup: BeautifulSoup) -> str:
+    # Remove scripts and styles
+    for script in soup(["script", "style"]):
+        script.extract()
+        
+    text = soup.get_text()
+    
+    # Clean text (remove extra properties)
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+
+def html_to_text(html: str) -> str:
+    return _soup_to_text(BeautifulSoup(html, 'html.parser'))
+
+
+def html_to_text_and_links(html: str, base_url: str) -> Tuple[str, List[str]]:
+    """
+    Single parse for the crawler: returns the page text plus its absolute
+    http(s) links (fragments stripped, de-duplicated, in document order).
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # <base href> changes how relative links resolve
+    base = soup.find("base", href=True)
+    if base:
+        base_url = urljoin(base_url, base["href"])
+    
+    links = []
+    seen = set()
+    for anchor in soup.find_all("a", href=True):
+        if anchor.get("rel") and "nofollow" in anchor.get("rel"):
+            continue
+        link, _ = urldefrag(urljoin(base_url, anchor["href"].strip()))
+        if link.startswith(("http://", "https://")) and link not in seen:
+            seen.add(link)
+            links.append(link)
+    
+    return _soup_to_text(soup), links
+
+
+def parse_sitemap(xml: str) -> Tuple[List[str], List[str]]:
+    """
+    Returns (page_urls, nested_sitemap_urls) from a sitemap or sitemap index.
+    """
+    soup = BeautifulSoup(xml, 'html.parser')
+    locs = [loc.get_text(strip=True) for loc in soup.find_all("loc")]
+    locs = [loc for loc in locs if loc]
+    if soup.find("sitemapindex"):
+        return [], locs
+    return locs, []
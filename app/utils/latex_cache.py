@@ -0,0 +1,138 @@
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+from app.core.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_latex(latex_str: str) -> str:
+    """Canonical form used as cache key: no display delimiters, collapsed whitespace."""
+    clean = latex_str.strip()
+    for opening, closing in (("$$", "$$"), ("\\[", "\\]"), ("\\(", "\\)")):
+        if clean.startswith(opening) and clean.endswith(closing) and len(clean) >= len(opening) + len(closing):
+            clean = clean[len(opening):-len(closing)].strip()
+    return " ".join(clean.split())
+
+
+class LatexRenderCache:
+    """
+    Two-level cache for rendered equations, keyed by normalized LaTeX:
+      1. In-memory LRU of PNG bytes.
+      2. On-disk PNG files (<dir>/<sha256>.png), shared across restarts.
+    It also remembers the Telegram file_id returned after the first upload
+    (<dir>/<sha256>.fileid), so later sends reference it and upload nothing.
+    """
+
+    def __init__(self, directory: str, memory_max_bytes: int):
+        self.directory = directory
+        self._memory = LRUCache(max_bytes=memory_max_bytes)
+        self._file_ids: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.file_id_hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+        try:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_enabled = True
+        except OSError as e:
+            logger.warning(f"LaTeX disk cache disabled: {e}")
+            self._disk_enabled = False
+
+    @staticmethod
+    def key(latex_str: str) -> str:
+        return hashlib.sha256(normalize_latex(latex_str).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def _load_file_id(self, key: str) -> Optional[str]:
+        with self._lock:
+            file_id = self._file_ids.get(key)
+        if file_id is None and self._disk_enabled:
+            try:
+                with open(self._path(key, ".fileid"), "r", encoding="utf-8") as f:
+                    file_id = f.read().strip() or None
+            except OSError:
+                file_id = None
+            if file_id:
+                with self._lock:
+                    self._file_ids[key] = file_id
+        return file_id
+
+    def get_file_id(self, latex_str: str) -> Optional[str]:
+        file_id = self._load_file_id(self.key(latex_str))
+        if file_id:
+            self.file_id_hits += 1
+        return file_id
+
+    def has_file_id(self, latex_str: str) -> bool:
+        """Like get_file_id, but doesn't count as a hit (for pre-checks before sending)."""
+        return self._load_file_id(self.key(latex_str)) is not None
+
+    def set_file_id(self, latex_str: str, file_id: str):
+        key = self.key(latex_str)
+        with self._lock:
+            self._file_ids[key] = file_id
+        if self._disk_enabled:
+            try:
+                with open(self._path(key, ".fileid"), "w", encoding="utf-8") as f:
+                    f.write(file_id)
+            except OSError as e:
+                logger.warning(f"Failed to persist LaTeX file_id: {e}")
+
+    def forget_file_id(self, latex_str: str):
+        """Drops a file_id Telegram no longer accepts, so the PNG is uploaded again."""
+        key = self.key(latex_str)
+        with self._lock:
+            self._file_ids.pop(key, None)
+        if self._disk_enabled:
+            try:
+                os.remove(self._path(key, ".fileid"))
+            except OSError:
+                pass
+
+    def get_png(self, latex_str: str) -> Optional[bytes]:
+        key = self.key(latex_str)
+        png = self._memory.get(key)
+        if png is not None:
+            return png
+        if not self._disk_enabled:
+            return None
+        try:
+            with open(self._path(key, ".png"), "rb") as f:
+                png = f.read()
+        except OSError:
+            return None
+        self.disk_hits += 1
+        self._memory.set(key, png)
+        return png
+
+    def has_png(self, latex_str: str) -> bool:
+        """True if the PNG is cached in memory or on disk; doesn't count as a hit."""
+        key = self.key(latex_str)
+        return key in self._memory or (self._disk_enabled and os.path.exists(self._path(key, ".png")))
+
+    def put_png(self, latex_str: str, png: bytes):
+        key = self.key(latex_str)
+        self.renders += 1
+        self._memory.set(key, png)
+        if self._disk_enabled:
+            try:
+                # Write-then-rename so a concurrent reader never sees a partial file
+                tmp_path = self._path(key, f".png.{os.getpid()}.tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(png)
+                os.replace(tmp_path, self._path(key, ".png"))
+            except OSError as e:
+                logger.warning(f"Failed to persist rendered LaTeX: {e}")
+
+    def stats(self):
+        return {
+            "memory": self._memory.stats(),
+            "disk_hits": self.disk_hits,
+            "file_id_hits": self.file_id_hits,
+            "renders": self.renders,
+        }
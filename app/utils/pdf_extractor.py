@@ -0,0 +1,28 @@
+"""
+Worker-side PDF helpers.
+
+Kept free of app settings/clients on purpose: these functions run inside
+process-pool workers, which import this module from scratch.
+"""
+from typing import List, Tuple
+from pypdf import PdfReader
+
+
+def count_pages(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+
+def extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extracts pages [start, end) and returns (page_number, text) pairs,
+    with 1-based page numbers. A page that fails to parse yields empty text.
+    """
+    reader = PdfReader(file_path)
+    pages = []
+    for index in range(start, min(end, len(reader.pages))):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception:
+            text = ""
+        pages.append((index + 1, text))
+    return pages
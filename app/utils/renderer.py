@@ -1,51 +1,100 @@
 import os
+import io
+import asyncio
+import threading
+from typing import List, Union
 import matplotlib
 # Ensure writable config directory for Matplotlib in Cloud Run
 os.environ['MPLCONFIGDIR'] = '/tmp'
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import io
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.font_manager import FontProperties
+from matplotlib.mathtext import MathTextParser
 
-def render_latex_to_image(latex_str: str) -> io.BytesIO:
-    """
-    Renders a LaTeX string into an image buffer (PNG).
-    """
-    # Create figure with transparent background
-    # Lower DPI prevents "Giant Image" syndrome on mobile
-    fig = plt.figure(figsize=(0.1, 0.1), dpi=200)
-    fig.patch.set_facecolor('none')
-    fig.patch.set_alpha(0.0)
-
-    # Add text (equation)
-    # We use a black text by default, but for Telegram dark mode compat, 
-    # white or a box might be better. Let's try standard black first, 
-    # usually Telegram handles transparent PNGs well with adapted background or we can add a white background.
-    # Actually, a white background is safer for legibility on all themes.
-    
-    # Adding text (using raw string for latex)
-    # We wrap it in $...$ if not present, but usually agent sends block \[ ... \]
-    
+# Lower DPI prevents "Giant Image" syndrome on mobile
+DPI = 200
+FONT_SIZE = 14
+PAD_INCHES = 0.05
+
+# No pyplot: each thread owns its parser and a reusable Figure/Agg canvas,
+# so rendering is thread-safe and skips figure creation/teardown per equation.
+_local = threading.local()
+
+
+def _get_renderer():
+    if not hasattr(_local, "figure"):
+        figure = Figure(dpi=DPI)
+        FigureCanvasAgg(figure)
+        # A white background is safer for legibility on all Telegram themes
+        figure.patch.set_facecolor("white")
+        _local.figure = figure
+        _local.parser = MathTextParser("path")
+        _local.text = None
+    return _local
+
+
+def _wrap_latex(latex_str: str) -> str:
+    # We wrap it in $...$, but usually agent sends block \[ ... \] or $$ ... $$
     clean_latex = latex_str.strip()
-    
+
     # Remove standard block markers if they exist to start fresh
     if clean_latex.startswith("\\[") and clean_latex.endswith("\\]"):
         clean_latex = clean_latex[2:-2].strip()
     if clean_latex.startswith("$$") and clean_latex.endswith("$$"):
         clean_latex = clean_latex[2:-2].strip()
-        
-    wrapped_latex = f"${clean_latex}$"
 
-    # Render text
-    plt.text(0.5, 0.5, wrapped_latex, fontsize=14, ha='center', va='center')
-    plt.axis('off')
+    return f"${clean_latex}$"
+
+
+def render_latex_to_png(latex_str: str) -> bytes:
+    """
+    Renders a LaTeX string into PNG bytes using mathtext + Agg directly.
+    The figure is sized from the parsed math extents (like mathtext.math_to_image),
+    which avoids the second layout pass of bbox_inches='tight'.
+    """
+    renderer = _get_renderer()
+    figure = renderer.figure
+    wrapped_latex = _wrap_latex(latex_str)
+    prop = FontProperties(size=FONT_SIZE)
+
+    # Extents in points (1/72 inch); raises ValueError on invalid LaTeX
+    width, height, depth, _, _ = renderer.parser.parse(wrapped_latex, dpi=72, prop=prop)
+    pad = PAD_INCHES * 72
+    total_width = width + 2 * pad
+    total_height = height + 2 * pad
+
+    figure.set_size_inches(total_width / 72, total_height / 72)
+    if renderer.text is not None:
+        renderer.text.remove()
+    renderer.text = figure.text(
+        pad / total_width,
+        (pad + depth) / total_height,
+        wrapped_latex,
+        fontproperties=prop,
+        color="black"
+    )
 
-    # Save to buffer
     buf = io.BytesIO()
-    
-    # Use bbox_inches='tight' to crop effectively
-    # Reduced pad_inches to minimize whitespace
-    plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0.05, transparent=False, facecolor='white')
-    plt.close(fig)
-    buf.seek(0)
-    
-    return buf
+    figure.canvas.print_png(buf)
+    return buf.getvalue()
+
+
+def render_latex_to_image(latex_str: str) -> io.BytesIO:
+    """
+    Renders a LaTeX string into an image buffer (PNG).
+    """
+    return io.BytesIO(render_latex_to_png(latex_str))
+
+
+async def render_latex_batch(latex_list: List[str]) -> List[Union[bytes, Exception]]:
+    """
+    Renders every equation of one answer in parallel in the shared CPU process pool.
+    Results are aligned with latex_list; failed renders are returned as exceptions.
+    """
+    # Imported lazily: this module is also imported inside the worker processes
+    from app.core.executors import cpu_executor
+    return await asyncio.gather(
+        *(cpu_executor.run(render_latex_to_png, latex) for latex in latex_list),
+        return_exceptions=True
+    )
@@ -0,0 +1,15 @@
+"""
+Entry point for every task run by the shared executors.
+
+Lives outside app.core so process-pool workers, which unpickle it by
+module path, never import the app settings or clients just to run a
+settings-free function (see pdf_extractor, html_text, renderer).
+"""
+import time
+from typing import Callable
+
+
+def timed_call(func: Callable, args: tuple, kwargs: dict):
+    # Runs in the worker (thread or process): report when execution actually started
+    started_at = time.time()
+    return started_at, func(*args, **kwargs)
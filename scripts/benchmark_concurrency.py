@@ -0,0 +1,76 @@
+"""
+Concurrency benchmark for the RAG graph.
+
+Fires N questions at the same time through `agent_app.ainvoke` (async nodes) and,
+as a baseline, the same questions one after another (what a blocked event loop
+would do), then compares:
+  - wall time for the whole batch
+  - slowest single question
+  - sum of all individual latencies
+
+With async nodes the wall time should be close to the slowest question.
+Run sequentially, wall time ~= sum.
+
+Usage:
+    python scripts/benchmark_concurrency.py --n 8
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.agent.graph import agent_app
+
+QUESTIONS = [
+    "¿Qué es el Telegram Brain Agent?",
+    "Cual es el tamaño de electrón ?",
+    "Explica la ley de Gauss",
+    "¿Qué es el rotacional de un campo vectorial?",
+    "¿Qué dice la segunda ley de Newton?",
+    "Define energía cinética",
+    "¿Qué es la ecuación de Schrödinger?",
+    "¿Cómo se calcula el flujo eléctrico?",
+]
+
+
+async def timed_question(graph, question: str) -> float:
+    start = time.perf_counter()
+    await graph.ainvoke({"question": question, "messages": []})
+    return time.perf_counter() - start
+
+
+async def run_batch(label: str, graph, questions, sequential: bool = False):
+    start = time.perf_counter()
+    if sequential:
+        latencies = [await timed_question(graph, q) for q in questions]
+    else:
+        latencies = await asyncio.gather(*(timed_question(graph, q) for q in questions))
+    wall = time.perf_counter() - start
+
+    print(f"\n[{label}] {len(questions)} questions")
+    print(f"  wall time : {wall:6.2f}s")
+    print(f"  slowest   : {max(latencies):6.2f}s")
+    print(f"  sum       : {sum(latencies):6.2f}s")
+    print(f"  wall/slowest = {wall / max(latencies):.2f}x   wall/sum = {wall / sum(latencies):.2f}x")
+    return wall, latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="RAG graph concurrency benchmark")
+    parser.add_argument("--n", type=int, default=4, help="Number of simultaneous questions")
+    parser.add_argument("--skip-sequential", action="store_true", help="Skip the one-at-a-time baseline")
+    args = parser.parse_args()
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.n)]
+
+    await run_batch("async nodes", agent_app, questions)
+    if not args.skip_sequential:
+        await run_batch("sequential (baseline)", agent_app, questions, sequential=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Ingestion pipeline benchmark: peak RSS and chunks/second vs. document size.
+
+Each size runs in a fresh subprocess so peak RSS (ru_maxrss) is measured
+independently. Pages are generated lazily and fed to `storage.add_records`,
+so with the streaming pipeline peak memory should stay flat as size grows.
+
+By default it runs offline (random vectors, upserts discarded) to measure the
+pipeline itself; pass --live to hit the real OpenAI/Qdrant configuration.
+
+Usage:
+    python scripts/benchmark_ingestion.py --pages 50 200 1000
+"""
+import os
+import sys
+import time
+import random
+import resource
+import argparse
+import subprocess
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+PAGE_CHARS = 3000
+
+
+def synthetic_pages(n_pages: int, run_id: str):
+    """Yields (text, metadata) per page without materializing the whole document."""
+    rng = random.Random(n_pages)
+    words = ["campo", "eléctrico", "flujo", "energía", "integral", "vector", "carga", "potencial",
+             "momento", "masa", "velocidad", "aceleración", "onda", "frecuencia", "partícula"]
+    for page in range(1, n_pages + 1):
+        paragraphs = []
+        size = 0
+        while size < PAGE_CHARS:
+            sentence = " ".join(rng.choice(words) for _ in range(12)) + f" (página {page})."
+            paragraphs.append(sentence)
+            size += len(sentence)
+        yield "\n\n".join(paragraphs), {"source": f"benchmark-{run_id}.pdf", "type": "pdf", "page": page}
+
+
+class DiscardingClient:
+    """Stands in for Qdrant offline: nothing is stored, so RSS reflects the pipeline only."""
+
+    def retrieve(self, *args, **kwargs):
+        return []
+
+    def upsert(self, *args, **kwargs):
+        pass
+
+
+def run_worker(n_pages: int, live: bool):
+    from app.mcp_server.storage import storage
+
+    if not live:
+        storage.client = DiscardingClient()
+        storage.embedding_cache = None
+        storage._get_batch_embeddings = lambda texts, token_counts=None: [[random.random() for _ in range(1536)] for _ in texts]
+
+    start = time.perf_counter()
+    summary = storage.add_records(synthetic_pages(n_pages, run_id=str(time.time_ns())))
+    elapsed = time.perf_counter() - start
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    chunks = summary["new"] + summary["skipped"]
+    print(f"{n_pages:>6} pages | {n_pages * PAGE_CHARS / 1e6:6.2f} MB text | {chunks:>7} chunks | "
+          f"{chunks / elapsed:8.1f} chunks/s | peak RSS {peak_rss_mb:7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming ingestion benchmark")
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--live", action="store_true", help="Use the configured OpenAI + Qdrant instead of offline fakes")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.live)
+        return
+
+    for n_pages in args.pages:
+        cmd = [sys.executable, __file__, "--worker", str(n_pages)]
+        if args.live:
+            cmd.append("--live")
+        subprocess.run(cmd, check=True)
+
+
+if __name__ == "__main__":
+    main()
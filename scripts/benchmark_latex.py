@@ -0,0 +1,97 @@
+"""
+LaTeX rendering microbenchmark.
+
+Compares the legacy pyplot renderer (new figure + bbox_inches='tight' per
+equation) against the mathtext/Agg renderer in app/utils/renderer.py, both
+sequentially and as a parallel batch in worker processes.
+Reports equations/second and p95 render time.
+
+Usage:
+    python scripts/benchmark_latex.py --rounds 5 --workers 4
+"""
+import os
+import sys
+import io
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Add project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.utils.renderer import render_latex_to_png
+
+EQUATIONS = [
+    r"\int_0^1 x^2 \, dx = \frac{1}{3}",
+    r"\nabla \cdot \mathbf{E} = \frac{\rho}{\varepsilon_0}",
+    r"\nabla \times \mathbf{B} = \mu_0 \mathbf{J} + \mu_0 \varepsilon_0 \frac{\partial \mathbf{E}}{\partial t}",
+    r"E = mc^2",
+    r"\sum_{n=1}^{\infty} \frac{1}{n^2} = \frac{\pi^2}{6}",
+    r"i \hbar \frac{\partial}{\partial t} \Psi = \hat{H} \Psi",
+    r"F = G \frac{m_1 m_2}{r^2}",
+    r"\oint_S \mathbf{E} \cdot d\mathbf{A} = \frac{Q}{\varepsilon_0}",
+]
+
+
+def legacy_render(latex_str: str) -> bytes:
+    """The previous pyplot-based implementation, kept here as the baseline."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(0.1, 0.1), dpi=200)
+    fig.patch.set_facecolor('none')
+    fig.patch.set_alpha(0.0)
+    plt.text(0.5, 0.5, f"${latex_str}$", fontsize=14, ha='center', va='center')
+    plt.axis('off')
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', bbox_inches='tight', pad_inches=0.05, transparent=False, facecolor='white')
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def timed(func, latex_str: str) -> float:
+    start = time.perf_counter()
+    func(latex_str)
+    return time.perf_counter() - start
+
+
+def p95(values):
+    ordered = sorted(values)
+    return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+def report(label: str, wall: float, latencies):
+    print(f"{label:<32} {len(latencies) / wall:8.1f} eq/s   p95 {1000 * p95(latencies):7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LaTeX rendering microbenchmark")
+    parser.add_argument("--rounds", type=int, default=5, help="Times each equation is rendered")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    workload = EQUATIONS * args.rounds
+
+    # Warm up font caches so the first measurement isn't dominated by them
+    legacy_render(EQUATIONS[0])
+    render_latex_to_png(EQUATIONS[0])
+
+    for label, func in (("legacy pyplot (sequential)", legacy_render),
+                        ("mathtext/Agg (sequential)", render_latex_to_png)):
+        start = time.perf_counter()
+        latencies = [timed(func, latex) for latex in workload]
+        report(label, time.perf_counter() - start, latencies)
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx) as pool:
+        # Warm the workers (imports + font cache)
+        list(pool.map(render_latex_to_png, EQUATIONS[: args.workers]))
+        start = time.perf_counter()
+        latencies = list(pool.map(timed, [render_latex_to_png] * len(workload), workload))
+        report(f"mathtext/Agg (batch, {args.workers} procs)", time.perf_counter() - start, latencies)
+
+
+if __name__ == "__main__":
+    main()
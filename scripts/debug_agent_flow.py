@@ -1,6 +1,7 @@
 
 import os
 import sys
+import asyncio
 import logging
 
 # Add project root to sys.path
@@ -24,17 +25,14 @@ state = AgentState(
 )
 
 
-# Redirect stdout to file
-with open("debug_output.txt", "w", encoding="utf-8") as f:
-    sys.stdout = f
-    
+async def run_flow():
     print(f"--- STARTING DEBUG FLOW FOR: {state['question']} ---")
 
     # 1. Reformulation
     print("\n[1] REFORMULATION")
     try:
-        res = nodes.query_reformulation(state)
-        state["reformulated_query"] = res["reformulated_query"]
+        res = await nodes.aquery_reformulation(state)
+        state.update(res)
         print(f"Reformulated Query: {state['reformulated_query']}")
     except Exception as e:
         print(f"Reformulation Failed: {e}")
@@ -42,8 +40,8 @@ with open("debug_output.txt", "w", encoding="utf-8") as f:
     # 2. Retrieval
     print("\n[2] RETRIEVAL")
     try:
-        res = nodes.retrieve(state)
-        state["context"] = res["context"]
+        res = await nodes.aretrieve(state)
+        state.update(res)
         print(f"Retrieved {len(state['context'])} docs.")
         for i, doc in enumerate(state["context"]):
             print(f"  [Doc {i}] --------------------------------------------------")
@@ -65,6 +63,11 @@ with open("debug_output.txt", "w", encoding="utf-8") as f:
         print("\n[RESULT] Fallback would be triggered.")
     else:
         print("\n[RESULT] Generator would be called.")
-        
-    sys.stdout = sys.__stdout__
 
+
+# Redirect stdout to file
+with open("debug_output.txt", "w", encoding="utf-8") as f:
+    sys.stdout = f
+    # One event loop for all steps (the async Qdrant client is bound to it)
+    asyncio.run(run_flow())
+    sys.stdout = sys.__stdout__
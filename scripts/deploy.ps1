@@ -38,6 +38,22 @@ foreach ($key in $RelevantKeys) {
     }
 }
 
+# Ingestion jobs must survive restarts: keep the job store on a Filestore (NFS) share
+$VolumeFlags = @()
+$FilestoreIp = [Environment]::GetEnvironmentVariable("FILESTORE_IP", "Process")
+$FilestoreShare = [Environment]::GetEnvironmentVariable("FILESTORE_SHARE", "Process")
+if (-not [string]::IsNullOrEmpty($FilestoreIp) -and -not [string]::IsNullOrEmpty($FilestoreShare)) {
+    $VolumeFlags = @(
+        "--execution-environment", "gen2",
+        "--add-volume", "name=state,type=nfs,location=${FilestoreIp}:/${FilestoreShare}",
+        "--add-volume-mount", "volume=state,mount-path=/mnt/state"
+    )
+    $EnvVarsList += "JOB_STORE_PATH=/mnt/state/jobs.sqlite3"
+    $EnvVarsList += "JOB_STORE_REQUIRE_PERSISTENT=true"
+} else {
+    Write-Warning "FILESTORE_IP/FILESTORE_SHARE not set: ingestion jobs will NOT be resumed after a restart."
+}
+
 $EnvVarsString = $EnvVarsList -join ","
 
 # Initial Deploy (without Webhook URL)
@@ -50,6 +66,7 @@ gcloud run deploy $SERVICE_NAME `
     --no-cpu-throttling `
     --memory 2Gi `
     --cpu 2 `
+    @VolumeFlags `
     --set-env-vars $EnvVarsString
 
 if ($LASTEXITCODE -ne 0) {
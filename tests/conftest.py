@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+
+# Settings need these at import time; tests never talk to the real services
+_tmp = tempfile.mkdtemp(prefix="telegram-brain-tests-")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("STATE_BACKEND", "memory")
+os.environ.setdefault("JOB_STORE_PATH", os.path.join(_tmp, "jobs.sqlite3"))
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(_tmp, "embeddings.sqlite3"))
+os.environ.setdefault("HTTP_CACHE_PATH", os.path.join(_tmp, "http_validators.sqlite3"))
+os.environ.setdefault("LATEX_CACHE_DIR", os.path.join(_tmp, "latex"))
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,49 @@
+from app.agent.answer_cache import SemanticAnswerCache
+from app.core.state_backend import InMemoryStateBackend
+
+EMBEDDING = [0.1, 0.2, 0.3]
+CONTEXT_IDS = ["chunk-a", "chunk-b"]
+
+
+def make_cache():
+    return SemanticAnswerCache(threshold=0.95, max_entries=10, ttl_seconds=None, backend=InMemoryStateBackend())
+
+
+def test_same_question_context_and_history_hits():
+    cache = make_cache()
+    history = SemanticAnswerCache.history_key("Human: Qué es la ley de Gauss?\n")
+    cache.store(EMBEDDING, CONTEXT_IDS, history, "respuesta")
+    assert cache.lookup(EMBEDDING, CONTEXT_IDS, history) == "respuesta"
+
+
+def test_different_history_misses():
+    cache = make_cache()
+    cache.store(EMBEDDING, CONTEXT_IDS, SemanticAnswerCache.history_key("Human: Hablemos de Gauss\n"), "sobre Gauss")
+    other_chat = SemanticAnswerCache.history_key("Human: Hablemos de Ampère\n")
+    assert cache.lookup(EMBEDDING, CONTEXT_IDS, other_chat) is None
+    # A history mismatch is not staleness: the entry stays for its own conversation
+    assert cache.stats()["entries"] == 1
+
+
+def test_summary_change_misses():
+    cache = make_cache()
+    before = SemanticAnswerCache.history_key("Summary of the earlier conversation: Gauss\nHuman: y eso?\n")
+    after = SemanticAnswerCache.history_key("Summary of the earlier conversation: Ampère\nHuman: y eso?\n")
+    cache.store(EMBEDDING, CONTEXT_IDS, before, "respuesta")
+    assert cache.lookup(EMBEDDING, CONTEXT_IDS, after) is None
+
+
+def test_matching_history_is_preferred_over_a_closer_vector():
+    cache = make_cache()
+    mine = SemanticAnswerCache.history_key("")
+    cache.store([0.1, 0.2, 0.31], CONTEXT_IDS, mine, "mine")
+    cache.store(EMBEDDING, CONTEXT_IDS, SemanticAnswerCache.history_key("Human: otro chat\n"), "other")
+    assert cache.lookup(EMBEDDING, CONTEXT_IDS, mine) == "mine"
+
+
+def test_changed_context_is_stale():
+    cache = make_cache()
+    history = SemanticAnswerCache.history_key("")
+    cache.store(EMBEDDING, CONTEXT_IDS, history, "respuesta")
+    assert cache.lookup(EMBEDDING, ["chunk-c"], history) is None
+    assert cache.stats()["stale"] == 1
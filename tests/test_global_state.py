@@ -0,0 +1,66 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from app.core.global_state import ChatHistoryStore
+from app.core.state_backend import InMemoryStateBackend, SqliteStateBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryStateBackend()
+    return SqliteStateBackend(str(tmp_path / "state.sqlite3"))
+
+
+def turn(store, chat_id, question, answer):
+    store.append(chat_id, HumanMessage(content=question), AIMessage(content=answer))
+
+
+def test_appends_from_two_stores_on_one_backend_are_both_kept(backend, tmp_path):
+    first = ChatHistoryStore(backend)
+    if isinstance(backend, SqliteStateBackend):
+        # Another worker process: its own connection to the same file
+        second = ChatHistoryStore(SqliteStateBackend(backend.path))
+    else:
+        second = ChatHistoryStore(backend)
+    turn(first, 1, "q1", "a1")
+    turn(second, 1, "q2", "a2")
+    assert [m.content for m in first.get(1)] == ["q1", "a1", "q2", "a2"]
+
+
+def test_append_keeps_last_max_messages(backend):
+    store = ChatHistoryStore(backend, max_messages=4)
+    for i in range(3):
+        turn(store, 1, f"q{i}", f"a{i}")
+    assert [m.content for m in store.get(1)] == ["q1", "a1", "q2", "a2"]
+
+
+def test_fold_keeps_turns_appended_after_the_read(backend):
+    store = ChatHistoryStore(backend)
+    turn(store, 1, "q1", "a1")
+    turn(store, 1, "q2", "a2")
+    folded = store.get(1)[:2]
+    # A new turn lands while the summary is being generated
+    turn(store, 1, "q3", "a3")
+    assert store.fold(1, folded, "resumen")
+    assert [m.content for m in store.get(1)] == ["q2", "a2", "q3", "a3"]
+    assert store.get_summary(1) == "resumen"
+
+
+def test_second_fold_of_the_same_messages_is_rejected(backend):
+    store = ChatHistoryStore(backend)
+    turn(store, 1, "q1", "a1")
+    turn(store, 1, "q2", "a2")
+    folded = store.get(1)[:2]
+    assert store.fold(1, folded, "resumen")
+    assert not store.fold(1, folded, "otro resumen")
+    assert store.get_summary(1) == "resumen"
+    assert [m.content for m in store.get(1)] == ["q2", "a2"]
+
+
+def test_clear_removes_history_and_summary(backend):
+    store = ChatHistoryStore(backend)
+    turn(store, 1, "q1", "a1")
+    store.fold(1, store.get(1), "resumen")
+    store.clear(1)
+    assert store.get(1) == []
+    assert store.get_summary(1) is None
@@ -0,0 +1,29 @@
+import asyncio
+import pytest
+from app.agent import ingestion_nodes
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "upload.pdf"
+    path.write_bytes(b"%PDF-1.4 test")
+    return path
+
+
+def test_temp_pdf_is_removed_when_no_text_is_extracted(pdf, monkeypatch):
+    monkeypatch.setattr(ingestion_nodes.media_processor, "count_pdf_pages", lambda file_path: 2)
+    monkeypatch.setattr(ingestion_nodes.storage, "add_records", lambda *args: {"new": 0, "skipped": 0})
+    result = asyncio.run(ingestion_nodes.ingest_pdf({"file_path": str(pdf), "source_name": "vacio.pdf"}))
+    assert result["final_answer"].startswith("Error")
+    assert not pdf.exists()
+
+
+def test_temp_pdf_is_removed_when_ingestion_fails(pdf, monkeypatch):
+    def failing_add_records(*args):
+        raise RuntimeError("Qdrant unavailable")
+
+    monkeypatch.setattr(ingestion_nodes.media_processor, "count_pdf_pages", lambda file_path: 2)
+    monkeypatch.setattr(ingestion_nodes.storage, "add_records", failing_add_records)
+    with pytest.raises(RuntimeError):
+        asyncio.run(ingestion_nodes.ingest_pdf({"file_path": str(pdf), "source_name": "libro.pdf"}))
+    assert not pdf.exists()
@@ -0,0 +1,91 @@
+import time
+import asyncio
+from types import SimpleNamespace
+from app.core.job_store import IngestionJobStore
+from app.interface import bot as bot_module
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+def interrupted_job(path):
+    # Worker A starts a PDF job, stores a few batches and dies
+    store = IngestionJobStore(path)
+    job_id = store.create(42, "pdf", "libro.pdf", file_id="file-1", message_id=7)
+    store.mark_running(job_id)
+    store.checkpoint(job_id, (2, 5), 12)
+    return job_id
+
+
+def test_stale_job_is_claimed_exactly_once(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.sqlite3")
+    job_id = interrupted_job(path)
+    # Two surviving workers, each with its own connection
+    worker_b, worker_c = IngestionJobStore(path), IngestionJobStore(path)
+    assert worker_b.claim_stale(60, owner="worker-b") == []
+
+    later = time.time() + 120
+    monkeypatch.setattr(time, "time", lambda: later)
+    claimed = worker_b.claim_stale(60, owner="worker-b")
+    assert [job["id"] for job in claimed] == [job_id]
+    assert worker_c.claim_stale(60, owner="worker-c") == []
+    assert worker_c.get(job_id)["owner"] == "worker-b"
+    assert IngestionJobStore.checkpoint_from(claimed[0]) == (2, 5)
+
+
+def test_resume_requeues_the_job_from_its_checkpoint(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.sqlite3")
+    job_id = interrupted_job(path)
+    store = IngestionJobStore(path)
+    queued = []
+    monkeypatch.setattr(bot_module, "job_store", store)
+    monkeypatch.setattr(bot_module, "queue_document_job", lambda *args: queued.append(args))
+    later = time.time() + bot_module.settings.JOB_STALE_SECONDS + 60
+    monkeypatch.setattr(time, "time", lambda: later)
+
+    fake_bot = FakeBot()
+    asyncio.run(bot_module.resume_interrupted_jobs(fake_bot))
+    assert len(queued) == 1
+    _, chat_id, file_id, source, message_id, queued_job_id = queued[0]
+    assert (chat_id, file_id, source, queued_job_id) == (42, "file-1", "libro.pdf", job_id)
+    # The re-run picks up after the last stored chunk
+    assert store.checkpoint_of(job_id) == (2, 5)
+    assert store.get(job_id)["chunks_stored"] == 12
+
+    # A second pass (or another worker) finds nothing left to resume
+    asyncio.run(bot_module.resume_interrupted_jobs(fake_bot))
+    assert len(queued) == 1
+
+
+def test_resumed_ingestion_starts_after_the_checkpoint(tmp_path, monkeypatch):
+    from app.agent import ingestion_nodes
+
+    path = str(tmp_path / "jobs.sqlite3")
+    job_id = interrupted_job(path)
+    store = IngestionJobStore(path)
+    calls = []
+
+    def fake_add_records(records, task_id, resume_from, on_checkpoint):
+        calls.append(resume_from)
+        on_checkpoint((3, 1), 4)
+        return {"new": 4, "skipped": 0}
+
+    pdf = tmp_path / "resumed.pdf"
+    pdf.write_bytes(b"%PDF-1.4 test")
+    monkeypatch.setattr(ingestion_nodes, "job_store", store)
+    monkeypatch.setattr(ingestion_nodes.storage, "add_records", fake_add_records)
+    monkeypatch.setattr(ingestion_nodes.media_processor, "count_pdf_pages", lambda file_path: 3)
+
+    result = asyncio.run(ingestion_nodes.ingest_pdf({
+        "file_path": str(pdf), "source_name": "libro.pdf", "job_id": job_id,
+    }))
+    assert calls == [(2, 5)]
+    # Chunks stored by the first run are still counted
+    assert store.get(job_id)["chunks_stored"] == 16
+    assert "16" in result["final_answer"]
@@ -0,0 +1,34 @@
+from langchain_core.messages import AIMessageChunk, message_chunk_to_message
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk
+from app.core.llm_cache import SqliteLLMCache
+
+LLM_STRING = "{'model_name': 'deepseek-chat', 'temperature': 0}"
+
+
+def streamed_generation():
+    # What a streamed run is cached as (see generate_from_stream): the chunks
+    # merged, with usage sent on the last one
+    chunks = [
+        ChatGenerationChunk(message=AIMessageChunk(content="La ley ")),
+        ChatGenerationChunk(message=AIMessageChunk(content="de Gauss.", usage_metadata={
+            "input_tokens": 120, "output_tokens": 30, "total_tokens": 150,
+        })),
+    ]
+    merged = chunks[0] + chunks[1]
+    return ChatGeneration(message=message_chunk_to_message(merged.message))
+
+
+def test_hit_counts_saved_tokens_of_a_streamed_answer(tmp_path):
+    cache = SqliteLLMCache(str(tmp_path / "llm.sqlite3"))
+    cache.update("prompt", LLM_STRING, [streamed_generation()])
+    cached = cache.lookup("prompt", LLM_STRING)
+    assert cached[0].message.content == "La ley de Gauss."
+    assert cache.stats()["saved_tokens"] == 150
+    assert cache.stats()["saved_calls"] == 1
+
+
+def test_different_params_miss(tmp_path):
+    cache = SqliteLLMCache(str(tmp_path / "llm.sqlite3"))
+    cache.update("prompt", LLM_STRING, [streamed_generation()])
+    assert cache.lookup("prompt", LLM_STRING.replace("0}", "0.7}")) is None
+    assert cache.stats()["misses"] == 1
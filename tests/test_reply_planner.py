@@ -0,0 +1,59 @@
+import re
+from app.interface.reply_planner import (
+    AlbumStep, TextStep, TELEGRAM_CAPTION_LIMIT, TELEGRAM_MESSAGE_LIMIT, equation_caption, plan_reply,
+)
+
+
+def text(raw):
+    return ("text", raw, raw)
+
+
+def equation(content):
+    return ("math_complex", content, f"$${content}$$")
+
+
+def test_text_and_simple_math_are_merged_into_one_message():
+    steps = plan_reply([text("La energía es "), ("math_simple", "E < mc^2", "$E < mc^2$"), text(" en reposo.")])
+    assert len(steps) == 1
+    assert steps[0].html_text == "La energía es <i>E &lt; mc^2</i> en reposo."
+
+
+def test_long_text_is_split_at_the_message_limit():
+    paragraph = "La ley de Gauss relaciona el flujo eléctrico con la carga encerrada. " * 20
+    answer = "\n\n".join([paragraph.strip()] * 10)
+    steps = plan_reply([text(answer)])
+    assert len(steps) > 1
+    assert all(isinstance(step, TextStep) for step in steps)
+    assert all(len(step.html_text) <= TELEGRAM_MESSAGE_LIMIT for step in steps)
+    # Cuts happen between paragraphs, and nothing is lost
+    assert all(step.html_text.endswith("encerrada.") for step in steps)
+    assert "".join("".join(step.html_text for step in steps).split()) == "".join(answer.split())
+
+
+def test_cuts_never_split_an_html_entity():
+    steps = plan_reply([text("&<>" * 2000)], limit=100)
+    assert len(steps) > 1
+    for step in steps:
+        assert len(step.html_text) <= 100
+        assert re.fullmatch(r"(&amp;|&lt;|&gt;)+", step.html_text)
+
+
+def test_equation_runs_become_albums_of_at_most_ten():
+    steps = plan_reply([equation(f"x_{i}") for i in range(23)])
+    assert [type(step) for step in steps] == [AlbumStep] * 3
+    assert [len(step.equations) for step in steps] == [10, 10, 3]
+    assert steps[2].equations[-1] == ("x_22", "$$x_22$$")
+
+
+def test_text_between_equations_keeps_answer_order():
+    steps = plan_reply([equation("a"), equation("b"), text("Entonces:"), equation("c")])
+    assert [type(step) for step in steps] == [AlbumStep, TextStep, AlbumStep]
+    assert [content for content, _ in steps[0].equations] == ["a", "b"]
+    assert steps[1].html_text == "Entonces:"
+
+
+def test_captions_are_capped():
+    assert equation_caption("E = mc^2") == "E = mc^2"
+    caption = equation_caption("x" * 3000)
+    assert len(caption) == TELEGRAM_CAPTION_LIMIT
+    assert caption.endswith("…")
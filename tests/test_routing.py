@@ -0,0 +1,45 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from app.agent.graph import needs_reformulation
+
+HISTORY = [HumanMessage(content="¿Qué es la ley de Gauss?"), AIMessage(content="Relaciona el flujo eléctrico con la carga encerrada.")]
+
+
+@pytest.mark.parametrize("question", [
+    "Explain the theory that describes gravity in detail please",
+    "Define entropy",
+    "Explica la ley de Ampère",
+    "¿Qué es la entropía?",
+    "What is entropy and why does it increase?",
+    "This theorem about black holes, who proved the area law?",
+    "Calcula el flujo también para una esfera de radio R",
+    "Entonces, ¿qué es un campo conservativo?",
+    "Explain the same principle for magnetic fields",
+    "Derive Gauss's law again from Coulomb's law",
+    "More examples of conservative fields",
+    "¿Cuál es la regla de la mano derecha?",
+])
+def test_standalone_questions_skip_reformulation(question):
+    assert not needs_reformulation({"question": question, "messages": HISTORY})
+
+
+@pytest.mark.parametrize("question", [
+    "¿Y la segunda?",
+    "What about magnetic fields?",
+    "Why is that?",
+    "How does it work?",
+    "¿Eso es cierto?",
+    "¿Qué significa eso?",
+    "Explícalo con un ejemplo",
+    "Lo que dijiste antes sobre la carga, ¿por qué?",
+    "Can you give an example of this?",
+    "¿Por qué?",
+    "Give me an example",
+    "Dame otro ejemplo",
+])
+def test_follow_ups_are_reformulated(question):
+    assert needs_reformulation({"question": question, "messages": HISTORY})
+
+
+def test_no_history_never_reformulates():
+    assert not needs_reformulation({"question": "¿Y la segunda?", "messages": []})
@@ -0,0 +1,98 @@
+import asyncio
+from app.core.scheduler import JobClass, JobScheduler
+
+
+class Jobs:
+    """Jobs that record when they start and run until released."""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.started = []
+        self._gates = {}
+
+    def spawn(self, name, chat_id, job_class=JobClass.INGESTION, on_position=None):
+        gate = self._gates[name] = asyncio.Event()
+
+        async def job():
+            self.started.append(name)
+            await gate.wait()
+
+        return self.scheduler.spawn(chat_id, job_class, job, on_position=on_position)
+
+    async def finish(self, name):
+        self._gates[name].set()
+        await settle()
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_no_ingestion_starts_while_a_question_waits():
+    async def scenario():
+        jobs = Jobs(JobScheduler(max_interactive=1, max_ingestions=1, max_ingestions_per_chat=1))
+        jobs.spawn("pdf-a", chat_id=1)
+        jobs.spawn("pdf-b", chat_id=2)
+        jobs.spawn("q1", chat_id=3, job_class=JobClass.INTERACTIVE)
+        jobs.spawn("q2", chat_id=4, job_class=JobClass.INTERACTIVE)
+        await settle()
+        assert jobs.started == ["pdf-a", "q1"]
+        # The ingestion slot frees up, but q2 is still queued
+        await jobs.finish("pdf-a")
+        assert jobs.started == ["pdf-a", "q1"]
+        await jobs.finish("q1")
+        assert jobs.started == ["pdf-a", "q1", "q2", "pdf-b"]
+
+    asyncio.run(scenario())
+
+
+def test_per_chat_ingestion_limit_leaves_room_for_other_chats():
+    async def scenario():
+        scheduler = JobScheduler(max_interactive=1, max_ingestions=3, max_ingestions_per_chat=1)
+        jobs = Jobs(scheduler)
+        jobs.spawn("a1", chat_id=1)
+        jobs.spawn("a2", chat_id=1)
+        jobs.spawn("b1", chat_id=2)
+        await settle()
+        assert jobs.started == ["a1", "b1"]
+        assert scheduler.stats()["ingestion"] == {"running": 2, "queued": 1, "limit": 3}
+        await jobs.finish("a1")
+        assert jobs.started == ["a1", "b1", "a2"]
+
+    asyncio.run(scenario())
+
+
+def test_chats_take_turns():
+    async def scenario():
+        jobs = Jobs(JobScheduler(max_interactive=1, max_ingestions=1, max_ingestions_per_chat=1))
+        jobs.spawn("gate", chat_id=0)
+        for name, chat_id in [("a1", 1), ("a2", 1), ("a3", 1), ("b1", 2), ("c1", 3)]:
+            jobs.spawn(name, chat_id=chat_id)
+        await settle()
+        for name in ["gate", "a1", "b1", "c1", "a2"]:
+            await jobs.finish(name)
+        assert jobs.started == ["gate", "a1", "b1", "c1", "a2", "a3"]
+
+    asyncio.run(scenario())
+
+
+def test_queue_positions_are_reported_as_they_change():
+    async def scenario():
+        jobs = Jobs(JobScheduler(max_interactive=1, max_ingestions=1, max_ingestions_per_chat=1))
+        positions = {"a2": [], "b1": []}
+
+        async def report(name, position):
+            positions[name].append(position)
+
+        jobs.spawn("a1", chat_id=1)
+        jobs.spawn("a2", chat_id=1, on_position=lambda position: report("a2", position))
+        jobs.spawn("b1", chat_id=2, on_position=lambda position: report("b1", position))
+        await settle()
+        # b1 was queued last but chat 2 goes before chat 1's second job
+        assert positions == {"a2": [1, 2], "b1": [1]}
+        await jobs.finish("a1")
+        assert jobs.started == ["a1", "b1"]
+        assert positions == {"a2": [1, 2, 1], "b1": [1]}
+
+    asyncio.run(scenario())
@@ -0,0 +1,125 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from app.mcp_server import storage as storage_module
+from app.mcp_server.storage import KnowledgeBaseStorage
+from app.mcp_server.embedding_executor import EmbeddingExecutor, RateLimiter
+from app.mcp_server.token_batching import TokenBatchPacker
+
+
+class FakeEmbeddingsAPI:
+    """Stands in for openai.OpenAI: embeddings.with_raw_response.create(...)."""
+
+    def __init__(self, fail_on_call=None):
+        self.fail_on_call = fail_on_call
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.embeddings = SimpleNamespace(with_raw_response=self)
+
+    def with_options(self, **kwargs):
+        return self
+
+    def create(self, input, model):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if call == self.fail_on_call:
+            raise ValueError("embedding request rejected")
+        response = SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(text))]) for text in input])
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+
+class FakeQdrant:
+    def __init__(self, existing=()):
+        self.existing = set(existing)
+        self.upserted = []
+
+    def retrieve(self, collection_name, ids, with_payload, with_vectors):
+        return [SimpleNamespace(id=point_id) for point_id in ids if point_id in self.existing]
+
+    def upsert(self, collection_name, points):
+        self.upserted.extend(str(point.id) for point in points)
+
+
+def make_storage(api=None, client=None, inputs_per_request=2):
+    # Bypass __init__: no Qdrant/OpenAI connections, tiny batches so there are many checkpoints
+    kb = KnowledgeBaseStorage.__new__(KnowledgeBaseStorage)
+    kb.client = client or FakeQdrant()
+    kb.collection_name = "test"
+    kb.embedding_model = "text-embedding-3-small"
+    kb.embedding_cache = None
+    kb.embedding_executor = EmbeddingExecutor(
+        client=api or FakeEmbeddingsAPI(), model=kb.embedding_model,
+        max_concurrency=3, limiter=RateLimiter(10**6, 10**9), max_retries=0
+    )
+    kb.batch_packer = TokenBatchPacker(kb.embedding_model, max_tokens_per_request=100_000,
+                                       max_inputs_per_request=inputs_per_request)
+    return kb
+
+
+def records():
+    # Three "pages", each long enough for several chunks
+    return [
+        (" ".join(f"Página {page}, frase {i} sobre electromagnetismo." for i in range(120)), {"source": "libro.pdf", "page": page})
+        for page in range(1, 4)
+    ]
+
+
+def expected_ids(kb):
+    return [item[0] for item in kb._iter_chunks(records(), {"repeated": 0})]
+
+
+def test_points_are_upserted_in_chunk_order():
+    kb = make_storage()
+    summary = kb.add_records(records())
+    assert kb.client.upserted == expected_ids(kb)
+    assert summary == {"new": len(kb.client.upserted), "skipped": 0}
+
+
+def test_existing_points_are_skipped():
+    kb = make_storage()
+    ids = expected_ids(kb)
+    kb.client = FakeQdrant(existing=ids[:3])
+    summary = kb.add_records(records())
+    assert kb.client.upserted == ids[3:]
+    assert summary == {"new": len(ids) - 3, "skipped": 3}
+
+
+def test_a_failed_stage_aborts_the_ingestion():
+    kb = make_storage(api=FakeEmbeddingsAPI(fail_on_call=3))
+    with pytest.raises(ValueError, match="rejected"):
+        kb.add_records(records())
+    # Nothing after the failed batch was stored, and every stage thread has exited
+    assert len(kb.client.upserted) <= 2 * 2
+    assert not [t for t in threading.enumerate() if t.name.startswith("ingest-")]
+
+
+def test_resume_skips_exactly_the_checkpointed_chunks():
+    kb = make_storage()
+    checkpoints = []
+    kb.add_records(records(), on_checkpoint=lambda position, added: checkpoints.append((position, added)))
+    full = kb.client.upserted
+    # Interrupted after the 4th stored batch: resume from its checkpoint
+    position, added = checkpoints[3]
+    resumed = make_storage()
+    resumed.add_records(records(), resume_from=position)
+    assert resumed.client.upserted == full[added:]
+
+
+def test_chunks_overlap_across_split_windows(monkeypatch):
+    monkeypatch.setattr(storage_module, "SPLIT_WINDOW_CHARS", 3000)
+    text = " ".join(f"frase{i}" for i in range(1500))
+    windows = list(KnowledgeBaseStorage._iter_windows(text, overlap=storage_module.CHUNK_OVERLAP))
+    assert len(windows) > 2
+    for previous, window in zip(windows, windows[1:]):
+        # Each window starts with (roughly) the last CHUNK_OVERLAP chars of the previous one
+        head = window[:100]
+        assert head in previous[-storage_module.CHUNK_OVERLAP:]
+    assert windows[0].startswith("frase0 ")
+    assert windows[-1].endswith("frase1499")
+
+
+def test_windows_without_overlap_partition_the_text(monkeypatch):
+    monkeypatch.setattr(storage_module, "SPLIT_WINDOW_CHARS", 3000)
+    text = "\n".join(f"línea {i}" for i in range(1000))
+    assert "".join(KnowledgeBaseStorage._iter_windows(text)) == text
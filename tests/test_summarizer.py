@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+from app.agent import summarizer
+from app.agent.summarizer import HistorySummarizer
+from app.core.global_state import ChatHistoryStore
+from app.core.state_backend import InMemoryStateBackend
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    calls = []
+
+    def fake_llm(prompt):
+        calls.append(prompt)
+        return AIMessage(content="Resumen: ley de Gauss.")
+
+    monkeypatch.setattr(summarizer, "llm", RunnableLambda(fake_llm))
+    return calls
+
+
+def make(max_history_tokens=800):
+    store = ChatHistoryStore(InMemoryStateBackend())
+    return store, HistorySummarizer(store=store, keep_messages=2, max_history_tokens=max_history_tokens)
+
+
+def turn(store, question, answer):
+    store.append(1, HumanMessage(content=question), AIMessage(content=answer))
+
+
+def test_no_llm_call_below_threshold(llm_calls):
+    store, history_summarizer = make()
+    turn(store, "¿Qué es la ley de Gauss?", "Relaciona flujo y carga.")
+    turn(store, "¿Y la de Ampère?", "Relaciona circulación y corriente.")
+    asyncio.run(history_summarizer.summarize(1))
+    assert llm_calls == []
+    assert len(store.get(1)) == 4
+    assert store.get_summary(1) is None
+
+
+def test_folds_when_history_exceeds_token_budget(llm_calls):
+    store, history_summarizer = make(max_history_tokens=50)
+    turn(store, "¿Qué es la ley de Gauss?", "$$\\oint E \\cdot dA = Q/\\epsilon_0$$ " * 40)
+    turn(store, "¿Y la de Ampère?", "Relaciona circulación y corriente.")
+    asyncio.run(history_summarizer.summarize(1))
+    assert len(llm_calls) == 1
+    assert [m.content for m in store.get(1)] == ["¿Y la de Ampère?", "Relaciona circulación y corriente."]
+    assert store.get_summary(1) == "Resumen: ley de Gauss."
+
+
+def test_folds_before_the_store_cap_drops_messages(llm_calls):
+    store, history_summarizer = make()
+    for i in range(store.max_messages // 2):
+        turn(store, f"pregunta {i}", f"respuesta {i}")
+    asyncio.run(history_summarizer.summarize(1))
+    assert len(llm_calls) == 1
+    assert len(store.get(1)) == 2
+
+
+def test_two_workers_fold_the_same_history_once(llm_calls):
+    store, first = make()
+    # A second worker: its own summarizer (and locks) on the same shared store
+    second = HistorySummarizer(store=store, keep_messages=2)
+    for i in range(store.max_messages // 2):
+        turn(store, f"pregunta {i}", f"respuesta {i}")
+
+    async def both():
+        await asyncio.gather(first.summarize(1), second.summarize(1))
+
+    asyncio.run(both())
+    assert first.folds + second.folds == 1
+    assert [m.content for m in store.get(1)] == ["pregunta 4", "respuesta 4"]
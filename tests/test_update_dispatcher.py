@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+from app.core.state_backend import InMemoryStateBackend
+from app.interface.update_dispatcher import UpdateDispatcher
+
+
+class FakeApplication:
+    """Mimics PTB: handler exceptions are passed to the error handlers, never raised."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.error_handlers = []
+        self.processed = []
+
+    def add_error_handler(self, callback):
+        self.error_handlers.append(callback)
+
+    async def process_update(self, update):
+        self.processed.append(update.update_id)
+        if update.update_id in self.fail:
+            for callback in self.error_handlers:
+                await callback(update, SimpleNamespace(error=RuntimeError("boom")))
+
+
+def make_update(update_id, chat_id=1):
+    return SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat_id))
+
+
+async def run(dispatcher, updates):
+    dispatcher.start()
+    results = [await dispatcher.submit(update) for update in updates]
+    await dispatcher.stop(timeout=1)
+    return results
+
+
+def test_duplicates_are_dropped_and_order_is_kept():
+    application = FakeApplication()
+    dispatcher = UpdateDispatcher(application, workers=2, backend=InMemoryStateBackend())
+    results = asyncio.run(run(dispatcher, [make_update(1), make_update(2), make_update(1), make_update(3)]))
+    assert results == [True, True, False, True]
+    assert application.processed == [1, 2, 3]
+    assert dispatcher.stats()["duplicates"] == 1
+
+
+def test_handler_errors_are_counted():
+    application = FakeApplication(fail={2})
+    dispatcher = UpdateDispatcher(application, workers=1, backend=InMemoryStateBackend())
+    asyncio.run(run(dispatcher, [make_update(1), make_update(2)]))
+    assert dispatcher.stats()["failed"] == 1